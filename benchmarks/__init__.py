@@ -0,0 +1,37 @@
+"""
+Benchmark suite of the Gumnut simulator
+
+``benchmarks.micro`` measures single hot paths (decoding, executing every
+opcode, stepping, setup, reset and line lookups), ``benchmarks.macro`` runs
+the programs in ``benchmarks/programs`` to completion. All results are
+rates, higher is better. ``benchmarks.results`` stores them and compares
+them against a baseline.
+
+Usage: python -m benchmarks --help
+"""
+
+import timeit
+
+
+DEFAULT_MIN_TIME = 0.1
+DEFAULT_REPEAT = 3
+
+
+def measure(function, operations=1, min_time=DEFAULT_MIN_TIME, repeat=DEFAULT_REPEAT):
+    """
+    Return the operations per second of ``function``
+
+    ``function`` is called as often as needed to take at least
+    ``min_time`` seconds, the best of ``repeat`` such rounds is reported.
+
+    :param operations: Operations performed by a single call
+    """
+    timer = timeit.Timer(function)
+    number = 1
+    elapsed = timer.timeit(number)
+    while elapsed < min_time / 10:
+        number *= 10
+        elapsed = timer.timeit(number)
+    number = max(1, int(number * min_time / elapsed))
+    best = min(timer.repeat(repeat, number))
+    return operations * number / best
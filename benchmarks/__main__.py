@@ -0,0 +1,56 @@
+"""
+Run the benchmark suite and compare it against a baseline
+
+Usage: python -m benchmarks [--suite {micro,macro,all}] [--filter TEXT] [-o results.json]
+                            [--baseline baseline.json] [--threshold 0.1]
+
+Exits with 1 if any benchmark is slower than the baseline by more than the
+threshold.
+"""
+
+import argparse
+import sys
+
+from benchmarks import DEFAULT_MIN_TIME, macro, micro, results
+
+
+SUITES = {"micro": (micro,), "macro": (macro,), "all": (micro, macro)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Gumnut Simulator benchmarks")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="all", help="benchmarks to run")
+    parser.add_argument("--filter", default=None, help="only report benchmarks whose name contains this text")
+    parser.add_argument("--min-time", type=float, default=DEFAULT_MIN_TIME, help="seconds per measurement round")
+    parser.add_argument("-o", "--output", default=None, help="save the results to this file")
+    parser.add_argument("--baseline", default=None, help="compare against the results saved in this file")
+    parser.add_argument("--threshold", type=float, default=results.DEFAULT_THRESHOLD, help="allowed relative slowdown")
+    args = parser.parse_args(argv)
+
+    measured = dict()
+    for suite in SUITES[args.suite]:
+        measured.update(suite.run(args.min_time))
+    if args.filter:
+        measured = {name: value for name, value in measured.items() if args.filter in name}
+    if args.output:
+        results.save(measured, args.output)
+
+    if args.baseline is None:
+        print("%-32s %16s" % ("benchmark", "ops/s"))
+        for name in sorted(measured):
+            print("%-32s %16.0f" % (name, measured[name]))
+        return 0
+
+    rows, regressions = results.compare(measured, results.load(args.baseline), args.threshold)
+    print("%-32s %16s %16s %8s" % ("benchmark", "ops/s", "baseline", "change"))
+    for name, value, baseline, change in rows:
+        marker = " <-- regression" if name in regressions else ""
+        print("%-32s %16.0f %16.0f %+7.1f%%%s" % (name, value, baseline, change * 100, marker))
+    if regressions:
+        print("%d of %d benchmarks regressed by more than %.0f%%" % (len(regressions), len(rows), args.threshold * 100))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Macrobenchmarks running realistic programs to completion
+
+The programs in ``benchmarks/programs`` are set up and run until they
+halt, interpreted, with translated blocks and interpreted with loop
+detection, which shows the overhead of detecting loops. The results are
+the simulated instructions per second, setting up the program is not
+timed.
+"""
+
+import os
+import time
+
+from benchmarks import DEFAULT_MIN_TIME, DEFAULT_REPEAT
+from gumnut_simulator.core import StopReason
+from gumnut_simulator.simulator import GumnutSimulator
+
+
+PROGRAMS = os.path.join(os.path.dirname(__file__), "programs")
+
+MAX_STEPS = 10000000
+
+# Interrupts raised per run of interrupt_io.asm
+INTERRUPTS = 1000
+
+# Steps between two timer interrupts of timer.asm
+TIMER_PERIOD = 500
+
+
+def run_to_stby(simulator):
+    result = simulator.run(MAX_STEPS)
+    if result.reason != StopReason.stby:
+        raise RuntimeError("Program stopped with %s" % result.reason.name)
+    return result.steps
+
+
+def run_interrupts(simulator):
+    """Raise an interrupt with a new input value whenever the program waits for one"""
+    steps = simulator.run(MAX_STEPS).steps
+    for i in range(INTERRUPTS):
+        simulator.CPU.IO_controller_register[0] = i & 0xFF
+        simulator.trigger_interrupt()
+        result = simulator.run(MAX_STEPS)
+        if result.reason != StopReason.wait:
+            raise RuntimeError("Program stopped with %s" % result.reason.name)
+        steps += result.steps
+    return steps
+
+
+def run_timer(simulator):
+    """Raise a scheduled interrupt every ``TIMER_PERIOD`` steps until the program stops"""
+    simulator.schedule_interrupt(TIMER_PERIOD, period=TIMER_PERIOD)
+    return run_to_stby(simulator)
+
+
+# Program file name and the function running it, which returns the number of steps
+BENCHMARKS = (
+    ("bubble_sort.asm", run_to_stby),
+    ("multiply.asm", run_to_stby),
+    ("interrupt_io.asm", run_interrupts),
+    ("timer.asm", run_timer),
+)
+
+
+def load(name):
+    with open(os.path.join(PROGRAMS, name), "r", encoding="utf-8") as fp:
+        return fp.read()
+
+
+# Name of the mode, translate and detect loops
+MODES = (
+    ("interpreted", False, False),
+    ("translated", True, False),
+    ("loop_detection", False, True),
+)
+
+
+def measure_program(
+    source, driver, translate=False, min_time=DEFAULT_MIN_TIME, repeat=DEFAULT_REPEAT, detect_loops=False
+):
+    """Return the best instructions per second of ``repeat`` rounds of at least ``min_time`` seconds"""
+    simulator = GumnutSimulator()
+    if translate:
+        simulator.CPU.enable_translation()
+    if detect_loops:
+        simulator.enable_loop_detection()
+    best = 0
+    for _ in range(repeat):
+        steps = 0
+        elapsed = 0
+        while elapsed < min_time:
+            simulator.setup(source)
+            start = time.perf_counter()
+            steps += driver(simulator)
+            elapsed += time.perf_counter() - start
+        best = max(best, steps / elapsed)
+    return best
+
+
+def run(min_time=DEFAULT_MIN_TIME):
+    """Run all macrobenchmarks and return their results by name"""
+    results = dict()
+    for name, driver in BENCHMARKS:
+        source = load(name)
+        program = os.path.splitext(name)[0]
+        for mode, translate, detect_loops in MODES:
+            results["%s.%s" % (program, mode)] = measure_program(
+                source, driver, translate, min_time, detect_loops=detect_loops
+            )
+    return results
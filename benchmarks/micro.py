@@ -0,0 +1,80 @@
+"""
+Microbenchmarks of the hot paths of the core and the simulator
+
+Every benchmark returns the operations per second of a single path:
+decoding an instruction (bitfield extraction and table lookup), executing
+every opcode with ``GumnutCore.execute``, a single ``GumnutCore.step``,
+``GumnutCore.reset``, ``GumnutSimulator.setup`` with and without the
+assembly cache and ``GumnutSimulator.get_current_line``.
+"""
+
+import os
+
+from benchmarks import DEFAULT_MIN_TIME, measure
+from gumnut_simulator.core import GumnutCore
+from gumnut_simulator.decoder import INSTR, OPCODES, GumnutDecoder
+from gumnut_simulator.simulator import GumnutSimulator
+
+
+PROGRAM = os.path.join(os.path.dirname(__file__), "programs", "bubble_sort.asm")
+
+# One object code of every instruction group
+OBJECTCODES = (0x38A5B, 0x08301, 0x31A01, 0x20410, 0x3E402, 0x3C010, 0x3F400)
+
+
+def bench_decode(min_time):
+    results = dict()
+    for name, decoder in (("bitfields", GumnutDecoder()), ("table", GumnutDecoder(use_table=True, eager=True))):
+
+        def decode(decoder=decoder):
+            for objectcode in OBJECTCODES:
+                decoder.decode_instruction(objectcode)
+
+        results["decode.%s" % name] = measure(decode, len(OBJECTCODES), min_time)
+    return results
+
+
+def bench_execute(min_time):
+    """Execute every opcode with rd = r1, op1 = r2 and op2 = 3 (or r3)"""
+    results = dict()
+    core = GumnutCore()
+    for instruction, access in OPCODES:
+        decoded = INSTR(instruction, 0, 1, 2, 3, access)
+        name = instruction if access is None else "%s.%s" % (instruction, access)
+        results["execute.%s" % name] = measure(lambda: core.execute(decoded), 1, min_time)
+    return results
+
+
+def bench_core(min_time):
+    core = GumnutCore()
+    # add r1, r1, 1 / jmp 0
+    core.upload_instruction_memory([0x00901, 0x3C000])
+    return {
+        "core.step": measure(core.step, 1, min_time),
+        "core.reset": measure(core.reset, 1, min_time),
+    }
+
+
+def bench_simulator(min_time):
+    with open(PROGRAM, "r", encoding="utf-8") as fp:
+        source = fp.read()
+    simulator = GumnutSimulator()
+    simulator.setup(source)
+    uncached = GumnutSimulator()
+    uncached.use_assembly_cache = False
+    return {
+        "simulator.setup": measure(lambda: simulator.setup(source), 1, min_time),
+        "simulator.setup.uncached": measure(lambda: uncached.setup(source), 1, min_time),
+        "simulator.get_current_line": measure(simulator.get_current_line, 1, min_time),
+    }
+
+
+BENCHMARKS = (bench_decode, bench_execute, bench_core, bench_simulator)
+
+
+def run(min_time=DEFAULT_MIN_TIME):
+    """Run all microbenchmarks and return their results by name"""
+    results = dict()
+    for benchmark in BENCHMARKS:
+        results.update(benchmark(min_time))
+    return results
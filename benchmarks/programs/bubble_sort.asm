@@ -0,0 +1,51 @@
+; Bubble sort of 32 distinct bytes in data memory, ascending
+
+        data
+array:  byte 83
+        byte 243
+        byte 39
+        byte 102
+        byte 167
+        byte 13
+        byte 19
+        byte 211
+        byte 138
+        byte 25
+        byte 94
+        byte 150
+        byte 15
+        byte 233
+        byte 130
+        byte 55
+        byte 10
+        byte 23
+        byte 112
+        byte 108
+        byte 18
+        byte 62
+        byte 24
+        byte 142
+        byte 109
+        byte 16
+        byte 212
+        byte 145
+        byte 32
+        byte 58
+        byte 162
+        byte 161
+
+        text
+start:  add r1, r0, 31            ; number of comparisons in this pass
+outer:  add r2, r0, 0             ; index of the current pair
+inner:  ldm r3, (r2)+0
+        ldm r4, (r2)+1
+        sub r0, r4, r3            ; carry if the pair is out of order
+        bnc next
+        stm r4, (r2)+0
+        stm r3, (r2)+1
+next:   add r2, r2, 1
+        sub r0, r2, r1
+        bnz inner
+        sub r1, r1, 1
+        bnz outer
+        stby
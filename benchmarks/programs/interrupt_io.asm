@@ -0,0 +1,16 @@
+; Interrupt driven input: every interrupt reads IO register 0, adds it to
+; the 16 bit sum in IO registers 2 (high byte) and 1 (low byte) and counts
+; the interrupts in IO register 3. The main loop waits for interrupts.
+
+        jmp start
+isr:    inp r1, (r0)+0
+        add r2, r2, r1
+        addc r3, r3, 0
+        out r2, (r0)+1
+        out r3, (r0)+2
+        add r4, r4, 1
+        out r4, (r0)+3
+        reti
+start:  enai
+loop:   wait
+        jmp loop
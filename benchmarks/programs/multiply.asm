@@ -0,0 +1,25 @@
+; Sum of the squares of 1 to 100 modulo 65536, multiplying by repeated addition.
+; The 16 bit sum is stored to data memory 0 (low byte) and 1 (high byte).
+
+start:  add r5, r0, 0             ; r6:r5 sum
+        add r6, r0, 0
+        add r7, r0, 100           ; r7 counter
+loop:   add r1, r7, 0
+        add r2, r7, 0
+        jsb mul
+        add r5, r5, r3
+        addc r6, r6, r4
+        sub r7, r7, 1
+        bnz loop
+        stm r5, (r0)+0
+        stm r6, (r0)+1
+        stby
+
+; r4:r3 = r1 * r2, clobbers r2
+mul:    add r3, r0, 0
+        add r4, r0, 0
+mulloop: add r3, r3, r1
+        addc r4, r4, 0
+        sub r2, r2, 1
+        bnz mulloop
+        ret
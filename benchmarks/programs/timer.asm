@@ -0,0 +1,17 @@
+; Timer driven: a periodic interrupt counts down the ticks left in r4 and
+; copies the input of IO register 0 to data memory, the main loop counts
+; in r5 and r6 until 100 ticks have passed and stops for good.
+
+        jmp start
+isr:    sub r4, r4, 1
+        inp r1, (r0)+0
+        stm r1, (r4)+0
+        reti
+start:  add r4, r0, 100
+        enai
+loop:   add r5, r5, 1
+        addc r6, r6, 0
+        add r0, r4, 0
+        bnz loop
+        disi
+        stby
@@ -0,0 +1,60 @@
+"""
+Storing benchmark results and comparing them against a baseline
+"""
+
+import datetime
+import json
+import platform
+
+from gumnut_simulator import __version__
+
+
+FORMAT_VERSION = 1
+
+DEFAULT_THRESHOLD = 0.1
+
+
+def save(results, path):
+    """Write ``results`` (rates by benchmark name) together with a description of the environment to ``path``"""
+    document = {
+        "format_version": FORMAT_VERSION,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "gumnut_simulator": __version__,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as fp:
+        json.dump(document, fp, indent=4, sort_keys=True)
+
+
+def load(path):
+    """Return the results stored by ``save()``"""
+    with open(path, "r", encoding="utf-8") as fp:
+        document = json.load(fp)
+    if document.get("format_version") != FORMAT_VERSION:
+        raise ValueError("Unsupported benchmark results format in %s" % path)
+    return document["results"]
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare ``results`` against ``baseline``
+
+    :param threshold: Relative slowdown which still counts as unchanged,
+                      e.g. 0.1 for 10 percent
+    :return: List of ``(name, value, baseline_value, change)`` of all
+             benchmarks present in both, with ``change`` as the relative
+             difference, and the list of names of the regressed benchmarks
+    """
+    rows = list()
+    regressions = list()
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        change = results[name] / baseline[name] - 1
+        rows.append((name, results[name], baseline[name], change))
+        if change < -threshold:
+            regressions.append(name)
+    return rows, regressions
@@ -0,0 +1,59 @@
+"""
+Size and round-trip time of the binary session format compared to to_JSON
+
+Sets up a program, runs it for a while and then measures the size of the
+output and the time to write and read it back with both formats. The JSON
+output can't be loaded into a simulator again, so its round trip is
+``to_JSON()`` followed by ``json.loads()``.
+
+Usage: python benchmarks/session_format.py [repetitions]
+"""
+import json
+import sys
+import time
+
+from gumnut_simulator import session
+from gumnut_simulator.simulator import GumnutSimulator
+
+
+SOURCE = """
+        jmp start
+isr:    reti
+start:  add r1, r0, 200
+loop:   jsb store
+        out r1, (r1)
+        sub r1, r1, 1
+        bnz loop
+        stby
+store:  stm r1, (r1)
+        ret
+"""
+
+
+def measure(function, repetitions):
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        function()
+    return (time.perf_counter() - start) / repetitions
+
+
+def main():
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    simulator = GumnutSimulator()
+    simulator.setup(SOURCE)
+    simulator.run(500)
+    target = GumnutSimulator()
+
+    json_size = len(simulator.to_JSON().encode("utf-8"))
+    session_size = len(session.dumps(simulator))
+    json_time = measure(lambda: json.loads(simulator.to_JSON()), repetitions)
+    session_time = measure(lambda: session.loads(session.dumps(simulator), target), repetitions)
+
+    print("%10s %12s %16s" % ("format", "size [B]", "round trip [ms]"))
+    print("%10s %12d %16.3f" % ("JSON", json_size, json_time * 1000))
+    print("%10s %12d %16.3f" % ("session", session_size, session_time * 1000))
+    print("%.0fx smaller, %.0fx faster" % (json_size / session_size, json_time / session_time))
+
+
+if __name__ == "__main__":
+    main()
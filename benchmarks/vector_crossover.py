@@ -0,0 +1,77 @@
+"""
+Throughput of GumnutVectorCore compared to one GumnutCore per instance
+
+Runs the same program with random IO inputs on an increasing number of
+instances and prints the instructions per second of both engines, to find
+the number of instances at which the vector engine starts to pay off.
+
+Usage: python benchmarks/vector_crossover.py [max_steps]
+"""
+import sys
+import time
+
+import numpy as np
+
+from gumnut_simulator.core import GumnutCore
+from gumnut_simulator.vector import GumnutVectorCore
+
+
+# Sum of IO registers 0-7, see test/vector_test.py
+PROGRAM = [
+    0x00800,
+    0x01000,
+    0x29900,
+    0x39260,
+    0x3E806,
+    0x00901,
+    0x08108,
+    0x3E4FA,
+    0x25000,
+    0x2D0FF,
+    0x3F500,
+    0x22001,
+    0x02401,
+    0x26001,
+    0x3C005,
+]
+
+
+def run_scalar(io, max_steps):
+    steps = 0
+    for inputs in io:
+        core = GumnutCore()
+        core.upload_instruction_memory(list(PROGRAM))
+        core.IO_controller_register[:] = inputs.tolist()
+        steps += core.run(max_steps).steps
+    return steps
+
+
+def run_vector(io, max_steps):
+    engine = GumnutVectorCore(len(io), PROGRAM)
+    engine.IO_controller_register[:] = io
+    return int(engine.run(max_steps).steps.sum())
+
+
+def measure(function, io, max_steps):
+    start = time.perf_counter()
+    steps = function(io, max_steps)
+    return steps / (time.perf_counter() - start)
+
+
+def main():
+    max_steps = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rng = np.random.default_rng(0)
+    print("%10s %16s %16s %8s" % ("instances", "scalar [ips]", "vector [ips]", "speedup"))
+    crossover = None
+    for instances in (1, 4, 16, 64, 256, 1024, 4096):
+        io = rng.integers(0, 256, (instances, 256), dtype=np.uint8)
+        scalar = measure(run_scalar, io, max_steps)
+        vector = measure(run_vector, io, max_steps)
+        if crossover is None and vector > scalar:
+            crossover = instances
+        print("%10d %16.0f %16.0f %8.2f" % (instances, scalar, vector, vector / scalar))
+    print("Crossover at %s instances" % crossover)
+
+
+if __name__ == "__main__":
+    main()
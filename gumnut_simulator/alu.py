@@ -0,0 +1,99 @@
+# Precomputed results of the arithmetic and shift instructions
+#
+# ``ARITHMETIC_RESULT`` holds the result byte of ``add``, ``addc``, ``sub``
+# and ``subc`` for every pair of operands and carry in, ``ARITHMETIC_FLAGS``
+# how the instruction changes the flags. Both are indexed by
+# ``arithmetic_index()``. The flags are updated exactly like
+# ``GumnutCore.check_range`` does, which leaves one of them unchanged unless
+# the result is in range and not zero:
+#
+# * ``CARRY_SET``: Result out of range, CARRY set, ZERO unchanged
+# * ``ZERO_SET``: Result zero, ZERO set, CARRY unchanged
+# * ``FLAGS_CLEARED``: Any other result, CARRY and ZERO cleared
+#
+# ``SHIFT_RESULT`` holds the results of ``shl``, ``shr``, ``rol`` and
+# ``ror`` for the counts 0 to 7, indexed by ``shift_index()``. Shifts don't
+# change the flags.
+#
+# The tables are ``bytes`` objects, so the scalar core indexes them directly
+# and vectorised engines can wrap them with ``numpy.frombuffer()`` without
+# copying.
+
+
+# Flag updates of the arithmetic instructions
+FLAGS_CLEARED = 0
+CARRY_SET = 1
+ZERO_SET = 2
+
+# Offsets of the operations and of the carry in within the arithmetic tables
+ADD = 0x00000
+SUB = 0x20000
+CARRY_IN = 0x10000
+
+# Operations within the shift table, in the order of their function codes
+SHL, SHR, ROL, ROR = range(4)
+
+
+def arithmetic_index(operation, a, b, carry=0):
+    """Return the index of ``a + b + carry`` (``ADD``) or ``a - b - carry`` (``SUB``) in the arithmetic tables"""
+    return operation | carry << 16 | a << 8 | b
+
+
+def shift_index(operation, a, count):
+    """Return the index of shifting or rotating ``a`` by ``count`` (0 to 7) in ``SHIFT_RESULT``"""
+    return operation << 11 | count << 8 | a
+
+
+def _build_arithmetic_tables():
+    """
+    Build the rows of 256 results for every first operand by slicing
+
+    ``a + b + carry`` counts up from ``a + carry`` and ``a - b - carry``
+    down from ``a - carry``, wrapping around, so every row is a slice of
+    an ascending or descending sequence of bytes. The flags of a row
+    change at most twice, where the result wraps around or hits zero.
+    """
+    ascending = bytes(range(256)) * 3
+    descending = bytes(range(255, -1, -1)) * 2
+    results = list()
+    flags = list()
+    for carry in (0, 1):
+        for a in range(256):
+            start = a + carry
+            results.append(ascending[start : start + 256])
+            # Results of second operands from 256 - start on exceed 0xFF
+            row = bytes([FLAGS_CLEARED]) * (256 - start) + bytes([CARRY_SET]) * start
+            if start == 0:
+                row = bytes([ZERO_SET]) + row[1:]
+            flags.append(row)
+    for carry in (0, 1):
+        for a in range(256):
+            results.append(descending[255 - a + carry : 511 - a + carry])
+            # Results are positive for second operands below a - carry, zero at it and negative above
+            zero_at = a - carry
+            if zero_at < 0:
+                flags.append(bytes([CARRY_SET]) * 256)
+            else:
+                flags.append(
+                    bytes([FLAGS_CLEARED]) * zero_at + bytes([ZERO_SET]) + bytes([CARRY_SET]) * (255 - zero_at)
+                )
+    return b"".join(results), b"".join(flags)
+
+
+def _build_shift_table():
+    results = bytearray()
+    for operation in (SHL, SHR, ROL, ROR):
+        for count in range(8):
+            if operation == SHL:
+                results += bytes((a << count) & 0xFF for a in range(256))
+            elif operation == SHR:
+                results += bytes(a >> count for a in range(256))
+            elif operation == ROL:
+                results += bytes(((a << count) | (a >> (8 - count))) & 0xFF for a in range(256))
+            else:
+                results += bytes(((a >> count) | (a << (8 - count))) & 0xFF for a in range(256))
+    return bytes(results)
+
+
+ARITHMETIC_RESULT, ARITHMETIC_FLAGS = _build_arithmetic_tables()
+SHIFT_RESULT = _build_shift_table()
@@ -0,0 +1,185 @@
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from gumnut_simulator.core import StopReason
+from gumnut_simulator.simulator import GumnutSimulator, SimulatorState
+
+
+DEFAULT_MAX_STEPS = 1000000
+DEFAULT_CHUNK_SIZE = 8
+
+# Steps run between two checks of the job timeout
+TIMEOUT_CHECK_STEPS = 10000
+
+# Simulator reused by all jobs of a worker process, see _init_worker()
+_worker_simulator = None
+
+
+def collect_sources(paths):
+    """
+    Return the list of assembler source files to run
+
+    Each path may either be a directory (all ``.asm`` files in it, sorted by
+    name), an ``.asm`` file or a manifest file listing one source file per
+    line. Paths in a manifest are relative to the manifest itself, empty
+    lines and lines starting with ``#`` are ignored.
+    """
+    sources = list()
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(name for name in os.listdir(path) if name.endswith(".asm"))
+            sources.extend(os.path.join(path, name) for name in names)
+        elif path.endswith(".asm"):
+            sources.append(path)
+        else:
+            base = os.path.dirname(path)
+            with open(path, "r", encoding="utf-8") as manifest:
+                for line in manifest:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        sources.append(os.path.join(base, line))
+    return sources
+
+
+def _init_worker():
+    """Create the simulator of a worker process once, so the assembler is only imported and set up once"""
+    global _worker_simulator
+    _worker_simulator = GumnutSimulator()
+
+
+def _describe_exception(exception):
+    if hasattr(exception, "as_dict"):
+        return exception.as_dict()
+    return {"type": type(exception).__name__, "expression": "", "message": str(exception)}
+
+
+def run_job(path, max_steps=DEFAULT_MAX_STEPS, timeout=None, simulator=None, detect_loops=False):
+    """
+    Assemble and run a single source file
+
+    The program runs until it halts (STBY, or WAIT with interrupts
+    disabled), raises an exception, exceeds ``max_steps`` or ``timeout``
+    seconds. The timeout is cooperative and checked every
+    ``TIMEOUT_CHECK_STEPS`` steps. With ``detect_loops`` programs stuck in
+    a provable infinite loop end early with the status ``loop``.
+
+    :return: A JSON serializable dict with the final state and timing
+    """
+    if simulator is None:
+        simulator = _worker_simulator or GumnutSimulator()
+    if detect_loops:
+        simulator.enable_loop_detection()
+    record = {"file": path}
+    start = time.perf_counter()
+    try:
+        with open(path, "r", encoding="utf-8") as source:
+            loaded = simulator.setup(source.read())
+    except Exception as e:  # pylint: disable=broad-except
+        record.update({"status": "error", "exception": _describe_exception(e)})
+        return record
+    record["assemble_time"] = time.perf_counter() - start
+    if not loaded:
+        record.update({"status": "assembly_error", "exception": _describe_exception(simulator.exception)})
+        return record
+
+    status = "budget"
+    start = time.perf_counter()
+    deadline = None if timeout is None else start + timeout
+    try:
+        while simulator.steps < max_steps:
+            result = simulator.run(min(TIMEOUT_CHECK_STEPS, max_steps - simulator.steps))
+            if result.reason == StopReason.exception:
+                status = "exception"
+                break
+            if result.reason != StopReason.budget:
+                status = result.reason.name
+                break
+            if deadline is not None and time.perf_counter() > deadline:
+                status = "timeout"
+                break
+        if status == "exception" and simulator.state == SimulatorState.halt:
+            status = "halt"
+    except Exception as e:  # pylint: disable=broad-except
+        status = "exception"
+        simulator.exception = e
+    record["run_time"] = time.perf_counter() - start
+
+    record.update(
+        {
+            "status": status,
+            "steps": simulator.steps,
+            "register": simulator.get_register(),
+            "flags": simulator.get_flags(),
+            "data_memory": list(simulator.get_data_memory()),
+            "IO_controller_register": list(simulator.get_IO_controller_register()),
+        }
+    )
+    if simulator.exception is not None:
+        record["exception"] = _describe_exception(simulator.exception)
+    return record
+
+
+def _run_chunk(paths, max_steps, timeout, detect_loops=False):
+    return [run_job(path, max_steps, timeout, detect_loops=detect_loops) for path in paths]
+
+
+def run_batch(
+    sources,
+    max_steps=DEFAULT_MAX_STEPS,
+    timeout=None,
+    workers=None,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    detect_loops=False,
+):
+    """
+    Run all ``sources`` on a pool of worker processes
+
+    Sources are submitted in chunks of ``chunk_size`` files and at most two
+    chunks per worker are in flight at any time, so arbitrary numbers of
+    files can be processed without queuing them all up front. Worker
+    processes are reused for all chunks.
+
+    :return: Generator yielding the records of ``run_job()`` in order of completion
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = (sources[i : i + chunk_size] for i in range(0, len(sources), chunk_size))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        pending = set()
+        for chunk in chunks:
+            pending.add(executor.submit(_run_chunk, chunk, max_steps, timeout, detect_loops))
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+        for future in pending:
+            yield from future.result()
+
+
+def main(args):
+    """Entry point of ``gumnut-simulator batch``, writes one JSON line per source file"""
+    sources = collect_sources(args.paths)
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        records = run_batch(sources, args.max_steps, args.timeout, args.workers, args.chunk_size, args.detect_loops)
+        for record in records:
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+
+def add_arguments(parser):
+    parser.add_argument("paths", nargs="+", help="directories, .asm files or manifests listing .asm files")
+    parser.add_argument("--max-steps", type=int, default=DEFAULT_MAX_STEPS, help="step budget per program")
+    parser.add_argument("--timeout", type=float, default=None, help="timeout per program in seconds")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="programs per submitted task")
+    parser.add_argument(
+        "--detect-loops", action="store_true", help="end programs stuck in a provable infinite loop early"
+    )
+    parser.add_argument("-o", "--output", default=None, help="write JSON lines to this file instead of stdout")
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import pickle
+import tempfile
+from collections import OrderedDict, namedtuple
+
+from gumnut_assembler import __version__ as ASSEMBLER_VERSION
+from gumnut_assembler.assembler import GumnutAssembler
+
+
+AssembledProgram = namedtuple(
+    "AssembledProgram", "instruction_memory data_memory source_objectcode_map ASMLineCount InstrCount"
+)
+CacheStats = namedtuple("CacheStats", "hits disk_hits misses entries")
+
+DEFAULT_MAXSIZE = 256
+
+
+def assemble(source):
+    """
+    Assemble ``source`` without any caching
+
+    :return: ``AssembledProgram`` with the memory images as tuples,
+             without trailing empty words
+    :raises: The exceptions of the assembler for invalid sources
+    """
+    assembler = GumnutAssembler()
+    assembler.load_asm_source(source)
+    assembler.assemble()
+    return AssembledProgram(
+        _strip(assembler.get_instruction_memory()),
+        _strip(assembler.get_data_memory()),
+        assembler.source_objectcode_map,
+        assembler.ASMLineCount,
+        assembler.InstrCount,
+    )
+
+
+def _strip(memory):
+    """Return the memory image without trailing empty words, uploading it clears them anyway"""
+    end = len(memory)
+    while end and not memory[end - 1]:
+        end -= 1
+    return tuple(memory[:end])
+
+
+class AssemblyCache:
+    """
+    Cache of assembled programs keyed on the hash of their source
+
+    Programs are kept in memory up to ``maxsize`` entries, the least
+    recently used one is dropped first. With a ``directory`` programs are
+    also written there as pickle files and read back by later processes.
+    Only use directories no one else can write to, loading a pickle can
+    execute arbitrary code.
+
+    Cached programs are shared by all users of the cache and must not be
+    modified. Sources which fail to assemble are not cached.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, directory=None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(source):
+        """Return the key of ``source``, which includes the assembler version"""
+        return hashlib.sha256(("%s\0%s" % (ASSEMBLER_VERSION, source)).encode("utf-8")).hexdigest()
+
+    def get(self, source):
+        """Return the ``AssembledProgram`` of ``source``, assembling it only if it isn't cached yet"""
+        key = self.key(source)
+        program = self.entries.get(key)
+        if program is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return program
+
+        program = self._read(key)
+        if program is not None:
+            self.disk_hits += 1
+        else:
+            program = assemble(source)
+            self.misses += 1
+            self._write(key, program)
+
+        self.entries[key] = program
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return program
+
+    def stats(self):
+        return CacheStats(self.hits, self.disk_hits, self.misses, len(self.entries))
+
+    def clear(self):
+        """Drop all programs kept in memory and reset the statistics, files on disk are kept"""
+        self.entries.clear()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pickle")
+
+    def _read(self, key):
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(key), "rb") as fp:
+                return AssembledProgram(*pickle.load(fp))
+        except Exception:  # pylint: disable=broad-except
+            # Missing or unreadable files count as a miss, they are replaced on the next write
+            return None
+
+    def _write(self, key, program):
+        if self.directory is None:
+            return
+        fd, path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                pickle.dump(tuple(program), fp, pickle.HIGHEST_PROTOCOL)
+            os.replace(path, self._path(key))
+        except OSError:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# Cache shared by all simulators of a process unless they are given their own
+default_cache = AssemblyCache()
@@ -0,0 +1,379 @@
+import bisect
+import hashlib
+import json
+import sys
+from collections import OrderedDict, namedtuple
+
+from gumnut_simulator import cache
+from gumnut_simulator.decoder import GumnutDecoder, OPCODE, OP_INVALID, decode_opcode
+from gumnut_simulator.profiler import INTERRUPT_ADDRESS
+
+
+BasicBlock = namedtuple("BasicBlock", "start end successors")
+Edge = namedtuple("Edge", "target kind")
+GraphCacheStats = namedtuple("GraphCacheStats", "hits misses entries")
+
+# Kinds of edges
+FALLTHROUGH = "fallthrough"
+BRANCH = "branch"
+JUMP = "jump"
+CALL = "call"
+# From a jsb to the instruction after it, taken once the subroutine returned
+CALL_RETURN = "call_return"
+# From a ret to the instructions after the jsb instructions calling its subroutine
+RETURN = "return"
+
+# Kinds of entry points
+RESET = "reset"
+INTERRUPT = "interrupt"
+
+# Edges within a subroutine, calls are summarised by their CALL_RETURN edge
+_LOCAL_EDGES = (FALLTHROUGH, BRANCH, JUMP, CALL_RETURN)
+
+DEFAULT_MAXSIZE = 64
+
+_BRANCHES = tuple(OPCODE[instruction, None] for instruction in ("bz", "bnz", "bc", "bnc"))
+_JMP, _JSB, _RET, _RETI, _ENAI, _STBY = (
+    OPCODE[instruction, None] for instruction in ("jmp", "jsb", "ret", "reti", "enai", "stby")
+)
+# Instructions after which the program doesn't simply continue with the next instruction
+_TERMINATORS = frozenset(_BRANCHES + (_JMP, _JSB, _RET, _RETI, _STBY, OP_INVALID))
+
+
+def program_words(instruction_memory):
+    """Return the instruction memory image without trailing empty words as a tuple"""
+    end = len(instruction_memory)
+    while end and not instruction_memory[end - 1]:
+        end -= 1
+    return tuple(instruction_memory[:end])
+
+
+def branch_target(address, offset):
+    """Return the address a branch at ``address`` with the 8 bit ``offset`` continues at if taken"""
+    if offset & 0x80:
+        return address + offset - 0xFF
+    return address + offset + 1
+
+
+def build(instruction_memory, decoder=None):
+    """
+    Build the control-flow graph of a program without any caching
+
+    :param instruction_memory: Object codes of the program, trailing empty
+                               words are ignored
+    :param decoder: ``GumnutDecoder`` to decode the program with
+    :return: ``ControlFlowGraph``
+    """
+    words = program_words(instruction_memory)
+    decoder = decoder or GumnutDecoder()
+    opcodes = list()
+    operands = list()
+    for objectcode in words:
+        instruction = decoder.decode_instruction(objectcode)
+        opcodes.append(decode_opcode(instruction))
+        operands.append(instruction.op2)
+    length = len(words)
+
+    # Every target of a control transfer and every instruction following one starts a block
+    leaders = {0}
+    if _ENAI in opcodes:
+        leaders.add(INTERRUPT_ADDRESS)
+    for address, opcode in enumerate(opcodes):
+        if opcode in _TERMINATORS:
+            leaders.add(address + 1)
+        if opcode in _BRANCHES:
+            leaders.add(branch_target(address, operands[address]))
+        elif opcode in (_JMP, _JSB):
+            leaders.add(operands[address])
+    starts = sorted(leader for leader in leaders if 0 <= leader < length)
+    ends = OrderedDict(zip(starts, starts[1:] + [length]))
+
+    successors = dict()
+    for start, end in ends.items():
+        last = end - 1
+        opcode = opcodes[last]
+        if opcode in _BRANCHES:
+            successors[start] = [Edge(branch_target(last, operands[last]), BRANCH), Edge(end, FALLTHROUGH)]
+        elif opcode == _JMP:
+            successors[start] = [Edge(operands[last], JUMP)]
+        elif opcode == _JSB:
+            successors[start] = [Edge(operands[last], CALL), Edge(end, CALL_RETURN)]
+        elif opcode in _TERMINATORS:
+            # ret gets its edges below, reti returns to wherever the interrupt was taken
+            successors[start] = []
+        else:
+            successors[start] = [Edge(end, FALLTHROUGH)]
+
+    # A ret returns to the callers of every subroutine it belongs to
+    callers = dict()
+    for start, edges in successors.items():
+        if edges and edges[0].kind == CALL:
+            callers.setdefault(edges[0].target, list()).append(edges[1].target)
+    for target, sites in callers.items():
+        for start in _walk(successors, [target], _LOCAL_EDGES):
+            if opcodes[ends[start] - 1] == _RET:
+                for site in sites:
+                    if Edge(site, RETURN) not in successors[start]:
+                        successors[start].append(Edge(site, RETURN))
+
+    # Interrupts are an entry point once reachable code enables them
+    entries = OrderedDict([(0, RESET)])
+    kinds = (FALLTHROUGH, BRANCH, JUMP, CALL, RETURN)
+    reachable = _walk(successors, list(entries), kinds)
+    if any(_ENAI in opcodes[start : ends[start]] for start in reachable):
+        entries[INTERRUPT_ADDRESS] = INTERRUPT
+        reachable = _walk(successors, list(entries), kinds)
+
+    blocks = OrderedDict((start, BasicBlock(start, end, tuple(successors[start]))) for start, end in ends.items())
+    roots = list(entries) + sorted(target for target in callers if target in reachable)
+    return ControlFlowGraph(words, blocks, entries, reachable, _loop_headers(successors, roots))
+
+
+def _walk(successors, roots, kinds):
+    """Return the set of block starts reachable from ``roots`` along edges of ``kinds``"""
+    seen = set()
+    pending = [root for root in roots if root in successors]
+    while pending:
+        start = pending.pop()
+        if start in seen:
+            continue
+        seen.add(start)
+        pending += [edge.target for edge in successors[start] if edge.kind in kinds and edge.target in successors]
+    return seen
+
+
+def _loop_headers(successors, roots):
+    """
+    Return the targets of back edges found by a depth-first search from ``roots``
+
+    Calls are followed along their CALL_RETURN edges, so loops are found
+    within subroutines but calling a subroutine from several places isn't
+    mistaken for a loop. Every subroutine is searched from its own start.
+    """
+    headers = set()
+    visited = set()
+    for root in roots:
+        if root not in successors or root in visited:
+            continue
+        visited.add(root)
+        on_stack = {root}
+        stack = [(root, iter(successors[root]))]
+        while stack:
+            start, edges = stack[-1]
+            for edge in edges:
+                if edge.kind not in _LOCAL_EDGES or edge.target not in successors:
+                    continue
+                if edge.target in on_stack:
+                    headers.add(edge.target)
+                elif edge.target not in visited:
+                    visited.add(edge.target)
+                    on_stack.add(edge.target)
+                    stack.append((edge.target, iter(successors[edge.target])))
+                    break
+            else:
+                stack.pop()
+                on_stack.discard(start)
+    return headers
+
+
+def _lines(lsom_map, addresses):
+    """Return the sorted source lines of ``addresses`` according to ``lsom_map``"""
+    return sorted(line for line, field in lsom_map.items() if field[3] is not None and field[3] in addresses)
+
+
+class ControlFlowGraph:
+    """
+    Control-flow graph of the basic blocks of a program
+
+    ``blocks`` maps the start address of every block to its
+    ``BasicBlock(start, end, successors)``, ``end`` being the address after
+    its last instruction and ``successors`` a tuple of ``Edge(target, kind)``.
+    Blocks end with ``bz``, ``bnz``, ``bc``, ``bnc``, ``jmp``, ``jsb``,
+    ``ret``, ``reti``, ``stby`` or an invalid instruction. ``stby`` is
+    taken as the end of the program and ``reti`` has no successors, it
+    returns to wherever the interrupt was taken.
+
+    ``entries`` maps the entry points to their kind: ``RESET`` at 0 and
+    ``INTERRUPT`` at the interrupt vector once reachable code executes
+    ``enai``. Targets outside of the program, e.g. past its last
+    instruction, have no block.
+
+    Source lines are looked up through the ``lsom_map`` of the assembled
+    program, see ``GumnutSimulator.lsom_map``.
+    """
+
+    def __init__(self, words, blocks, entries, reachable, loop_headers):
+        self.key = GraphCache.key(words)
+        self.length = len(words)
+        self.blocks = blocks
+        self.entries = entries
+        self.reachable = frozenset(reachable)
+        self.loop_headers = frozenset(loop_headers)
+        self._starts = list(blocks)
+
+    def get_block(self, address):
+        """Return the block containing ``address`` or ``None``"""
+        index = bisect.bisect_right(self._starts, address) - 1
+        if index < 0 or address >= self.length:
+            return None
+        return self.blocks[self._starts[index]]
+
+    def get_unreachable_addresses(self):
+        """Return the sorted addresses of all instructions which can't be reached from any entry point"""
+        return [
+            address
+            for start, block in self.blocks.items()
+            if start not in self.reachable
+            for address in range(block.start, block.end)
+        ]
+
+    def get_unreachable_lines(self, lsom_map):
+        """Return the sorted source lines of all instructions which can't be reached"""
+        return _lines(lsom_map, set(self.get_unreachable_addresses()))
+
+    def get_loop_header_lines(self, lsom_map):
+        """Return the sorted source lines of the first instructions of all loops"""
+        return _lines(lsom_map, self.loop_headers)
+
+    def to_dict(self, lsom_map=None):
+        """Return the graph as a dictionary of JSON types, with source lines if ``lsom_map`` is given"""
+        blocks = list()
+        for start, block in self.blocks.items():
+            entry = {
+                "start": start,
+                "end": block.end,
+                "successors": [{"target": edge.target, "kind": edge.kind} for edge in block.successors],
+                "reachable": start in self.reachable,
+                "loop_header": start in self.loop_headers,
+            }
+            if lsom_map is not None:
+                entry["lines"] = _lines(lsom_map, set(range(start, block.end)))
+            blocks.append(entry)
+        result = {
+            "key": self.key,
+            "length": self.length,
+            "entries": [{"address": address, "kind": kind} for address, kind in self.entries.items()],
+            "blocks": blocks,
+        }
+        if lsom_map is not None:
+            result["unreachable_lines"] = self.get_unreachable_lines(lsom_map)
+            result["loop_header_lines"] = self.get_loop_header_lines(lsom_map)
+        return result
+
+    def to_JSON(self, lsom_map=None):
+        return json.dumps(self.to_dict(lsom_map), sort_keys=True, indent=4)
+
+    def to_dot(self, lsom_map=None):
+        """
+        Return the graph in the DOT language of Graphviz
+
+        Loop headers are drawn with a double border, unreachable blocks
+        dashed. With ``lsom_map`` the blocks are labelled with their source.
+        """
+        lines = ["digraph cfg {", '    node [shape=box, fontname="monospace"];']
+        for address, kind in self.entries.items():
+            lines.append('    %s [shape=plaintext, label="%s"];' % (kind, kind))
+            lines.append("    %s -> %s;" % (kind, _node(address)))
+        outside = set()
+        for start, block in self.blocks.items():
+            label = "0x%03X - 0x%03X" % (start, block.end - 1)
+            if lsom_map is not None:
+                source = [lsom_map[line][0].strip() for line in _lines(lsom_map, set(range(start, block.end)))]
+                label += "\\n" + "".join(_escape(text) + "\\l" for text in source)
+            attributes = ['label="%s"' % label]
+            if start in self.loop_headers:
+                attributes.append("peripheries=2")
+            if start not in self.reachable:
+                attributes.append("style=dashed")
+            lines.append("    %s [%s];" % (_node(start), ", ".join(attributes)))
+            for edge in block.successors:
+                if edge.target not in self.blocks:
+                    outside.add(edge.target)
+                style = "" if edge.kind == FALLTHROUGH else ' [label="%s"]' % edge.kind
+                lines.append("    %s -> %s%s;" % (_node(start), _node(edge.target), style))
+        for address in sorted(outside):
+            lines.append('    %s [shape=plaintext, label="0x%03X"];' % (_node(address), address))
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
+
+def _node(address):
+    return "b%d" % address if address >= 0 else "b_%d" % -address
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace('"', '\\"')
+
+
+class GraphCache:
+    """
+    Cache of control-flow graphs keyed on the hash of the program
+
+    Graphs are kept up to ``maxsize`` entries, the least recently used one
+    is dropped first. Cached graphs are shared by all users of the cache
+    and must not be modified.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(instruction_memory):
+        """Return the key of the program in ``instruction_memory``, trailing empty words don't count"""
+        words = program_words(instruction_memory)
+        return hashlib.sha256(b"".join(word.to_bytes(3, "little") for word in words)).hexdigest()
+
+    def get(self, instruction_memory):
+        """Return the ``ControlFlowGraph`` of the program, building it only if it isn't cached yet"""
+        key = self.key(instruction_memory)
+        graph = self.entries.get(key)
+        if graph is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return graph
+
+        graph = build(instruction_memory)
+        self.misses += 1
+        self.entries[key] = graph
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return graph
+
+    def stats(self):
+        return GraphCacheStats(self.hits, self.misses, len(self.entries))
+
+    def clear(self):
+        """Drop all graphs and reset the statistics"""
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# Cache shared by all users of a process
+default_cache = GraphCache()
+
+
+def main(args):
+    """Entry point of ``gumnut-simulator cfg``, prints the control-flow graph of a source file"""
+    with open(args.path, encoding="utf-8") as fp:
+        program = cache.assemble(fp.read())
+    graph = default_cache.get(program.instruction_memory)
+    if args.format == "dot":
+        text = graph.to_dot(program.source_objectcode_map)
+    else:
+        text = graph.to_JSON(program.source_objectcode_map) + "\n"
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            fp.write(text)
+    else:
+        sys.stdout.write(text)
+    return 0
+
+
+def add_arguments(parser):
+    parser.add_argument("path", help=".asm file to analyse")
+    parser.add_argument("--format", choices=("dot", "json"), default="dot", help="output format")
+    parser.add_argument("-o", "--output", default=None, help="write to this file instead of stdout")
@@ -0,0 +1,185 @@
+import asyncio
+import itertools
+import json
+import time
+
+from gumnut_simulator import server
+
+
+# Endless countdown, so every run uses up its whole step budget
+LOAD_TEST_SOURCE = """
+start:  add r1, r0, 255
+loop:   stm r1, (r1)
+        sub r1, r1, 1
+        bnz loop
+        jmp start
+"""
+
+DEFAULT_SESSIONS = 16
+DEFAULT_ROUNDS = 20
+DEFAULT_RUN_STEPS = 50000
+
+
+class RPCError(Exception):
+    """Error response of the simulation server"""
+
+    def __init__(self, error):
+        super().__init__(error.get("message"))
+        self.code = error.get("code")
+        self.data = error.get("data")
+
+
+class Client:
+    """
+    JSON-RPC client of ``SimulationServer``
+
+    Requests can be sent concurrently, responses are matched by their id.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self._ids = itertools.count(1)
+        self._pending = dict()
+        self._receiver = asyncio.ensure_future(self._receive())
+
+    @classmethod
+    async def connect_tcp(cls, host="127.0.0.1", port=8765):
+        reader, writer = await asyncio.open_connection(host, port, limit=2**20)
+        return cls(reader, writer)
+
+    @classmethod
+    async def connect_unix(cls, path):
+        reader, writer = await asyncio.open_unix_connection(path, limit=2**20)
+        return cls(reader, writer)
+
+    async def call(self, method, **params):
+        """Send a request and return the result, raises ``RPCError`` on error responses"""
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        request = {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}
+        self.writer.write(json.dumps(request).encode("utf-8") + b"\n")
+        await self.writer.drain()
+        return await future
+
+    async def _receive(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self._pending.pop(response.get("id"), None)
+                if future is None or future.done():
+                    continue
+                if "error" in response:
+                    future.set_exception(RPCError(response["error"]))
+                else:
+                    future.set_result(response["result"])
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection to the simulation server closed"))
+            self._pending.clear()
+
+    async def close(self):
+        self.writer.close()
+        await self._receiver
+
+
+def percentiles(latencies, points=(50, 90, 99)):
+    """Return ``{'p50': ..., 'max': ...}`` of ``latencies`` using the nearest rank"""
+    ordered = sorted(latencies)
+    if not ordered:
+        return dict()
+    result = {"p%d" % point: ordered[min(len(ordered) - 1, len(ordered) * point // 100)] for point in points}
+    result["max"] = ordered[-1]
+    return result
+
+
+async def load_test(connect, sessions=DEFAULT_SESSIONS, rounds=DEFAULT_ROUNDS, run_steps=DEFAULT_RUN_STEPS):
+    """
+    Measure request latencies with ``sessions`` concurrent sessions
+
+    Every session uses its own connection, sets up ``LOAD_TEST_SOURCE``
+    and then sends ``rounds`` times a ``run`` of ``run_steps`` steps, a
+    ``step`` and a ``get_changes``. While the runs of the other sessions
+    are executed, the latencies of ``step`` and ``get_changes`` show how
+    long interactive requests wait for their time slice.
+
+    :param connect: Coroutine function returning a connected ``Client``
+    :return: ``{'run': {'count': 320, 'p50': 0.012, ...}, 'step': ...,
+              'steps_per_second': 4.1e6, 'seconds': 2.5}`` with latencies
+             in seconds
+    """
+    latencies = {"setup": [], "run": [], "step": [], "get_changes": []}
+    executed = [0]
+
+    async def timed(client, method, **params):
+        start = time.perf_counter()
+        result = await client.call(method, **params)
+        latencies[method].append(time.perf_counter() - start)
+        return result
+
+    async def session():
+        client = await connect()
+        try:
+            session_id = (await client.call("open"))["session"]
+            await timed(client, "setup", session=session_id, source=LOAD_TEST_SOURCE)
+            token = None
+            for _ in range(rounds):
+                run = await timed(client, "run", session=session_id, max_steps=run_steps)
+                await timed(client, "step", session=session_id)
+                token = (await timed(client, "get_changes", session=session_id, token=token))["token"]
+                executed[0] += run["steps"] + 1
+            await client.call("close", session=session_id)
+        finally:
+            await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session() for _ in range(sessions)))
+    seconds = time.perf_counter() - start
+
+    result = {method: dict(percentiles(values), count=len(values)) for method, values in latencies.items()}
+    result["seconds"] = seconds
+    result["steps_per_second"] = executed[0] / seconds
+    return result
+
+
+def main(args):
+    """Entry point of ``gumnut-simulator loadtest``, starts a local server unless one is given"""
+
+    async def run():
+        if args.unix:
+            return await load_test(lambda: Client.connect_unix(args.unix), args.sessions, args.rounds, args.run_steps)
+        if args.port:
+            connect = lambda: Client.connect_tcp(args.host, args.port)  # noqa: E731
+            return await load_test(connect, args.sessions, args.rounds, args.run_steps)
+        local = server.SimulationServer(max_sessions=max(args.sessions, server.DEFAULT_MAX_SESSIONS))
+        listener = await local.start_tcp("127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            return await load_test(
+                lambda: Client.connect_tcp("127.0.0.1", port), args.sessions, args.rounds, args.run_steps
+            )
+
+    result = asyncio.run(run())
+    print("%d sessions, %.2f s, %.0f steps/s" % (args.sessions, result["seconds"], result["steps_per_second"]))
+    print("%-12s %6s %10s %10s %10s %10s" % ("method", "count", "p50 ms", "p90 ms", "p99 ms", "max ms"))
+    for method in ("setup", "run", "step", "get_changes"):
+        stats = result[method]
+        print(
+            "%-12s %6d %10.2f %10.2f %10.2f %10.2f"
+            % (method, stats["count"], *(stats[point] * 1000 for point in ("p50", "p90", "p99", "max")))
+        )
+    return 0
+
+
+def add_arguments(parser):
+    parser.add_argument("--host", default="127.0.0.1", help="address of the server")
+    parser.add_argument("--port", type=int, default=None, help="port of the server, starts a local server if omitted")
+    parser.add_argument("--unix", default=None, help="Unix socket of the server")
+    parser.add_argument("--sessions", type=int, default=DEFAULT_SESSIONS, help="number of concurrent sessions")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS, help="requests of each kind per session")
+    parser.add_argument("--run-steps", type=int, default=DEFAULT_RUN_STEPS, help="steps per run request")
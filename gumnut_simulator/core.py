@@ -1,4 +1,17 @@
-from gumnut_simulator.decoder import GumnutDecoder
+from array import array
+from collections import deque, namedtuple
+from enum import IntEnum
+from itertools import islice
+
+from gumnut_simulator.alu import ROL, ROR, SHIFT_RESULT, shift_index
+from gumnut_simulator.decoder import (
+    GumnutDecoder,
+    DecodedInstruction,
+    OBJECTCODE_MASK,
+    OPCODE,
+    OP_INVALID,
+    decode_opcode,
+)
 from gumnut_simulator.exceptions import (
     InvalidPCValue,
     InstructionMemorySizeExceeded,
@@ -7,6 +20,101 @@ from gumnut_simulator.exceptions import (
     InvalidInstruction,
     EmptyReturnStack,
 )
+from gumnut_simulator.watchpoints import DATA_MEMORY, IO_CONTROLLER_REGISTER, READ, WRITE, WatchpointHit, Watchpoints
+
+
+class StopReason(IntEnum):
+    budget = 0
+    breakpoint = 1
+    wait = 2
+    stby = 3
+    exception = 4
+    loop = 5
+    watchpoint = 6
+
+
+RunResult = namedtuple("RunResult", "reason steps previous_PC exception")
+
+
+class _WatchpointTriggered(Exception):
+    """Raised by ``ldm``, ``stm``, ``inp`` and ``out`` after accessing a watched address"""
+
+
+_WATCHPOINT_TRIGGERED = _WatchpointTriggered()
+CoreSnapshot = namedtuple(
+    "CoreSnapshot",
+    "r PC SP CARRY ZERO WAIT STBY IREN IR saved_PC saved_CARRY saved_ZERO return_address_stack instruction "
+    "data_memory_access_addr data_memory IO_controller_register instruction_memory decoded_instruction_memory",
+)
+
+# Offsets of rol and ror within alu.SHIFT_RESULT
+_ROL_OFFSET = shift_index(ROL, 0, 0)
+_ROR_OFFSET = shift_index(ROR, 0, 0)
+
+# Type code of the instruction memory array, needs to hold 18 bit words
+WORD_TYPECODE = "I" if array("I").itemsize >= 4 else "L"
+
+
+def _zero_words(count):
+    """Return an instruction memory array of ``count`` cleared words"""
+    return array(WORD_TYPECODE, bytes(count * array(WORD_TYPECODE).itemsize))
+
+
+# Number of generations whose written addresses are kept, changes since older ones return whole memories
+WRITE_LOG_LENGTH = 32
+
+
+class WriteLog:
+    """
+    Addresses of a memory written in each generation, see ``GumnutCore.next_generation()``
+
+    Writes add their address to ``written``, the set of the current
+    generation. The sets of the last ``WRITE_LOG_LENGTH`` generations are
+    kept, so looking up the changes since one of them costs as much as the
+    writes since then instead of a scan of the whole memory.
+    """
+
+    def __init__(self):
+        self.generation = 1
+        self.written = set()
+        self.history = deque(maxlen=WRITE_LOG_LENGTH)
+        # Last generation in which the whole memory was written
+        self.rewritten = 1
+
+    def mark_all(self):
+        """Record a write of the whole memory"""
+        self.rewritten = self.generation
+        self.written.clear()
+
+    def next_generation(self):
+        self.history.append(frozenset(self.written))
+        self.written.clear()
+        self.generation += 1
+
+    def changed_ranges(self, memory, since):
+        """
+        Return the ranges of ``memory`` written in or after generation ``since``
+
+        :return: List of ``(start, values)`` tuples, one for each run of
+                 consecutive changed addresses
+        """
+        if since <= self.rewritten or since < self.generation - len(self.history):
+            return [(0, list(memory))] if len(memory) else []
+        addresses = set(self.written)
+        for written in islice(reversed(self.history), self.generation - since):
+            addresses |= written
+
+        ranges = list()
+        start = end = None
+        for address in sorted(addresses):
+            if address != end:
+                if start is not None:
+                    ranges.append((start, list(memory[start:end])))
+                start = address
+            end = address + 1
+        if start is not None:
+            ranges.append((start, list(memory[start:end])))
+        return ranges
 
 
 class GumnutCore:
@@ -14,9 +122,10 @@ class GumnutCore:
         self.instruction_memory_size = 4096
         self.data_memory_size = 256
         self.IO_controller_register_size = 256
-        self.instruction_memory = list()
-        self.data_memory = list()
-        self.IO_controller_register = list()
+        self.instruction_memory = _zero_words(self.instruction_memory_size)
+        self.decoded_instruction_memory = list()
+        self.data_memory = bytearray(self.data_memory_size)
+        self.IO_controller_register = bytearray(self.IO_controller_register_size)
         self.PC = 0  # Reset PC to 0
         self.SP = 0  # Reset SP to 0
         self.CARRY = False  # Reset C to False
@@ -30,9 +139,22 @@ class GumnutCore:
         self._PC = 0
         self._CARRY = 0
         self._ZERO = 0
+        self.decoder = GumnutDecoder()
+        self.translator = None
+        self.profiler = None
+        self.tracer = None
+        self.IO_bus = None
+        self.loop_detector = None
+        self.watchpoints = None
+        self.watchpoint_hit = None
+        self._instruction_memory_snapshot = None
+        # Addresses written in each generation, see next_generation()
+        self.generation = 1
+        self.instruction_memory_writes = WriteLog()
+        self.data_memory_writes = WriteLog()
+        self.IO_controller_register_writes = WriteLog()
         self.reset()
         self.instruction = None
-        self.decoder = GumnutDecoder()
         self.data_memory_access_addr = -1
         self.current_ret_line = -1
 
@@ -54,35 +176,302 @@ class GumnutCore:
         self.data_memory_access_addr = -1
         self.current_ret_line = -1
         self.instruction = None
-
-        # Clear instruction memory
-        self.instruction_memory.clear()
-        for i in range(0, self.instruction_memory_size, 1):
-            self.instruction_memory.insert(i, 0)
-
-        # Clear data memory
-        self.data_memory.clear()
-        for i in range(0, self.data_memory_size, 1):
-            self.data_memory.insert(i, 0)
-
-        # Clear IO controller registers
-        self.IO_controller_register.clear()
-        for i in range(0, self.IO_controller_register_size, 1):
-            self.IO_controller_register.insert(i, 0)
+        self.watchpoint_hit = None
+
+        # Clear memories in place, so views of them stay valid
+        self.instruction_memory[:] = _zero_words(self.instruction_memory_size)
+        self.decoded_instruction_memory = [self.decode(0)] * self.instruction_memory_size
+        self._instruction_memory_snapshot = None
+        if self.translator is not None:
+            self.translator.invalidate()
+        if self.profiler is not None:
+            self.profiler.clear()
+        if self.IO_bus is not None:
+            self.IO_bus.reset()
+        if self.loop_detector is not None:
+            self.loop_detector.clear()
+        self.data_memory[:] = bytes(self.data_memory_size)
+        self.IO_controller_register[:] = bytes(self.IO_controller_register_size)
+        self.instruction_memory_writes.mark_all()
+        self.data_memory_writes.mark_all()
+        self.IO_controller_register_writes.mark_all()
+
+    def next_generation(self):
+        """
+        Start a new generation of memory changes and return its number
+
+        Every write to the instruction memory, data memory or IO registers
+        adds its address to the current generation of the ``*_writes`` log
+        of the memory, so ``WriteLog.changed_ranges()`` can return all
+        writes since any recent generation. Writes to the memories which
+        bypass the core (e.g. ``core.data_memory[0] = 1``) are not tracked.
+        """
+        self.instruction_memory_writes.next_generation()
+        self.data_memory_writes.next_generation()
+        self.IO_controller_register_writes.next_generation()
+        self.generation += 1
+        return self.generation
 
     def upload_instruction_memory(self, data):
-        """Upload the instruction memory content as a list to the core"""
+        """
+        Upload the instruction memory content as a list to the core
+
+        Words beyond the end of ``data`` are cleared.
+        """
         if len(data) > self.instruction_memory_size:
             raise InstructionMemorySizeExceeded(len(data), "Instruction memory size exceeded")
         else:
-            self.instruction_memory = data
+            words = array(WORD_TYPECODE, [objectcode & OBJECTCODE_MASK for objectcode in data])
+            words.extend(_zero_words(self.instruction_memory_size - len(data)))
+            self.instruction_memory[:] = words
+            # Only the uploaded words need decoding, the rest is cleared
+            self.decoded_instruction_memory = self.decode_program(words[: len(data)])
+            self.decoded_instruction_memory += [self.decode(0)] * (self.instruction_memory_size - len(data))
+            self.instruction_memory_writes.mark_all()
+            self._instruction_memory_snapshot = None
+            if self.translator is not None:
+                self.translator.invalidate()
+            if self.loop_detector is not None:
+                self.loop_detector.clear()
+
+    def decode(self, objectcode):
+        """Decode a single instruction together with its opcode"""
+        instruction = self.decoder.decode_instruction(objectcode)
+        opcode = decode_opcode(instruction)
+        return DecodedInstruction(opcode, instruction.rd, instruction.op1, instruction.op2, instruction)
+
+    def decode_program(self, data):
+        """Decode a whole program once and return the list of decoded instructions"""
+        decoded = dict()
+        for objectcode in data:
+            if objectcode not in decoded:
+                decoded[objectcode] = self.decode(objectcode)
+        return [decoded[objectcode] for objectcode in data]
+
+    def write_instruction_memory(self, address, objectcode):
+        """Write a single instruction word and invalidate its pre-decoded instruction"""
+        if address >= len(self.instruction_memory) or address < 0:
+            raise InstructionMemorySizeExceeded(address, "Instruction memory address out of range")
+        self.instruction_memory[address] = objectcode & OBJECTCODE_MASK
+        self.instruction_memory_writes.written.add(address)
+        self.decoded_instruction_memory[address] = None
+        self._instruction_memory_snapshot = None
+        if self.translator is not None:
+            self.translator.invalidate(address)
+        if self.loop_detector is not None:
+            self.loop_detector.clear()
+
+    def snapshot(self):
+        """
+        Capture the complete state of the core in an immutable ``CoreSnapshot``
+
+        The instruction memory is only copied once after it has been
+        changed (by uploading or writing it), all snapshots taken in between
+        share the same copy.
+        """
+        if self._instruction_memory_snapshot is None:
+            self._instruction_memory_snapshot = (
+                self.instruction_memory.tobytes(),
+                tuple(self.decoded_instruction_memory),
+            )
+        instruction_memory, decoded_instruction_memory = self._instruction_memory_snapshot
+        return CoreSnapshot(
+            tuple(self.r),
+            self.PC,
+            self.SP,
+            self.CARRY,
+            self.ZERO,
+            self.WAIT,
+            self.STBY,
+            self.IREN,
+            self.IR,
+            self._PC,
+            self._CARRY,
+            self._ZERO,
+            tuple(self.return_address_stack),
+            self.instruction,
+            self.data_memory_access_addr,
+            bytes(self.data_memory),
+            bytes(self.IO_controller_register),
+            instruction_memory,
+            decoded_instruction_memory,
+        )
+
+    def restore(self, snapshot):
+        """Restore the state captured by ``snapshot()``"""
+        self.r = list(snapshot.r)
+        self.PC = snapshot.PC
+        self.SP = snapshot.SP
+        self.CARRY = snapshot.CARRY
+        self.ZERO = snapshot.ZERO
+        self.WAIT = snapshot.WAIT
+        self.STBY = snapshot.STBY
+        self.IREN = snapshot.IREN
+        self.IR = snapshot.IR
+        self._PC = snapshot.saved_PC
+        self._CARRY = snapshot.saved_CARRY
+        self._ZERO = snapshot.saved_ZERO
+        self.return_address_stack = list(snapshot.return_address_stack)
+        self.instruction = snapshot.instruction
+        self.data_memory_access_addr = snapshot.data_memory_access_addr
+        self.data_memory[:] = snapshot.data_memory
+        self.IO_controller_register[:] = snapshot.IO_controller_register
+        self.data_memory_writes.mark_all()
+        self.IO_controller_register_writes.mark_all()
+        if self.loop_detector is not None:
+            self.loop_detector.clear()
+
+        # Unchanged instruction memory doesn't need to be copied back
+        current = self._instruction_memory_snapshot
+        if current is None or current[0] is not snapshot.instruction_memory:
+            self.instruction_memory[:] = array(WORD_TYPECODE, snapshot.instruction_memory)
+            self.decoded_instruction_memory = list(snapshot.decoded_instruction_memory)
+            self.instruction_memory_writes.mark_all()
+            self._instruction_memory_snapshot = (snapshot.instruction_memory, snapshot.decoded_instruction_memory)
+            if self.translator is not None:
+                self.translator.invalidate()
+
+    def enable_translation(self, enabled=True):
+        """
+        Let ``run()`` execute basic blocks translated into Python functions
+
+        See ``gumnut_simulator.translator.BlockTranslator``. ``step()``
+        always uses the interpreter.
+        """
+        if enabled:
+            from gumnut_simulator.translator import BlockTranslator  # pylint: disable=import-outside-toplevel
+
+            self.translator = BlockTranslator(self)
+        else:
+            self.translator = None
+
+    def enable_profiling(self, enabled=True):
+        """
+        Count the executions of every address and opcode
+
+        See ``gumnut_simulator.profiler.Profiler``. While profiling
+        ``run()`` executes one ``step()`` after the other, the counts are
+        cleared by ``reset()``.
+        """
+        if enabled:
+            from gumnut_simulator.profiler import Profiler  # pylint: disable=import-outside-toplevel
+
+            self.profiler = Profiler(self.instruction_memory_size)
+        else:
+            self.profiler = None
+
+    def enable_loop_detection(self, enabled=True):
+        """
+        Let ``run()`` stop with ``StopReason.loop`` once the program provably loops forever
+
+        See ``gumnut_simulator.loopdetector.LoopDetector``. While detecting
+        loops ``run()`` uses the interpreter, even if translation is enabled.
+        Profiling and tracing take precedence, they run without detection.
+        """
+        if enabled:
+            from gumnut_simulator.loopdetector import LoopDetector  # pylint: disable=import-outside-toplevel
+
+            self.loop_detector = LoopDetector(self)
+        else:
+            self.loop_detector = None
+
+    def start_trace(self, path, start_step=0):
+        """
+        Write a binary record of every following step to ``path``
+
+        See ``gumnut_simulator.trace.TraceWriter``. While tracing ``run()``
+        executes one ``step()`` after the other.
+
+        :return: The ``TraceWriter``
+        """
+        from gumnut_simulator.trace import TraceWriter  # pylint: disable=import-outside-toplevel
+
+        self.stop_trace()
+        self.tracer = TraceWriter(path, start_step)
+        return self.tracer
+
+    def stop_trace(self):
+        """Write the remaining records of the trace and close its file"""
+        if self.tracer is not None:
+            self.tracer.close()
+            self.tracer = None
+
+    def attach_IO_device(self, device, start, length=1):
+        """
+        Map ``device`` to the IO controller register addresses ``start`` to ``start + length - 1``
+
+        See ``gumnut_simulator.iobus``. Once a device is attached ``inp`` and
+        ``out`` look up their address on the bus, unmapped addresses are
+        still read and written directly. Values written to a device are
+        stored in the IO controller register as well.
+        """
+        if self.IO_bus is None:
+            from gumnut_simulator.iobus import IOBus  # pylint: disable=import-outside-toplevel
+
+            self.IO_bus = IOBus(self.IO_controller_register_size)
+            self._update_dispatch()
+        self.IO_bus.attach(device, start, length)
+
+    def detach_IO_device(self, device):
+        self.IO_bus.detach(device)
+
+    def add_watchpoint(self, memory, address, access=WRITE, value=None):
+        """
+        Stop ``run()`` after an instruction accessing ``address`` of ``memory``
+
+        See ``gumnut_simulator.watchpoints``. ``memory`` is ``DATA_MEMORY``
+        or ``IO_CONTROLLER_REGISTER``, ``access`` is ``READ``, ``WRITE`` or
+        both. With ``value`` only writes of that value are watched. The
+        access is stored in ``watchpoint_hit``. Only ``ldm``, ``stm``,
+        ``inp`` and ``out`` check for watchpoints, and only while there are
+        any.
+        """
+        if self.watchpoints is None:
+            self.watchpoints = Watchpoints(self.data_memory_size, self.IO_controller_register_size)
+            self._update_dispatch()
+        self.watchpoints.add(memory, address, access, value)
+
+    def remove_watchpoint(self, memory, address):
+        """Stop watching ``address`` of ``memory``"""
+        if self.watchpoints is not None:
+            self.watchpoints.remove(memory, address)
+            if not self.watchpoints:
+                self.clear_watchpoints()
+
+    def clear_watchpoints(self):
+        self.watchpoints = None
+        self.watchpoint_hit = None
+        self._update_dispatch()
+
+    def _update_dispatch(self):
+        """Replace the handlers of memory instructions while IO devices or watchpoints are used"""
+        dispatch = list(GumnutCore._dispatch)
+        if self.IO_bus is not None:
+            dispatch[OPCODE["inp", None]] = GumnutCore._inp_mapped
+            dispatch[OPCODE["out", None]] = GumnutCore._out_mapped
+        if self.watchpoints is not None:
+            dispatch[OPCODE["ldm", None]] = GumnutCore._ldm_watched
+            dispatch[OPCODE["stm", None]] = GumnutCore._stm_watched
+            dispatch[OPCODE["inp", None]] = GumnutCore._inp_watched
+            dispatch[OPCODE["out", None]] = GumnutCore._out_watched
+        self._dispatch = tuple(dispatch)
+        if self.translator is not None:
+            self.translator.invalidate()
 
     def upload_data_memory(self, data):
-        """Upload the data memory content as a list to the core"""
+        """
+        Upload the data memory content as a list to the core
+
+        Only the lower 8 bits of each value are stored, bytes beyond the
+        end of ``data`` are cleared.
+        """
         if len(data) > self.data_memory_size:
             raise DataMemorySizeExceeded(len(data), "Data memory size exceeded")
         else:
-            self.data_memory = data
+            self.data_memory[:] = bytes(value & 0xFF for value in data) + bytes(self.data_memory_size - len(data))
+            self.data_memory_writes.mark_all()
+            if self.loop_detector is not None:
+                self.loop_detector.clear()
 
     def fetch(self):
         """Fetch the next instruction to execute from program memory"""
@@ -93,191 +482,284 @@ class GumnutCore:
         else:
             return self.instruction_memory[self.PC]
 
+    def fetch_decoded(self):
+        """Fetch the next instruction to execute from the pre-decoded instruction memory"""
+        if self.PC >= self.instruction_memory_size:
+            raise InvalidPCValue("PC exceeds maximum value", self.PC)
+        elif self.PC < 0:
+            raise InvalidPCValue("PC exceeds minimum value", self.PC)
+        instruction = self.decoded_instruction_memory[self.PC]
+        if instruction is None:
+            instruction = self.decode(self.instruction_memory[self.PC])
+            self.decoded_instruction_memory[self.PC] = instruction
+        return instruction
+
     def execute(self, instruction):
         """Execute a single instruction"""
         # Check if we have a valid instruction
         if instruction:
-            rd = instruction.rd
-            op1 = instruction.op1
-            op2 = instruction.op2
-
-            # Arithmetic and logical instructions
-            if instruction.instruction == "add":
-                if instruction.access == "register":
-                    self.r[rd] = self.r[op1] + self.r[op2]
-                elif instruction.access == "immediate":
-                    self.r[rd] = self.r[op1] + op2
-                self.r[rd] = self.check_range(self.r[rd])
-
-            elif instruction.instruction == "addc":
-                if instruction.access == "register":
-                    self.r[rd] = self.r[op1] + self.r[op2] + self.CARRY
-                elif instruction.access == "immediate":
-                    self.r[rd] = self.r[op1] + op2 + self.CARRY
-                self.r[rd] = self.check_range(self.r[rd])
-
-            elif instruction.instruction == "sub":
-                if instruction.access == "register":
-                    self.r[rd] = self.r[op1] - self.r[op2]
-                elif instruction.access == "immediate":
-                    self.r[rd] = self.r[op1] - op2
-                self.r[rd] = self.check_range(self.r[rd])
-
-            elif instruction.instruction == "subc":
-                if instruction.access == "register":
-                    self.r[rd] = self.r[op1] - self.r[op2] - self.CARRY
-                elif instruction.access == "immediate":
-                    self.r[rd] = self.r[op1] - op2 - self.CARRY
-                self.r[rd] = self.check_range(self.r[rd])
-
-            elif instruction.instruction == "and":
-                if instruction.access == "register":
-                    self.r[rd] = self.r[op1] & self.r[op2]
-                elif instruction.access == "immediate":
-                    self.r[rd] = self.r[op1] & op2
-                self.r[rd] = self.check_range(self.r[rd])
-
-            elif instruction.instruction == "or":
-                if instruction.access == "register":
-                    self.r[rd] = self.r[op1] | self.r[op2]
-                elif instruction.access == "immediate":
-                    self.r[rd] = self.r[op1] | op2
-                self.r[rd] = self.check_range(self.r[rd])
-
-            elif instruction.instruction == "xor":
-                if instruction.access == "register":
-                    self.r[rd] = self.r[op1] ^ self.r[op2]
-                elif instruction.access == "immediate":
-                    self.r[rd] = self.r[op1] ^ op2
-                self.r[rd] = self.check_range(self.r[rd])
-
-            elif instruction.instruction == "mask":
-                if instruction.access == "register":
-                    self.r[rd] = self.r[op1] & ~self.r[op2]
-                elif instruction.access == "immediate":
-                    self.r[rd] = self.r[op1] & ~op2
-                self.r[rd] = self.check_range(self.r[rd])
-
-            # Shift instructions
-            elif instruction.instruction == "shl":
-                self.r[rd] = self.r[op1] << op2
-                self.r[rd] &= 0xFF
-
-            elif instruction.instruction == "shr":
-                self.r[rd] = self.r[op1] >> op2
-                self.r[rd] &= 0xFF
-
-            elif instruction.instruction == "rol":
-                _rs = self.r[op1]
-                for _ in range(0, op2, 1):
-                    carry = (_rs & 0x80) >> 7
-                    self.r[rd] = _rs << 1
-                    self.r[rd] |= carry
-                    self.r[rd] &= 0xFF
-                    _rs = self.r[rd]
-
-            elif instruction.instruction == "ror":
-                _rs = self.r[op1]
-                for _ in range(0, op2, 1):
-                    carry = _rs & 0x01
-                    self.r[rd] = _rs >> 1
-                    self.r[rd] |= carry << 7
-                    self.r[rd] &= 0xFF
-                    _rs = self.r[rd]
-
-            # Memory and I/O instructions
-            elif instruction.instruction == "ldm":
-                self.check_data_memory_access(self.r[op1] + op2)
-                self.r[rd] = self.data_memory[self.r[op1] + op2]
-
-            elif instruction.instruction == "stm":
-                self.check_data_memory_access(self.r[op1] + op2)
-                self.data_memory[self.r[op1] + op2] = self.r[rd]
-
-            elif instruction.instruction == "inp":
-                self.r[rd] = self.IO_controller_register[self.r[op1] + op2]
-
-            elif instruction.instruction == "out":
-                self.IO_controller_register[self.r[op1] + op2] = self.r[rd]
-
-            # Branch instructions
-            elif instruction.instruction == "bz":
-                if self.ZERO:
-                    if op2 & (0x80):
-                        self.PC = self.PC + (op2 - 0xFF) - 1
-                    else:
-                        self.PC = self.PC + op2
-
-            elif instruction.instruction == "bnz":
-                if not self.ZERO:
-                    if op2 & (0x80):
-                        self.PC = self.PC + (op2 - 0xFF) - 1
-                    else:
-                        self.PC = self.PC + op2
-
-            elif instruction.instruction == "bc":
-                if self.CARRY:
-                    if op2 & (0x80):
-                        self.PC = self.PC + (op2 - 0xFF) - 1
-                    else:
-                        self.PC = self.PC + op2
-
-            elif instruction.instruction == "bnc":
-                if not self.CARRY:
-                    if op2 & (0x80):
-                        self.PC = self.PC + (op2 - 0xFF) - 1
-                    else:
-                        self.PC = self.PC + op2
-
-            # Jump instructions
-            elif instruction.instruction == "jmp":
-                self.PC = op2 - 1
-
-            elif instruction.instruction == "jsb":
-                if len(self.return_address_stack) >= 8:
-                    self.return_address_stack.pop(0)
-                self.return_address_stack.append(self.PC)
-                self.SP += 1
-                self.PC = op2 - 1
-
-            # Miscellaneous instructions
-            elif instruction.instruction == "ret":
-                self.SP -= 1
-                try:
-                    self.PC = self.return_address_stack.pop()
-                    if len(self.return_address_stack) < 8:
-                        self.return_address_stack.insert(0, 0)
-                except IndexError:
-                    raise EmptyReturnStack(
-                        instruction.instruction, "Attempting to 'ret' while the return-address stack was empty."
-                    ) from IndexError
-
-            elif instruction.instruction == "reti":
-                self.PC = self._PC - 1
-                self.CARRY = self._CARRY
-                self.ZERO = self._ZERO
-                self.IREN = True
-                self.IR = False
-
-            elif instruction.instruction == "enai":
-                self.IREN = True
-
-            elif instruction.instruction == "disi":
-                self.IREN = False
-
-            elif instruction.instruction == "wait":
-                self.WAIT = True
-
-            elif instruction.instruction == "stby":
-                self.STBY = True
-
-            # Catch any unknown instructions
-            else:
+            opcode = decode_opcode(instruction)
+            if opcode == OP_INVALID:
                 raise InvalidInstruction(instruction.instruction, "Unknown instruction")
+            try:
+                self._dispatch[opcode](self, instruction.rd, instruction.op1, instruction.op2)
+            except _WatchpointTriggered:
+                pass
         else:
             raise InvalidInstruction("", "Empty instruction")
         return
 
+    # Arithmetic and logical instructions (register access)
+    def _add_register(self, rd, op1, op2):
+        self.r[rd] = self.check_range(self.r[op1] + self.r[op2])
+
+    def _addc_register(self, rd, op1, op2):
+        self.r[rd] = self.check_range(self.r[op1] + self.r[op2] + self.CARRY)
+
+    def _sub_register(self, rd, op1, op2):
+        self.r[rd] = self.check_range(self.r[op1] - self.r[op2])
+
+    def _subc_register(self, rd, op1, op2):
+        self.r[rd] = self.check_range(self.r[op1] - self.r[op2] - self.CARRY)
+
+    def _and_register(self, rd, op1, op2):
+        self.r[rd] = self.check_range(self.r[op1] & self.r[op2])
+
+    def _or_register(self, rd, op1, op2):
+        self.r[rd] = self.check_range(self.r[op1] | self.r[op2])
+
+    def _xor_register(self, rd, op1, op2):
+        self.r[rd] = self.check_range(self.r[op1] ^ self.r[op2])
+
+    def _mask_register(self, rd, op1, op2):
+        self.r[rd] = self.check_range(self.r[op1] & ~self.r[op2])
+
+    # Arithmetic and logical instructions (immediate access)
+    def _add_immediate(self, rd, op1, op2):
+        self.r[rd] = self.check_range(self.r[op1] + op2)
+
+    def _addc_immediate(self, rd, op1, op2):
+        self.r[rd] = self.check_range(self.r[op1] + op2 + self.CARRY)
+
+    def _sub_immediate(self, rd, op1, op2):
+        self.r[rd] = self.check_range(self.r[op1] - op2)
+
+    def _subc_immediate(self, rd, op1, op2):
+        self.r[rd] = self.check_range(self.r[op1] - op2 - self.CARRY)
+
+    def _and_immediate(self, rd, op1, op2):
+        self.r[rd] = self.check_range(self.r[op1] & op2)
+
+    def _or_immediate(self, rd, op1, op2):
+        self.r[rd] = self.check_range(self.r[op1] | op2)
+
+    def _xor_immediate(self, rd, op1, op2):
+        self.r[rd] = self.check_range(self.r[op1] ^ op2)
+
+    def _mask_immediate(self, rd, op1, op2):
+        self.r[rd] = self.check_range(self.r[op1] & ~op2)
+
+    # Shift instructions
+    def _shl(self, rd, op1, op2):
+        self.r[rd] = (self.r[op1] << op2) & 0xFF
+
+    def _shr(self, rd, op1, op2):
+        self.r[rd] = (self.r[op1] >> op2) & 0xFF
+
+    # Rotations are looked up in alu.SHIFT_RESULT, rotating by 8 is the identity and by 0 leaves rd untouched
+    def _rol(self, rd, op1, op2):
+        if op2:
+            self.r[rd] = SHIFT_RESULT[_ROL_OFFSET | (op2 & 0x7) << 8 | self.r[op1]]
+
+    def _ror(self, rd, op1, op2):
+        if op2:
+            self.r[rd] = SHIFT_RESULT[_ROR_OFFSET | (op2 & 0x7) << 8 | self.r[op1]]
+
+    # Memory and I/O instructions
+    def _ldm(self, rd, op1, op2):
+        self.check_data_memory_access(self.r[op1] + op2)
+        self.r[rd] = self.data_memory[self.r[op1] + op2]
+
+    def _stm(self, rd, op1, op2):
+        address = self.r[op1] + op2
+        self.check_data_memory_access(address)
+        self.data_memory[address] = self.r[rd]
+        self.data_memory_writes.written.add(address)
+
+    def _inp(self, rd, op1, op2):
+        self.r[rd] = self.IO_controller_register[self.r[op1] + op2]
+
+    def _out(self, rd, op1, op2):
+        address = self.r[op1] + op2
+        self.IO_controller_register[address] = self.r[rd]
+        self.IO_controller_register_writes.written.add(address)
+
+    # Replace _inp and _out once an IO device is attached, see attach_IO_device()
+    def _inp_mapped(self, rd, op1, op2):
+        address = self.r[op1] + op2
+        entry = self.IO_bus.devices[address]
+        if entry is None:
+            self.r[rd] = self.IO_controller_register[address]
+        else:
+            self.r[rd] = entry[0].read(address - entry[1]) & 0xFF
+
+    def _out_mapped(self, rd, op1, op2):
+        address = self.r[op1] + op2
+        entry = self.IO_bus.devices[address]
+        self.IO_controller_register[address] = self.r[rd]
+        self.IO_controller_register_writes.written.add(address)
+        if entry is not None:
+            entry[0].write(address - entry[1], self.r[rd])
+
+    # Replace the memory instructions while there are watchpoints, see add_watchpoint()
+    def _ldm_watched(self, rd, op1, op2):
+        address = self.r[op1] + op2
+        GumnutCore._ldm(self, rd, op1, op2)
+        if self.watchpoints.data_memory[address] & READ:
+            self._trigger_watchpoint(DATA_MEMORY, address, READ, self.data_memory[address])
+
+    def _stm_watched(self, rd, op1, op2):
+        address = self.r[op1] + op2
+        GumnutCore._stm(self, rd, op1, op2)
+        value = self.r[rd]
+        if self.watchpoints.data_memory[address] and self.watchpoints.matches(DATA_MEMORY, address, WRITE, value):
+            self._trigger_watchpoint(DATA_MEMORY, address, WRITE, value)
+
+    def _inp_watched(self, rd, op1, op2):
+        address = self.r[op1] + op2
+        if self.IO_bus is not None:
+            GumnutCore._inp_mapped(self, rd, op1, op2)
+        else:
+            GumnutCore._inp(self, rd, op1, op2)
+        if self.watchpoints.IO_controller_register[address] & READ:
+            self._trigger_watchpoint(IO_CONTROLLER_REGISTER, address, READ, self.r[rd])
+
+    def _out_watched(self, rd, op1, op2):
+        address = self.r[op1] + op2
+        if self.IO_bus is not None:
+            GumnutCore._out_mapped(self, rd, op1, op2)
+        else:
+            GumnutCore._out(self, rd, op1, op2)
+        value = self.r[rd]
+        watched = self.watchpoints.IO_controller_register[address]
+        if watched and self.watchpoints.matches(IO_CONTROLLER_REGISTER, address, WRITE, value):
+            self._trigger_watchpoint(IO_CONTROLLER_REGISTER, address, WRITE, value)
+
+    def _trigger_watchpoint(self, memory, address, access, value):
+        self.watchpoint_hit = WatchpointHit(memory, address, access, value, self.PC)
+        raise _WATCHPOINT_TRIGGERED
+
+    # Branch instructions
+    def _branch(self, op2):
+        if op2 & (0x80):
+            self.PC = self.PC + (op2 - 0xFF) - 1
+        else:
+            self.PC = self.PC + op2
+
+    def _bz(self, rd, op1, op2):
+        if self.ZERO:
+            self._branch(op2)
+
+    def _bnz(self, rd, op1, op2):
+        if not self.ZERO:
+            self._branch(op2)
+
+    def _bc(self, rd, op1, op2):
+        if self.CARRY:
+            self._branch(op2)
+
+    def _bnc(self, rd, op1, op2):
+        if not self.CARRY:
+            self._branch(op2)
+
+    # Jump instructions
+    def _jmp(self, rd, op1, op2):
+        self.PC = op2 - 1
+
+    def _jsb(self, rd, op1, op2):
+        if len(self.return_address_stack) >= 8:
+            self.return_address_stack.pop(0)
+        self.return_address_stack.append(self.PC)
+        self.SP += 1
+        self.PC = op2 - 1
+
+    # Miscellaneous instructions
+    def _ret(self, rd, op1, op2):
+        self.SP -= 1
+        try:
+            self.PC = self.return_address_stack.pop()
+            if len(self.return_address_stack) < 8:
+                self.return_address_stack.insert(0, 0)
+        except IndexError:
+            raise EmptyReturnStack(
+                "ret", "Attempting to 'ret' while the return-address stack was empty."
+            ) from IndexError
+
+    def _reti(self, rd, op1, op2):
+        self.PC = self._PC - 1
+        self.CARRY = self._CARRY
+        self.ZERO = self._ZERO
+        self.IREN = True
+        self.IR = False
+
+    def _enai(self, rd, op1, op2):
+        self.IREN = True
+
+    def _disi(self, rd, op1, op2):
+        self.IREN = False
+
+    def _wait(self, rd, op1, op2):
+        self.WAIT = True
+
+    def _stby(self, rd, op1, op2):
+        self.STBY = True
+
+    # Catch any unknown instructions
+    def _invalid(self, rd, op1, op2):
+        instruction = self.instruction.instruction if self.instruction else ""
+        raise InvalidInstruction(instruction, "Unknown instruction")
+
+    # Handlers indexed by opcode, see gumnut_simulator.decoder.OPCODES
+    _dispatch = (
+        _add_register,
+        _addc_register,
+        _sub_register,
+        _subc_register,
+        _and_register,
+        _or_register,
+        _xor_register,
+        _mask_register,
+        _add_immediate,
+        _addc_immediate,
+        _sub_immediate,
+        _subc_immediate,
+        _and_immediate,
+        _or_immediate,
+        _xor_immediate,
+        _mask_immediate,
+        _shl,
+        _shr,
+        _rol,
+        _ror,
+        _ldm,
+        _stm,
+        _inp,
+        _out,
+        _bz,
+        _bnz,
+        _bc,
+        _bnc,
+        _jmp,
+        _jsb,
+        _ret,
+        _reti,
+        _enai,
+        _disi,
+        _wait,
+        _stby,
+        _invalid,
+    )
+
     def update_PC(self):
         """Update the PC by adding 1"""
         self.PC += 1
@@ -291,6 +773,8 @@ class GumnutCore:
     def step(self):
         """Perform a single step"""
         if self.IREN and self.IR:
+            if self.profiler is not None:
+                self.profiler.interrupt()
             self.IREN = False
             self.WAIT = False
             self.STBY = False
@@ -298,14 +782,136 @@ class GumnutCore:
             self._CARRY = self.CARRY
             self._ZERO = self.ZERO
             self.PC = 1
+            if self.tracer is not None:
+                self.tracer.record_interrupt(self, self._PC)
         elif not self.STBY and not self.WAIT:
-            objectcode = self.fetch()
-            self.instruction = self.decoder.decode_instruction(objectcode)
-            self.execute(self.instruction)
+            decoded = self.fetch_decoded()
+            if self.profiler is not None:
+                self.profiler.count(self.PC, decoded)
+            if self.tracer is not None:
+                PC, base = self.PC, self.r[decoded.op1]
+            self.instruction = decoded.instruction
+            try:
+                self._dispatch[decoded.opcode](self, decoded.rd, decoded.op1, decoded.op2)
+            except _WatchpointTriggered:
+                pass
             self.r[0] = 0
+            if self.tracer is not None:
+                self.tracer.record(self, PC, decoded, base)
             self.update_PC()
+        elif self.tracer is not None:
+            self.tracer.skip()
         return
 
+    def is_idle(self):
+        """Return True if the core is in WAIT or STBY without a pending interrupt, so steps do nothing"""
+        return (self.STBY or self.WAIT) and not (self.IREN and self.IR)
+
+    def is_halted(self):
+        """Return True if the core is in WAIT or STBY with interrupts disabled, which nothing but a reset ends"""
+        return (self.STBY or self.WAIT) and not self.IREN
+
+    def fast_forward(self, max_steps):
+        """
+        Skip up to ``max_steps`` idle steps at once
+
+        Leaves the core in the state calling ``step()`` ``max_steps`` times
+        would, as long as no interrupt is triggered in between.
+
+        :return: The number of steps skipped, 0 unless the core is idle
+        """
+        if max_steps <= 0 or not self.is_idle():
+            return 0
+        if self.tracer is not None:
+            self.tracer.step += max_steps
+        return max_steps
+
+    def run(self, max_steps, stop_on=()):
+        """
+        Perform up to ``max_steps`` steps in a tight loop
+
+        The core is left in exactly the state the same number of calls to
+        ``step()`` would leave it in. The run stops early after a step that
+        ends on an address contained in ``stop_on``, that leaves the core in
+        WAIT or STBY without a pending interrupt, or that raises an
+        exception. Exceptions are not propagated but returned.
+
+        A step accessing a watched address (see ``add_watchpoint()``) ends
+        the run as well.
+
+        :return: ``RunResult(reason, steps, previous_PC, exception)`` with the
+                 number of completed steps and the PC before the last step
+        """
+        self.watchpoint_hit = None
+        if self.profiler is not None or self.tracer is not None:
+            return self._run_stepwise(max_steps, stop_on)
+        if self.loop_detector is not None:
+            return self.loop_detector.run(max_steps, stop_on)
+        if self.translator is not None:
+            return self.translator.run(max_steps, stop_on)
+
+        dispatch = self._dispatch
+        decoded_memory = self.decoded_instruction_memory
+        size = self.instruction_memory_size
+        r = self.r
+        steps = 0
+        previous_PC = None
+        try:
+            while steps < max_steps:
+                previous_PC = PC = self.PC
+                if (self.IREN and self.IR) or self.STBY or self.WAIT:
+                    self.step()
+                else:
+                    decoded = decoded_memory[PC] if 0 <= PC < size else None
+                    if decoded is None:
+                        decoded = self.fetch_decoded()
+                    self.instruction = decoded.instruction
+                    dispatch[decoded.opcode](self, decoded.rd, decoded.op1, decoded.op2)
+                    r[0] = 0
+                    self.update_PC()
+                steps += 1
+
+                if self.PC in stop_on:
+                    return RunResult(StopReason.breakpoint, steps, previous_PC, None)
+                if (self.STBY or self.WAIT) and not (self.IREN and self.IR):
+                    reason = StopReason.stby if self.STBY else StopReason.wait
+                    return RunResult(reason, steps, previous_PC, None)
+        except _WatchpointTriggered:
+            return self.finish_watched_step(steps, previous_PC)
+        except Exception as e:  # pylint: disable=broad-except
+            return RunResult(StopReason.exception, steps, previous_PC, e)
+        return RunResult(StopReason.budget, steps, previous_PC, None)
+
+    def finish_watched_step(self, steps, previous_PC):
+        """Complete the step interrupted by a watchpoint after ``steps`` steps of a run and return its result"""
+        try:
+            self.r[0] = 0
+            self.update_PC()
+        except Exception as e:  # pylint: disable=broad-except
+            return RunResult(StopReason.exception, steps, previous_PC, e)
+        return RunResult(StopReason.watchpoint, steps + 1, previous_PC, None)
+
+    def _run_stepwise(self, max_steps, stop_on):
+        """Same as ``run()``, but calls ``step()`` for every step"""
+        steps = 0
+        previous_PC = None
+        try:
+            while steps < max_steps:
+                previous_PC = self.PC
+                self.step()
+                steps += 1
+
+                if self.watchpoint_hit is not None:
+                    return RunResult(StopReason.watchpoint, steps, previous_PC, None)
+                if self.PC in stop_on:
+                    return RunResult(StopReason.breakpoint, steps, previous_PC, None)
+                if (self.STBY or self.WAIT) and not (self.IREN and self.IR):
+                    reason = StopReason.stby if self.STBY else StopReason.wait
+                    return RunResult(reason, steps, previous_PC, None)
+        except Exception as e:  # pylint: disable=broad-except
+            return RunResult(StopReason.exception, steps, previous_PC, e)
+        return RunResult(StopReason.budget, steps, previous_PC, None)
+
     def check_range(self, result):
         """Check the result of the current instruction and set flags"""
         if result > 0xFF:
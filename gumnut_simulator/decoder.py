@@ -1,7 +1,35 @@
+import sys
+import time
 from collections import namedtuple
 
 
 INSTR = namedtuple("INSTR", "instruction fn rd op1 op2 access")
+DecodedInstruction = namedtuple("DecodedInstruction", "opcode rd op1 op2 instruction")
+DecodeTableStats = namedtuple("DecodeTableStats", "build_time entries unique_entries size")
+
+OBJECTCODE_MASK = 0x3FFFF  # Object codes are 18 bits wide
+
+_ALU_INSTRUCTIONS = ("add", "addc", "sub", "subc", "and", "or", "xor", "mask")
+_SHIFT_INSTRUCTIONS = ("shl", "shr", "rol", "ror", None, None, None, None)
+_MEMORY_INSTRUCTIONS = ("ldm", "stm", "inp", "out")
+_BRANCH_INSTRUCTIONS = ("bz", "bnz", "bc", "bnc")
+_JUMP_INSTRUCTIONS = ("jmp", "jsb")
+_MISC_INSTRUCTIONS = ("ret", "reti", "enai", "disi", "wait", "stby", None, None)
+
+# Integer opcodes: index of (instruction, access) in this tuple. The access
+# mode is only significant for the arithmetic/logical instructions.
+OPCODES = tuple((instruction, "register") for instruction in _ALU_INSTRUCTIONS)
+OPCODES += tuple((instruction, "immediate") for instruction in _ALU_INSTRUCTIONS)
+OPCODES += tuple((instruction, None) for instruction in _SHIFT_INSTRUCTIONS if instruction)
+OPCODES += tuple((instruction, None) for instruction in _MEMORY_INSTRUCTIONS)
+OPCODES += tuple((instruction, None) for instruction in _BRANCH_INSTRUCTIONS)
+OPCODES += tuple((instruction, None) for instruction in _JUMP_INSTRUCTIONS)
+OPCODES += tuple((instruction, None) for instruction in _MISC_INSTRUCTIONS if instruction)
+OP_INVALID = len(OPCODES)
+OPCODE = {key: opcode for opcode, key in enumerate(OPCODES)}
+
+_decode_table = None
+_decode_table_stats = None
 
 
 def _extract_bitfield(source, width, offset=0):
@@ -13,8 +41,88 @@ def _extract_bitfield(source, width, offset=0):
     return result
 
 
+def _decode_table_entry(objectcode):
+    """Decode a single instruction straight from its bitfields (used to build the decode table)"""
+    rd = (objectcode >> 11) & 0x7
+    op1 = (objectcode >> 8) & 0x7
+    if objectcode < 0x20000:  # Arithmetic/Logical immediate access
+        fn = (objectcode >> 14) & 0x7
+        return INSTR(_ALU_INSTRUCTIONS[fn], fn, rd, op1, objectcode & 0xFF, "immediate")
+    if objectcode < 0x30000:  # Memory and I/O instructions
+        fn = (objectcode >> 14) & 0x3
+        return INSTR(_MEMORY_INSTRUCTIONS[fn], fn, rd, op1, objectcode & 0xFF, None)
+    if objectcode < 0x38000:  # Shift instructions
+        fn = objectcode & 0x7
+        return INSTR(_SHIFT_INSTRUCTIONS[fn], fn, rd, op1, (objectcode >> 5) & 0x7, None)
+    if objectcode < 0x3C000:  # Arithmetic/Logical register access
+        fn = objectcode & 0x7
+        return INSTR(_ALU_INSTRUCTIONS[fn], fn, rd, op1, (objectcode >> 5) & 0x7, "register")
+    if objectcode < 0x3E000:  # Jump instructions
+        fn = (objectcode >> 12) & 0x1
+        return INSTR(_JUMP_INSTRUCTIONS[fn], fn, 0, 0, objectcode & 0xFFF, None)
+    if objectcode < 0x3F000:  # Branch instructions
+        fn = (objectcode >> 10) & 0x3
+        return INSTR(_BRANCH_INSTRUCTIONS[fn], fn, 0, 0, objectcode & 0xFF, None)
+    fn = (objectcode >> 8) & 0x7  # Misc instructions
+    return INSTR(_MISC_INSTRUCTIONS[fn], fn, 0, 0, 0, None)
+
+
+def build_decode_table():
+    """
+    Build the table of all 2^18 decoded instructions
+
+    The table is built only once per process and shared by all decoders
+    created with ``use_table=True``. Equal instructions (e.g. object codes
+    which only differ in unused bits) share a single immutable ``INSTR``.
+
+    :return: A tuple indexed by object code
+    """
+    global _decode_table, _decode_table_stats
+    if _decode_table is None:
+        start = time.perf_counter()
+        unique = dict()
+        table = tuple(unique.setdefault(entry, entry) for entry in map(_decode_table_entry, range(OBJECTCODE_MASK + 1)))
+        build_time = time.perf_counter() - start
+
+        size = sys.getsizeof(table) + sum(sys.getsizeof(entry) for entry in unique)
+        _decode_table_stats = DecodeTableStats(build_time, len(table), len(unique), size)
+        _decode_table = table
+    return _decode_table
+
+
+def get_decode_table_stats():
+    """
+    Return build statistics of the shared decode table
+
+    :return: ``DecodeTableStats(build_time, entries, unique_entries, size)``
+             with ``build_time`` in seconds and the approximate ``size`` in
+             bytes, or ``None`` if the table hasn't been built yet
+    """
+    return _decode_table_stats
+
+
+def decode_opcode(instruction):
+    """Return the integer opcode of a decoded instruction or ``OP_INVALID``"""
+    opcode = OPCODE.get((instruction.instruction, instruction.access))
+    if opcode is None:
+        opcode = OPCODE.get((instruction.instruction, None), OP_INVALID)
+    return opcode
+
+
 class GumnutDecoder:
-    def __init__(self):
+    """
+    Decoder for Gumnut object code
+
+    :param use_table: Decode by looking up a shared precomputed table
+                      instead of extracting the bitfields on every call.
+    :param eager: Build the table right away instead of on first use.
+    """
+
+    def __init__(self, use_table=False, eager=False):
+        self.use_table = use_table
+        if use_table and eager:
+            build_decode_table()
+
         self.INSTR = INSTR("", "", "", "", "", "")
         self.instruction = INSTR(0, 0, 0, 0, 0, 0)
 
@@ -41,6 +149,9 @@ class GumnutDecoder:
 
     def decode_instruction(self, objectcode):
         """Decode a single instruction and return extracted information"""
+        if self.use_table:
+            return (_decode_table or build_decode_table())[objectcode & OBJECTCODE_MASK]
+
         current_instruction = objectcode
         self.instruction = INSTR(0, 0, 0, 0, 0, 0)
 
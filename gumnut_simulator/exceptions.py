@@ -82,3 +82,27 @@ class ReturnAddressStackOverflow(Error):
     Get's raised when trying jump into a subroutine although the
     return address stack is already full.
     """
+
+
+class InvalidSessionData(Error):
+
+    """
+    Get's raised when loading a saved session which is truncated, has an
+    unknown format version or doesn't fit the simulated core.
+    """
+
+
+class InvalidTraceFile(Error):
+
+    """
+    Get's raised when reading a trace file which wasn't written by the
+    ``TraceWriter`` of this format version.
+    """
+
+
+class InfiniteLoop(Error):
+
+    """
+    Get's raised when the loop detector finds the CPU in a state it was in
+    before, so the program will repeat the same steps forever.
+    """
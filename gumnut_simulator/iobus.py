@@ -0,0 +1,141 @@
+from collections import deque
+
+
+DEFAULT_UART_CAPACITY = 4096
+
+
+class Device:
+    """
+    Base class of devices attached to an ``IOBus``
+
+    ``read()`` and ``write()`` are only called for ``inp`` and ``out``
+    instructions accessing the address range of the device, with the offset
+    of the address within the range. ``flush()`` is called once at the end
+    of every run of the simulator, so buffered devices can pass on their
+    data in bulk.
+    """
+
+    def read(self, offset):
+        """Return the value read by ``inp``"""
+        return 0
+
+    def write(self, offset, value):
+        """Take the value written by ``out``"""
+
+    def flush(self):
+        """Pass on buffered data"""
+
+    def reset(self):
+        """Go back to the state after power on, called by ``GumnutCore.reset()``"""
+
+
+class CallbackDevice(Device):
+    """
+    Device calling ``on_read(offset)`` and ``on_write(offset, value)``
+
+    Without ``on_read`` the device returns the value last written to the
+    address, as the plain IO controller register would.
+    """
+
+    def __init__(self, length=1, on_read=None, on_write=None):
+        self.values = bytearray(length)
+        self.on_read = on_read
+        self.on_write = on_write
+
+    def read(self, offset):
+        if self.on_read is not None:
+            return self.on_read(offset)
+        return self.values[offset]
+
+    def write(self, offset, value):
+        self.values[offset] = value
+        if self.on_write is not None:
+            self.on_write(offset, value)
+
+    def reset(self):
+        self.values[:] = bytes(len(self.values))
+
+
+class UART(Device):
+    """
+    Serial port occupying two addresses, data at offset 0 and status at offset 1
+
+    Bytes written to the data register are collected in a ring buffer of
+    ``capacity`` bytes, the oldest bytes are dropped if it overflows. On
+    ``flush()`` the buffered bytes are passed to ``on_output(data)`` at
+    once. Reading the data register returns the next byte passed to
+    ``feed()`` (or 0), reading the status register returns 1 while input is
+    available.
+    """
+
+    DATA = 0
+    STATUS = 1
+
+    def __init__(self, capacity=DEFAULT_UART_CAPACITY, on_output=None):
+        self.output = deque(maxlen=capacity)
+        self.input = deque()
+        self.on_output = on_output
+
+    def read(self, offset):
+        if offset == self.DATA:
+            return self.input.popleft() if self.input else 0
+        return 1 if self.input else 0
+
+    def write(self, offset, value):
+        if offset == self.DATA:
+            self.output.append(value)
+
+    def feed(self, data):
+        """Queue ``data`` to be read from the data register"""
+        self.input.extend(data)
+
+    def drain(self):
+        """Return and remove all buffered output"""
+        data = bytes(self.output)
+        self.output.clear()
+        return data
+
+    def flush(self):
+        if self.on_output is not None and self.output:
+            self.on_output(self.drain())
+
+    def reset(self):
+        self.output.clear()
+        self.input.clear()
+
+
+class IOBus:
+    """
+    Map devices into the IO controller register address space
+
+    ``devices`` holds ``(device, start)`` for every mapped address and
+    ``None`` for all others, which keep reading and writing the plain IO
+    controller register.
+    """
+
+    def __init__(self, size):
+        self.devices = [None] * size
+        self.attached = list()
+
+    def attach(self, device, start, length=1):
+        """Map ``device`` to the ``length`` addresses from ``start`` on"""
+        if start < 0 or length < 1 or start + length > len(self.devices):
+            raise ValueError("Address range 0x%02X-0x%02X is out of range" % (start, start + length - 1))
+        if any(entry is not None for entry in self.devices[start : start + length]):
+            raise ValueError("Address range 0x%02X-0x%02X is already mapped" % (start, start + length - 1))
+        self.devices[start : start + length] = [(device, start)] * length
+        self.attached.append(device)
+
+    def detach(self, device):
+        self.attached.remove(device)
+        for address, entry in enumerate(self.devices):
+            if entry is not None and entry[0] is device:
+                self.devices[address] = None
+
+    def flush(self):
+        for device in self.attached:
+            device.flush()
+
+    def reset(self):
+        for device in self.attached:
+            device.reset()
@@ -0,0 +1,197 @@
+from array import array
+
+from gumnut_simulator.decoder import OPCODE
+from gumnut_simulator.simulator import SimulatorState
+
+
+DEFAULT_CAPACITY = 100000
+DEFAULT_CHECKPOINT_INTERVAL = 1000
+
+# Instructions writing their destination register
+_REGISTER_WRITES = frozenset(
+    list(range(OPCODE["add", "register"], OPCODE["mask", "immediate"] + 1))
+    + [OPCODE[instruction, None] for instruction in ("shl", "shr", "rol", "ror", "ldm", "inp")]
+)
+_STM, _OUT, _JSB, _RET = (OPCODE[instruction, None] for instruction in ("stm", "out", "jsb", "ret"))
+
+# Kinds of memory writes and return address stack changes
+_NONE, _DATA_MEMORY, _IO_REGISTER = 0, 1, 2
+_PUSH, _POP = 1, 2
+
+# Bits of the packed flags
+_FLAGS = ("CARRY", "ZERO", "WAIT", "STBY", "IREN", "IR", "_CARRY", "_ZERO")
+
+
+class Journal:
+    """
+    Bounded journal of the state changes of a ``GumnutSimulator``
+
+    Before every step only the state the step can change is recorded: the
+    PC, SP and flags, the destination register, the data memory byte or IO
+    register written by ``stm``/``out`` and the return address dropped by
+    ``jsb``/``ret``. The entries live in a ring of fixed size arrays, so the
+    oldest entries are overwritten once ``capacity`` steps are recorded.
+    Every ``checkpoint_interval`` steps a full snapshot is kept as well,
+    which bounds the number of entries to undo when stepping back far.
+
+    Changes made outside of ``step()``/``run()`` (e.g. writing registers of
+    the CPU directly) are not recorded.
+    """
+
+    def __init__(self, simulator, capacity=DEFAULT_CAPACITY, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL):
+        self.simulator = simulator
+        self.capacity = capacity
+        self.checkpoint_interval = checkpoint_interval
+        self.PC = array("i", bytes(capacity * array("i").itemsize))
+        self.SP = array("i", self.PC)
+        self.saved_PC = array("i", self.PC)
+        self.data_memory_access_addr = array("i", self.PC)
+        self.previous_PC = array("i", self.PC)
+        self.steps = array("q", bytes(capacity * array("q").itemsize))
+        self.state = bytearray(capacity)
+        self.flags = bytearray(capacity)
+        self.register = bytearray(capacity)
+        self.register_value = bytearray(capacity)
+        self.memory = bytearray(capacity)
+        self.memory_address = bytearray(capacity)
+        self.memory_value = bytearray(capacity)
+        self.stack = bytearray(capacity)
+        self.stack_value = array("i", self.PC)
+        self.instruction = [None] * capacity
+        self.checkpoints = dict()
+        # Entries from position first up to count are available
+        self.first = 0
+        self.count = 0
+
+    def __len__(self):
+        """Number of steps which can be undone"""
+        return self.count - self.first
+
+    def clear(self):
+        self.checkpoints.clear()
+        self.first = 0
+        self.count = 0
+
+    def record(self, previous_PC, steps, state):
+        """Record the state which the next step of the CPU may change"""
+        cpu = self.simulator.CPU
+        position = self.count
+        if position % self.checkpoint_interval == 0:
+            # Checkpoints hold the CPU state, the simulator counters are part of the entries
+            for stale in [stale for stale in self.checkpoints if stale < self.first]:
+                del self.checkpoints[stale]
+            self.checkpoints[position] = cpu.snapshot()
+        i = position % self.capacity
+
+        PC = cpu.PC
+        self.PC[i] = PC
+        self.SP[i] = cpu.SP
+        self.saved_PC[i] = cpu._PC  # pylint: disable=protected-access
+        self.data_memory_access_addr[i] = cpu.data_memory_access_addr
+        self.previous_PC[i] = previous_PC
+        self.steps[i] = steps
+        self.state[i] = state
+        self.instruction[i] = cpu.instruction
+        packed = 0
+        for bit, flag in enumerate(_FLAGS):
+            if getattr(cpu, flag):
+                packed |= 1 << bit
+        self.flags[i] = packed
+
+        self.register[i] = 0
+        self.memory[i] = _NONE
+        self.stack[i] = _NONE
+        if not (cpu.IREN and cpu.IR) and not cpu.STBY and not cpu.WAIT and 0 <= PC < cpu.instruction_memory_size:
+            decoded = cpu.decoded_instruction_memory[PC]
+            if decoded is None:
+                decoded = cpu.decode(cpu.instruction_memory[PC])
+            opcode = decoded.opcode
+            if opcode in _REGISTER_WRITES:
+                self.register[i] = decoded.rd
+                self.register_value[i] = cpu.r[decoded.rd]
+            elif opcode == _STM or opcode == _OUT:
+                address = cpu.r[decoded.op1] + decoded.op2
+                memory = cpu.data_memory if opcode == _STM else cpu.IO_controller_register
+                if 0 <= address < len(memory):
+                    self.memory[i] = _DATA_MEMORY if opcode == _STM else _IO_REGISTER
+                    self.memory_address[i] = address
+                    self.memory_value[i] = memory[address]
+            elif opcode == _JSB:
+                self.stack[i] = _PUSH
+                self.stack_value[i] = cpu.return_address_stack[0]
+            elif opcode == _RET:
+                self.stack[i] = _POP
+                self.stack_value[i] = cpu.return_address_stack[-1]
+        self.count = position + 1
+        self.first = max(self.first, self.count - self.capacity)
+
+    def discard(self):
+        """Drop the last entry, recorded for a step which raised and isn't counted"""
+        self.count -= 1
+        self.checkpoints.pop(self.count, None)
+
+    def step_back(self, n=1):
+        """
+        Undo the last ``n`` recorded steps
+
+        :return: The number of steps actually undone
+        """
+        n = min(n, len(self))
+        target = self.count - n
+        # Start from the closest checkpoint if that saves undoing entries
+        checkpoints = [position for position in self.checkpoints if target <= position < self.count]
+        if checkpoints:
+            position = min(checkpoints)
+            self.simulator.CPU.restore(self.checkpoints[position])
+            self._restore_counters(position % self.capacity)
+            self.count = position
+        while self.count > target:
+            self._undo()
+        for position in [position for position in self.checkpoints if position > self.count]:
+            del self.checkpoints[position]
+        return n
+
+    def find_breakpoint(self, addresses):
+        """Return the number of steps back to the last recorded state with the PC at one of ``addresses``"""
+        for n in range(1, len(self) + 1):
+            if self.PC[(self.count - n) % self.capacity] in addresses:
+                return n
+        return None
+
+    def _undo(self):
+        self.count -= 1
+        i = self.count % self.capacity
+        cpu = self.simulator.CPU
+
+        cpu.PC = self.PC[i]
+        cpu.SP = self.SP[i]
+        cpu._PC = self.saved_PC[i]  # pylint: disable=protected-access
+        cpu.data_memory_access_addr = self.data_memory_access_addr[i]
+        cpu.instruction = self.instruction[i]
+        packed = self.flags[i]
+        for bit, flag in enumerate(_FLAGS):
+            setattr(cpu, flag, bool(packed & (1 << bit)))
+
+        if self.register[i]:
+            cpu.r[self.register[i]] = self.register_value[i]
+        if self.memory[i] == _DATA_MEMORY:
+            cpu.data_memory[self.memory_address[i]] = self.memory_value[i]
+            cpu.data_memory_writes.written.add(self.memory_address[i])
+        elif self.memory[i] == _IO_REGISTER:
+            cpu.IO_controller_register[self.memory_address[i]] = self.memory_value[i]
+            cpu.IO_controller_register_writes.written.add(self.memory_address[i])
+        if self.stack[i] == _PUSH:
+            cpu.return_address_stack.pop()
+            cpu.return_address_stack.insert(0, self.stack_value[i])
+        elif self.stack[i] == _POP:
+            cpu.return_address_stack.pop(0)
+            cpu.return_address_stack.append(self.stack_value[i])
+
+        self._restore_counters(i)
+
+    def _restore_counters(self, i):
+        simulator = self.simulator
+        simulator.previous_PC = self.previous_PC[i]
+        simulator.steps = self.steps[i]
+        simulator.state = SimulatorState(self.state[i])
+        simulator.exception = None
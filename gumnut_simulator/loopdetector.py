@@ -0,0 +1,133 @@
+from gumnut_simulator.core import RunResult, StopReason, _WatchpointTriggered
+from gumnut_simulator.decoder import OPCODE
+from gumnut_simulator.exceptions import InfiniteLoop
+
+
+_INP = OPCODE["inp", None]
+
+
+class LoopDetector:
+    """
+    Execution engine which proves infinite loops by finding repeated states
+
+    The Gumnut is deterministic, so once the complete machine state
+    (registers, flags, PC, SP, return address stack, saved interrupt state,
+    data memory and IO controller register) repeats, the program repeats
+    the same steps forever. The state is compared whenever the PC doesn't
+    move forward, i.e. after backward branches and jumps, returns and
+    interrupts, which every loop passes.
+
+    States are compared using Brent's cycle detection: a single saved state
+    is compared with every new one and replaced whenever the number of
+    comparisons since saving it reaches the next power of two, so a loop
+    is found at most about twice its length after it was entered, with
+    constant memory. The PC and the general purpose registers are compared
+    first, the remaining registers, flags and memories only when those
+    match, so the comparisons are exact but mostly cheap.
+
+    Input from outside can break a loop. The saved state is dropped by
+    ``clear()`` on interrupts, IO register writes and uploads, and after
+    ``inp`` instructions while IO devices are attached. While ``active``
+    is False no loops are reported, e.g. while scheduled events are
+    pending.
+    """
+
+    def __init__(self, core):
+        self.core = core
+        self.active = True
+        self.clear()
+
+    def clear(self):
+        """Drop the saved state"""
+        self.saved = None
+        self.saved_PC = None
+        self.saved_r = None
+        self.power = 1
+        self.distance = 0
+
+    def _registers(self):
+        core = self.core
+        # pylint: disable=protected-access
+        return (
+            core.PC,
+            core.SP,
+            core.CARRY,
+            core.ZERO,
+            core.WAIT,
+            core.STBY,
+            core.IREN,
+            core.IR,
+            core._PC,
+            core._CARRY,
+            core._ZERO,
+            *core.return_address_stack,
+        )
+
+    def check(self):
+        """Compare the current state with the saved one, returns True if it repeated"""
+        core = self.core
+        if core.PC == self.saved_PC and core.r == self.saved_r:
+            registers, data_memory, IO_controller_register = self.saved
+            if (
+                registers == self._registers()
+                and data_memory == core.data_memory
+                and IO_controller_register == core.IO_controller_register
+            ):
+                return True
+        self.distance += 1
+        if self.distance >= self.power:
+            self.saved = (self._registers(), bytes(core.data_memory), bytes(core.IO_controller_register))
+            self.saved_PC = core.PC
+            self.saved_r = list(core.r)
+            self.power *= 2
+            self.distance = 0
+        return False
+
+    def run(self, max_steps, stop_on=()):
+        """
+        Behaves like ``GumnutCore.run``, but stops on provable infinite loops
+
+        :return: ``RunResult(StopReason.loop, steps, previous_PC, InfiniteLoop)``
+                 after the step which repeated a state, which leaves the PC
+                 at the start of the loop
+        """
+        core = self.core
+        dispatch = core._dispatch  # pylint: disable=protected-access
+        decoded_memory = core.decoded_instruction_memory
+        size = core.instruction_memory_size
+        r = core.r
+        check = self.check if self.active else None
+        # Reads from devices are input, no opcode matches without a bus
+        clearing_opcode = _INP if core.IO_bus is not None else None
+        steps = 0
+        previous_PC = None
+        try:
+            while steps < max_steps:
+                previous_PC = PC = core.PC
+                if (core.IREN and core.IR) or core.STBY or core.WAIT:
+                    core.step()
+                else:
+                    decoded = decoded_memory[PC] if 0 <= PC < size else None
+                    if decoded is None:
+                        decoded = core.fetch_decoded()
+                    core.instruction = decoded.instruction
+                    dispatch[decoded.opcode](core, decoded.rd, decoded.op1, decoded.op2)
+                    r[0] = 0
+                    core.update_PC()
+                    if decoded.opcode == clearing_opcode:
+                        self.clear()
+                steps += 1
+
+                if core.PC <= PC and check is not None and check():
+                    exception = InfiniteLoop("0x%03X" % core.PC, "Provable infinite loop at PC 0x%03X" % core.PC)
+                    return RunResult(StopReason.loop, steps, previous_PC, exception)
+                if core.PC in stop_on:
+                    return RunResult(StopReason.breakpoint, steps, previous_PC, None)
+                if (core.STBY or core.WAIT) and not (core.IREN and core.IR):
+                    reason = StopReason.stby if core.STBY else StopReason.wait
+                    return RunResult(reason, steps, previous_PC, None)
+        except _WatchpointTriggered:
+            return core.finish_watched_step(steps, previous_PC)
+        except Exception as e:  # pylint: disable=broad-except
+            return RunResult(StopReason.exception, steps, previous_PC, e)
+        return RunResult(StopReason.budget, steps, previous_PC, None)
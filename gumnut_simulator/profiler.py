@@ -0,0 +1,121 @@
+from array import array
+from collections import namedtuple
+
+from gumnut_simulator.decoder import OPCODE, OPCODES, OP_INVALID
+
+
+HotSpot = namedtuple("HotSpot", "line address count source")
+
+# Address the CPU jumps to on an interrupt
+INTERRUPT_ADDRESS = 1
+
+# Frames kept on the call stack, like the return address stack of the CPU
+MAX_STACK_DEPTH = 8
+
+_JSB, _RET, _RETI = (OPCODE[instruction, None] for instruction in ("jsb", "ret", "reti"))
+
+
+class Profiler:
+    """
+    Execution counts of a ``GumnutCore``
+
+    ``pc_counts`` holds the number of times the instruction at every
+    address was executed, ``opcode_counts`` the number of executions of
+    every opcode (see ``gumnut_simulator.decoder.OPCODES``, the last entry
+    counts invalid instructions). Besides that the number of steps is kept
+    for every call stack, which is tracked by following ``jsb`` and
+    interrupts into and ``ret``/``reti`` out of subroutines.
+
+    Steps in which the CPU is idle (STBY or WAIT) are not counted.
+    """
+
+    def __init__(self, instruction_memory_size):
+        self.pc_counts = array("q", bytes(instruction_memory_size * array("q").itemsize))
+        self.opcode_counts = array("q", bytes((OP_INVALID + 1) * array("q").itemsize))
+        self.stack_counts = dict()
+        self.stack = ()
+        self.interrupts = 0
+
+    def clear(self):
+        self.pc_counts[:] = array("q", bytes(len(self.pc_counts) * self.pc_counts.itemsize))
+        self.opcode_counts[:] = array("q", bytes(len(self.opcode_counts) * self.opcode_counts.itemsize))
+        self.stack_counts.clear()
+        self.stack = ()
+        self.interrupts = 0
+
+    def count(self, PC, decoded):
+        """Count the execution of the ``DecodedInstruction`` at address ``PC``"""
+        self.pc_counts[PC] += 1
+        opcode = decoded.opcode
+        self.opcode_counts[opcode] += 1
+        stack = self.stack
+        self.stack_counts[stack] = self.stack_counts.get(stack, 0) + 1
+        if opcode == _JSB:
+            self.stack = (stack + (decoded.op2,))[-MAX_STACK_DEPTH:]
+        elif opcode == _RET or opcode == _RETI:
+            self.stack = stack[:-1]
+
+    def interrupt(self):
+        """Count an interrupt, which calls the service routine"""
+        self.interrupts += 1
+        self.stack = (self.stack + (INTERRUPT_ADDRESS,))[-MAX_STACK_DEPTH:]
+
+    def get_opcode_counts(self):
+        """
+        Return the executions of every instruction which was executed at least once
+
+        :return: ``{'add immediate': 12, 'jsb': 3, ...}``
+        """
+        counts = dict()
+        for opcode, count in enumerate(self.opcode_counts):
+            if count:
+                instruction, access = OPCODES[opcode] if opcode < OP_INVALID else ("invalid", None)
+                counts[instruction if access is None else "%s %s" % (instruction, access)] = count
+        return counts
+
+
+def hot_spots(simulator, limit=None):
+    """
+    Map the execution counts of the profiler of ``simulator`` to source lines
+
+    :return: List of ``HotSpot(line, address, count, source)`` of all
+             executed addresses, the most executed first. Addresses without
+             a source line have line -1 and an empty source.
+    """
+    profiler = simulator.CPU.profiler
+    spots = list()
+    for address, count in enumerate(profiler.pc_counts):
+        if count:
+            line = simulator.line_of_address[address]
+            spots.append(HotSpot(line, address, count, _source_line(simulator, line)))
+    spots.sort(key=lambda spot: (-spot.count, spot.address))
+    return spots[:limit]
+
+
+def collapsed_stacks(simulator):
+    """
+    Return the steps per call stack in the collapsed stack format
+
+    Every line holds the semicolon separated frames, from ``main`` to the
+    innermost subroutine, and the number of steps, e.g. ``main;store 42``.
+    Subroutines are named after the label of their first instruction. The
+    lines can be fed to flame graph tools like ``flamegraph.pl``.
+    """
+    lines = list()
+    for stack, count in sorted(simulator.CPU.profiler.stack_counts.items()):
+        frames = ["main"] + [_frame_name(simulator, address) for address in stack]
+        lines.append("%s %d" % (";".join(frames), count))
+    return lines
+
+
+def _source_line(simulator, line):
+    field = simulator.lsom_map.get(line)
+    return field[0].strip() if field else ""
+
+
+def _frame_name(simulator, address):
+    source = _source_line(simulator, simulator.line_of_address[address])
+    label = source.split(";")[0].split(":")
+    if len(label) > 1 and label[0].strip():
+        return label[0].strip()
+    return "0x%03X" % address
@@ -0,0 +1,65 @@
+import heapq
+import itertools
+
+
+# Kinds of events
+INTERRUPT, IO_WRITE, CALLBACK = range(3)
+
+
+class Scheduler:
+    """
+    Events which happen when a ``GumnutSimulator`` reaches given step counts
+
+    An event due at step ``n`` happens once ``n`` steps have been executed,
+    before the next step. Events are kept in a heap ordered by their step
+    and the order they were added in, so runs only have to look at the
+    next one. Periodic events are added again ``period`` steps after they
+    happened, skipping periods which already passed.
+
+    Events either trigger an interrupt, write an IO controller register or
+    call ``callback(simulator)``.
+    """
+
+    def __init__(self):
+        # (step, sequence number, kind, arguments, period)
+        self.events = list()
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self.events)
+
+    def add(self, step, kind, arguments=(), period=None):
+        """Add an event of ``kind`` due at ``step``, repeated every ``period`` steps if given"""
+        if period is not None and period <= 0:
+            raise ValueError("The period of an event has to be positive")
+        heapq.heappush(self.events, (step, next(self._sequence), kind, arguments, period))
+
+    def clear(self):
+        self.events.clear()
+
+    def next_step(self):
+        """Return the step the next event is due at or ``None``"""
+        return self.events[0][0] if self.events else None
+
+    def fire_due(self, simulator):
+        """
+        Let all events due at the current step count of ``simulator`` happen
+
+        :return: The number of events which happened
+        """
+        events = self.events
+        steps = simulator.steps
+        fired = 0
+        while events and events[0][0] <= steps:
+            step, _, kind, arguments, period = heapq.heappop(events)
+            if period is not None:
+                step += period * ((steps - step) // period + 1)
+                heapq.heappush(events, (step, next(self._sequence), kind, arguments, period))
+            if kind == INTERRUPT:
+                simulator.trigger_interrupt()
+            elif kind == IO_WRITE:
+                simulator.set_IO_controller_register(*arguments)
+            else:
+                arguments[0](simulator)
+            fired += 1
+        return fired
@@ -0,0 +1,443 @@
+import asyncio
+import itertools
+import json
+import time
+
+from gumnut_simulator import watchpoints
+from gumnut_simulator.core import StopReason
+from gumnut_simulator.exceptions import Error
+from gumnut_simulator.simulator import GumnutSimulator
+
+
+# Steps a run executes before it lets other sessions take their turn
+DEFAULT_QUANTUM_STEPS = 5000
+DEFAULT_IDLE_TIMEOUT = 600
+DEFAULT_MAX_SESSIONS = 256
+# Per session memory limits
+DEFAULT_MAX_SOURCE_LENGTH = 64 * 1024
+DEFAULT_MAX_JOURNAL_CAPACITY = 100000
+
+# JSON-RPC 2.0 error codes, the ones above -32100 are specific to this server
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+UNKNOWN_SESSION = -32001
+LIMIT_EXCEEDED = -32002
+SIMULATION_ERROR = -32003
+
+WATCHPOINT_ACCESS = {
+    "read": watchpoints.READ,
+    "write": watchpoints.WRITE,
+    "read_write": watchpoints.READ | watchpoints.WRITE,
+}
+
+
+class RequestError(Exception):
+    """Error returned to the client as JSON-RPC error object"""
+
+    def __init__(self, code, message, data=None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.data = data
+
+    def as_dict(self):
+        error = {"code": self.code, "message": self.message}
+        if self.data is not None:
+            error["data"] = self.data
+        return error
+
+
+class Session:
+    def __init__(self, session_id, simulator):
+        self.id = session_id
+        self.simulator = simulator
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+        self.stop_requested = False
+        # Set to resume a run waiting for an interrupt
+        self.wakeup = asyncio.Event()
+
+
+class SimulationServer:
+    """
+    Serve many simulator sessions over JSON-RPC 2.0 on a single event loop
+
+    Requests and responses are JSON objects, one per line. Every connection
+    can use any number of sessions and requests of one connection are
+    handled concurrently, so a ``stop`` can interrupt a ``run`` sent
+    before. Methods (all except ``open`` take the ``session`` id):
+
+    * ``open(translate=False)``: Create a session, returns ``{'session': id}``
+    * ``close``
+    * ``setup(source)``, ``reset``
+    * ``step``, ``run(max_steps, wait_for_interrupt=False)``, ``stop``
+    * ``toggle_breakpoint(line)``, ``trigger_interrupt``,
+      ``set_IO_controller_register(address, value)``
+    * ``get_state``, ``get_changes(token=None)``
+    * ``enable_journal(capacity=None)``, ``step_back(n=1)``
+
+    Runs execute ``quantum_steps`` steps at a time and yield to the event
+    loop in between, so long runs don't block other sessions. Requests
+    changing a session wait for its run to end, queries don't. A run which
+    waits for interrupts is suspended while the CPU idles in WAIT or STBY
+    until ``trigger_interrupt`` is called, without spending any steps. Sessions
+    unused for ``idle_timeout`` seconds are closed. The source length and
+    journal capacity of every session are limited, as is the number of
+    sessions.
+    """
+
+    def __init__(
+        self,
+        quantum_steps=DEFAULT_QUANTUM_STEPS,
+        idle_timeout=DEFAULT_IDLE_TIMEOUT,
+        max_sessions=DEFAULT_MAX_SESSIONS,
+        max_source_length=DEFAULT_MAX_SOURCE_LENGTH,
+        max_journal_capacity=DEFAULT_MAX_JOURNAL_CAPACITY,
+    ):
+        self.quantum_steps = quantum_steps
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.max_source_length = max_source_length
+        self.max_journal_capacity = max_journal_capacity
+        self.sessions = dict()
+        self._session_ids = itertools.count(1)
+        self._eviction = None
+        self._methods = {
+            "open": self.open,
+            "close": self.close,
+            "setup": self.setup,
+            "reset": self.reset,
+            "step": self.step,
+            "run": self.run,
+            "stop": self.stop,
+            "toggle_breakpoint": self.toggle_breakpoint,
+            "add_watchpoint": self.add_watchpoint,
+            "remove_watchpoint": self.remove_watchpoint,
+            "trigger_interrupt": self.trigger_interrupt,
+            "set_IO_controller_register": self.set_IO_controller_register,
+            "get_state": self.get_state,
+            "get_changes": self.get_changes,
+            "enable_journal": self.enable_journal,
+            "step_back": self.step_back,
+        }
+
+    async def start_tcp(self, host="127.0.0.1", port=0):
+        """Listen on a TCP socket, returns the ``asyncio`` server"""
+        self._start_eviction()
+        return await asyncio.start_server(self.handle_connection, host, port, limit=self._line_limit())
+
+    async def start_unix(self, path):
+        """Listen on a Unix domain socket, returns the ``asyncio`` server"""
+        self._start_eviction()
+        return await asyncio.start_unix_server(self.handle_connection, path, limit=self._line_limit())
+
+    def _line_limit(self):
+        # Sources are escaped in JSON, which at most doubles their length for typical text
+        return 2 * self.max_source_length + 4096
+
+    def _start_eviction(self):
+        if self._eviction is None:
+            self._eviction = asyncio.ensure_future(self._evict_periodically())
+
+    async def _evict_periodically(self):
+        while True:
+            await asyncio.sleep(max(self.idle_timeout / 4, 0.01))
+            self.evict_idle()
+
+    def evict_idle(self, now=None):
+        """Close all sessions unused for more than ``idle_timeout`` seconds, returns their ids"""
+        now = time.monotonic() if now is None else now
+        idle = [
+            session.id
+            for session in self.sessions.values()
+            if now - session.last_used > self.idle_timeout and not session.lock.locked()
+        ]
+        for session_id in idle:
+            del self.sessions[session_id]
+        return idle
+
+    async def handle_connection(self, reader, writer):
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    error = RequestError(INVALID_REQUEST, "Request too long")
+                    await self._write(writer, write_lock, {"jsonrpc": "2.0", "id": None, "error": error.as_dict()})
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.ensure_future(self._respond(line, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        except ConnectionError:
+            for task in tasks:
+                task.cancel()
+        finally:
+            writer.close()
+
+    async def _respond(self, line, writer, write_lock):
+        response = await self.handle_request(line)
+        if response is not None:
+            await self._write(writer, write_lock, response)
+
+    @staticmethod
+    async def _write(writer, write_lock, response):
+        async with write_lock:
+            writer.write(json.dumps(response).encode("utf-8") + b"\n")
+            await writer.drain()
+
+    async def handle_request(self, line):
+        """Handle a single JSON-RPC request, returns the response or ``None`` for notifications"""
+        request = request_id = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                raise RequestError(PARSE_ERROR, "Parse error") from e
+            if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+                raise RequestError(INVALID_REQUEST, "Invalid request")
+            request_id = request.get("id")
+            method = self._methods.get(request["method"])
+            if method is None:
+                raise RequestError(METHOD_NOT_FOUND, "Method not found", request["method"])
+            params = request.get("params", {})
+            if not isinstance(params, dict):
+                raise RequestError(INVALID_PARAMS, "Parameters must be passed by name")
+            try:
+                result = await method(**params)
+            except TypeError as e:
+                raise RequestError(INVALID_PARAMS, "Invalid parameters", str(e)) from e
+            except Error as e:
+                raise RequestError(SIMULATION_ERROR, "Simulation error", e.as_dict()) from e
+            except RequestError:
+                raise
+            except Exception as e:  # pylint: disable=broad-except
+                # E.g. an IndexError of the core for IO accesses out of range, the request still needs a response
+                data = {"type": type(e).__name__, "expression": None, "message": str(e)}
+                raise RequestError(SIMULATION_ERROR, "Simulation error", data) from e
+        except RequestError as e:
+            if isinstance(request, dict) and "id" not in request:
+                return None
+            return {"jsonrpc": "2.0", "id": request_id, "error": e.as_dict()}
+        if "id" not in request:
+            return None
+        return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+    def _session(self, session):
+        try:
+            found = self.sessions[session]
+        except (KeyError, TypeError) as e:
+            raise RequestError(UNKNOWN_SESSION, "Unknown session", session) from e
+        found.last_used = time.monotonic()
+        return found
+
+    @staticmethod
+    def _state(simulator):
+        return {
+            "register": simulator.get_register(),
+            "flags": simulator.get_flags(),
+            "simulator": simulator.get_simulator_data(),
+        }
+
+    # Methods
+
+    async def open(self, translate=False):
+        if len(self.sessions) >= self.max_sessions:
+            raise RequestError(LIMIT_EXCEEDED, "Too many sessions", self.max_sessions)
+        session = Session(next(self._session_ids), GumnutSimulator())
+        if translate:
+            session.simulator.CPU.enable_translation()
+        self.sessions[session.id] = session
+        return {"session": session.id}
+
+    async def close(self, session):
+        session = self._session(session)
+        session.stop_requested = True
+        session.wakeup.set()
+        del self.sessions[session.id]
+        return True
+
+    async def setup(self, session, source):
+        session = self._session(session)
+        if not isinstance(source, str):
+            raise RequestError(INVALID_PARAMS, "Source must be a string")
+        if len(source) > self.max_source_length:
+            raise RequestError(LIMIT_EXCEEDED, "Source too long", self.max_source_length)
+        async with session.lock:
+            loaded = session.simulator.setup(source)
+            return dict(self._state(session.simulator), loaded=loaded)
+
+    async def reset(self, session):
+        session = self._session(session)
+        async with session.lock:
+            session.simulator.reset()
+            return self._state(session.simulator)
+
+    async def step(self, session):
+        session = self._session(session)
+        async with session.lock:
+            session.simulator.step()
+            return self._state(session.simulator)
+
+    async def run(self, session, max_steps, wait_for_interrupt=False):
+        """
+        Run up to ``max_steps`` steps in quanta
+
+        :param wait_for_interrupt: Instead of returning when the CPU enters
+                                   WAIT or STBY with interrupts enabled, wait
+                                   for ``trigger_interrupt`` and go on
+        :return: The state with the stop ``reason``, the ``steps`` run,
+                 whether the run was ``stopped`` and whether the CPU is
+                 ``halted`` for good
+        """
+        session = self._session(session)
+        if not isinstance(max_steps, int) or max_steps < 0:
+            raise RequestError(INVALID_PARAMS, "max_steps must be a positive integer")
+        async with session.lock:
+            simulator = session.simulator
+            cpu = simulator.CPU
+            session.stop_requested = False
+            steps = 0
+            reason = StopReason.budget
+            while steps < max_steps and not session.stop_requested:
+                result = simulator.run(min(self.quantum_steps, max_steps - steps))
+                steps += result.steps
+                reason = result.reason
+                if reason in (StopReason.wait, StopReason.stby) and wait_for_interrupt and not cpu.is_halted():
+                    session.wakeup.clear()
+                    while cpu.is_idle() and not session.stop_requested:
+                        await session.wakeup.wait()
+                        session.wakeup.clear()
+                elif reason != StopReason.budget:
+                    break
+                else:
+                    await asyncio.sleep(0)
+                session.last_used = time.monotonic()
+            return dict(
+                self._state(simulator),
+                reason=reason.name,
+                steps=steps,
+                stopped=session.stop_requested,
+                halted=cpu.is_halted(),
+            )
+
+    async def stop(self, session):
+        """Stop the ``run`` of a session after its current quantum or while it waits for an interrupt"""
+        session = self._session(session)
+        session.stop_requested = True
+        session.wakeup.set()
+        return session.lock.locked()
+
+    async def toggle_breakpoint(self, session, line):
+        session = self._session(session)
+        async with session.lock:
+            session.simulator.toggle_breakpoint(line)
+            return session.simulator.get_breakpoints()
+
+    async def add_watchpoint(self, session, memory, address, access="write", value=None):
+        """
+        :param access: ``'read'``, ``'write'`` or ``'read_write'``
+        :return: All watchpoints of the session as ``[memory, address, access, value]``
+        """
+        session = self._session(session)
+        if access not in WATCHPOINT_ACCESS or not isinstance(address, int):
+            raise RequestError(INVALID_PARAMS, "Invalid watchpoint", access)
+        async with session.lock:
+            try:
+                session.simulator.add_watchpoint(memory, address, WATCHPOINT_ACCESS[access], value)
+            except ValueError as e:
+                raise RequestError(INVALID_PARAMS, str(e)) from e
+            return session.simulator.get_watchpoints()
+
+    async def remove_watchpoint(self, session, memory, address):
+        session = self._session(session)
+        if memory not in (watchpoints.DATA_MEMORY, watchpoints.IO_CONTROLLER_REGISTER) or not isinstance(address, int):
+            raise RequestError(INVALID_PARAMS, "Invalid watchpoint", memory)
+        async with session.lock:
+            session.simulator.remove_watchpoint(memory, address)
+            return session.simulator.get_watchpoints()
+
+    async def trigger_interrupt(self, session):
+        session = self._session(session)
+        session.simulator.trigger_interrupt()
+        session.wakeup.set()
+        return True
+
+    async def set_IO_controller_register(self, session, address, value):
+        session = self._session(session)
+        if not isinstance(address, int) or not 0 <= address < session.simulator.CPU.IO_controller_register_size:
+            raise RequestError(INVALID_PARAMS, "Invalid IO controller register address", address)
+        # Like a device, without waiting for a run, which may wait for the interrupt announcing the value
+        session.simulator.set_IO_controller_register(address, value)
+        return True
+
+    async def get_state(self, session):
+        # Queries don't wait for runs, they see the state between two quanta
+        session = self._session(session)
+        return self._state(session.simulator)
+
+    async def get_changes(self, session, token=None):
+        session = self._session(session)
+        return session.simulator.get_changes(token)
+
+    async def enable_journal(self, session, capacity=None):
+        session = self._session(session)
+        capacity = capacity or self.max_journal_capacity
+        if not isinstance(capacity, int) or not 0 < capacity <= self.max_journal_capacity:
+            raise RequestError(LIMIT_EXCEEDED, "Invalid journal capacity", self.max_journal_capacity)
+        async with session.lock:
+            session.simulator.enable_journal(capacity)
+            return True
+
+    async def step_back(self, session, n=1):
+        session = self._session(session)
+        async with session.lock:
+            steps = session.simulator.step_back(n)
+            return dict(self._state(session.simulator), steps=steps)
+
+
+def main(args):
+    """Entry point of ``gumnut-simulator serve``"""
+    server = SimulationServer(
+        quantum_steps=args.quantum_steps,
+        idle_timeout=args.idle_timeout,
+        max_sessions=args.max_sessions,
+        max_source_length=args.max_source_length,
+    )
+
+    async def serve():
+        if args.unix:
+            listener = await server.start_unix(args.unix)
+        else:
+            listener = await server.start_tcp(args.host, args.port)
+        async with listener:
+            await listener.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def add_arguments(parser):
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port to listen on")
+    parser.add_argument("--unix", default=None, help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--quantum-steps", type=int, default=DEFAULT_QUANTUM_STEPS, help="steps per time slice")
+    parser.add_argument(
+        "--idle-timeout", type=float, default=DEFAULT_IDLE_TIMEOUT, help="seconds until idle sessions are closed"
+    )
+    parser.add_argument("--max-sessions", type=int, default=DEFAULT_MAX_SESSIONS, help="maximum number of sessions")
+    parser.add_argument(
+        "--max-source-length", type=int, default=DEFAULT_MAX_SOURCE_LENGTH, help="maximum source length"
+    )
@@ -0,0 +1,201 @@
+import json
+import struct
+
+from gumnut_assembler.exceptions import UnknownInstruction
+
+from gumnut_simulator import exceptions
+from gumnut_simulator.decoder import INSTR, OPCODES, decode_opcode
+from gumnut_simulator.exceptions import InstructionMemorySizeExceeded, InvalidInstruction, InvalidSessionData
+from gumnut_simulator.simulator import GumnutSimulator, SimulatorState
+
+
+MAGIC = b"GSIM"
+FORMAT_VERSION = 1
+
+# Fixed size part of a session, all fields little-endian:
+# magic, format version,
+# r0-r7, PC, SP, packed flags, saved PC, return address stack, data memory access address,
+# opcode, fn, rd, op1 and op2 of the current instruction,
+# steps, previous PC, state, lines of code, number of instructions,
+# memory sizes, words of instruction memory and line index stored,
+# lengths of the source, the breakpoints and the exception
+HEADER = struct.Struct("<4sH" "8BiiHi8ii" "B4H" "qiBId" "3HH" "IHI")
+
+# Bits of the packed flags
+_FLAGS = ("CARRY", "ZERO", "WAIT", "STBY", "IREN", "IR", "_CARRY", "_ZERO")
+
+# Opcode stored when there is no current instruction
+_NO_INSTRUCTION = 0xFF
+
+
+def dumps(simulator):
+    """
+    Return the state of ``simulator`` in the binary session format
+
+    The session holds the registers and flags as fixed width fields, the
+    memories as raw bytes, the assembler source, the line index and the
+    breakpoints. Trailing empty words of the instruction memory are not
+    stored. The assembler objects (``lsom_map``, ``debug_symbols``) are not
+    part of a session either, ``loads()`` assembles the saved source again
+    to recreate them (a hit of the assembly cache for known programs). The
+    journal is not restored.
+    """
+    cpu = simulator.CPU
+    used = len(cpu.instruction_memory.tobytes().rstrip(b"\0"))
+    used = max(-(-used // cpu.instruction_memory.itemsize), max(simulator.address_of_line.values(), default=-1) + 1)
+
+    flags = 0
+    for bit, flag in enumerate(_FLAGS):
+        if getattr(cpu, flag):
+            flags |= 1 << bit
+    if cpu.instruction is None:
+        instruction = (_NO_INSTRUCTION, 0, 0, 0, 0)
+    else:
+        fields = (cpu.instruction.fn, cpu.instruction.rd, cpu.instruction.op1, cpu.instruction.op2)
+        instruction = (decode_opcode(cpu.instruction),) + tuple(field or 0 for field in fields)
+
+    source = simulator.asm_source.encode("utf-8")
+    exception = b""
+    if simulator.exception is not None and hasattr(simulator.exception, "as_dict"):
+        exception = json.dumps(simulator.exception.as_dict()).encode("utf-8")
+
+    header = HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        *cpu.r,
+        cpu.PC,
+        cpu.SP,
+        flags,
+        cpu._PC,  # pylint: disable=protected-access
+        *cpu.return_address_stack,
+        cpu.data_memory_access_addr,
+        *instruction,
+        simulator.steps,
+        simulator.previous_PC,
+        simulator.state,
+        simulator.lines_of_code,
+        simulator.number_of_instructions,
+        cpu.instruction_memory_size,
+        cpu.data_memory_size,
+        cpu.IO_controller_register_size,
+        used,
+        len(source),
+        len(simulator.breakpoints),
+        len(exception),
+    )
+    return b"".join(
+        (
+            header,
+            struct.pack("<%dI" % used, *cpu.instruction_memory[:used]),
+            struct.pack("<%di" % used, *simulator.line_of_address[:used]),
+            bytes(cpu.data_memory),
+            bytes(cpu.IO_controller_register),
+            struct.pack("<%di" % len(simulator.breakpoints), *simulator.breakpoints),
+            source,
+            exception,
+        )
+    )
+
+
+def loads(data, simulator=None):
+    """
+    Restore a session returned by ``dumps()``
+
+    :param simulator: Simulator to restore the session into, a new one is
+                      created if omitted. It is reset first.
+    :return: The simulator
+    :raises InvalidSessionData: If ``data`` is no session of this format
+                                version, the memory sizes don't match or
+                                its source doesn't assemble
+    """
+    if simulator is None:
+        simulator = GumnutSimulator()
+    cpu = simulator.CPU
+
+    try:
+        header = HEADER.unpack_from(data)
+    except struct.error as e:
+        raise InvalidSessionData(len(data), "Session data is truncated") from e
+    magic, version = header[:2]
+    if magic != MAGIC:
+        raise InvalidSessionData(magic, "Not a session")
+    if version != FORMAT_VERSION:
+        raise InvalidSessionData(version, "Unsupported session format version")
+    r, (PC, SP, flags, saved_PC), return_address_stack = header[2:10], header[10:14], header[14:22]
+    data_memory_access_addr, opcode, fn, rd, op1, op2 = header[22:28]
+    steps, previous_PC, state, lines_of_code, number_of_instructions = header[28:33]
+    sizes, used = header[33:36], header[36]
+    source_length, breakpoint_count, exception_length = header[37:]
+    if sizes != (cpu.instruction_memory_size, cpu.data_memory_size, cpu.IO_controller_register_size):
+        raise InvalidSessionData(sizes, "Memory sizes of the session don't match the core")
+    if used > cpu.instruction_memory_size:
+        raise InvalidSessionData(used, "Instruction memory size exceeded")
+
+    offset = HEADER.size
+    lengths = (4 * used, 4 * used, sizes[1], sizes[2], 4 * breakpoint_count, source_length, exception_length)
+    if len(data) != offset + sum(lengths):
+        raise InvalidSessionData(len(data), "Session data has the wrong length")
+    parts = list()
+    for length in lengths:
+        parts.append(data[offset : offset + length])
+        offset += length
+    instruction_memory, line_index, data_memory, IO_controller_register, breakpoints, source, exception = parts
+
+    simulator.reset()
+    cpu.upload_instruction_memory(struct.unpack("<%dI" % used, instruction_memory))
+    cpu.upload_data_memory(data_memory)
+    cpu.IO_controller_register[:] = IO_controller_register
+    cpu.IO_controller_register_writes.mark_all()
+    cpu.r = list(r)
+    cpu.PC = PC
+    cpu.SP = SP
+    for bit, flag in enumerate(_FLAGS):
+        setattr(cpu, flag, bool(flags & (1 << bit)))
+    cpu._PC = saved_PC  # pylint: disable=protected-access
+    cpu.return_address_stack = list(return_address_stack)
+    cpu.data_memory_access_addr = data_memory_access_addr
+    if opcode != _NO_INSTRUCTION:
+        name, access = OPCODES[opcode] if opcode < len(OPCODES) else (None, None)
+        cpu.instruction = INSTR(name, fn, rd, op1, op2, access)
+
+    simulator.asm_source = source.decode("utf-8")
+    if simulator.asm_source:
+        try:
+            program = simulator._assemble(simulator.asm_source)  # pylint: disable=protected-access
+        except (InvalidInstruction, InstructionMemorySizeExceeded, UnknownInstruction) as e:
+            raise InvalidSessionData(e, "Source of the session doesn't assemble") from e
+        simulator.lsom_map = program.source_objectcode_map
+        simulator.debug_symbols = program.source_objectcode_map
+    simulator.lines_of_code = lines_of_code
+    simulator.number_of_instructions = number_of_instructions
+    simulator.line_of_address[:used] = struct.unpack("<%di" % used, line_index)
+    simulator.address_of_line = {
+        line_number: address
+        for address, line_number in enumerate(simulator.line_of_address[:used])
+        if line_number != -1
+    }
+    simulator.breakpoints.extend(struct.unpack("<%di" % breakpoint_count, breakpoints))
+    simulator.breakpoint_addresses = {
+        simulator.address_of_line[line_number]
+        for line_number in simulator.breakpoints
+        if line_number in simulator.address_of_line
+    }
+    simulator.steps = steps
+    simulator.previous_PC = previous_PC
+    simulator.state = SimulatorState(state)
+    if exception:
+        fields = json.loads(exception.decode("utf-8"))
+        cls = getattr(exceptions, fields["type"], None)
+        if isinstance(cls, type) and issubclass(cls, exceptions.Error):
+            simulator.exception = cls(fields["expression"], fields["message"])
+    return simulator
+
+
+def save(simulator, fp):
+    """Write the session of ``simulator`` to the binary file object ``fp``"""
+    fp.write(dumps(simulator))
+
+
+def load(fp, simulator=None):
+    """Restore a session from the binary file object ``fp``, see ``loads()``"""
+    return loads(fp.read(), simulator)
@@ -1,14 +1,15 @@
 import json
-from collections import OrderedDict
+from array import array
+from collections import OrderedDict, namedtuple
 from enum import IntEnum
 
-from gumnut_assembler.assembler import GumnutAssembler
 from gumnut_assembler.exceptions import UnknownInstruction
 
-from gumnut_simulator import __version__
-from gumnut_simulator.core import GumnutCore
+from gumnut_simulator import __version__, cache, cfg, profiler, scheduler, watchpoints
+from gumnut_simulator.core import GumnutCore, RunResult, StopReason
 from gumnut_simulator.exceptions import (
     EmptyReturnStack,
+    InfiniteLoop,
     InstructionMemorySizeExceeded,
     InvalidInstruction,
     ReturnAddressStackOverflow,
@@ -21,62 +22,131 @@ class SimulatorState(IntEnum):
     breakpoint = 2
 
 
+SimulatorSnapshot = namedtuple("SimulatorSnapshot", "core steps previous_PC state exception")
+
+# Number of get_changes() tokens which can be passed back
+MAX_CHANGE_TOKENS = 16
+
+# Attributes serialised by to_JSON(), derived lookup tables, caches and optional features are left out
+_JSON_FIELDS = (
+    "asm_source",
+    "breakpoints",
+    "current_line",
+    "debug_symbols",
+    "exception",
+    "lines_of_code",
+    "lsom_map",
+    "number_of_instructions",
+    "previous_PC",
+    "state",
+    "steps",
+)
+_CPU_JSON_FIELDS = (
+    "CARRY",
+    "IO_controller_register",
+    "IO_controller_register_size",
+    "IR",
+    "IREN",
+    "PC",
+    "SP",
+    "STBY",
+    "WAIT",
+    "ZERO",
+    "_C",
+    "_CARRY",
+    "_PC",
+    "_Z",
+    "_ZERO",
+    "current_ret_line",
+    "data_memory",
+    "data_memory_access_addr",
+    "data_memory_size",
+    "instruction",
+    "instruction_memory",
+    "instruction_memory_size",
+    "r",
+    "return_address_stack",
+)
+_DECODER_JSON_FIELDS = ("INSTR", "instruction", "instruction_masks", "instructions")
+
+
 class GumnutSimulator:
     """
     Class which holds simulator data and CPU
+
+    :param assembly_cache: ``AssemblyCache`` used by ``setup()``, defaults
+                           to the cache shared by all simulators of the
+                           process, which is looked up by ``setup()`` and
+                           not kept in the simulator. Set the
+                           ``use_assembly_cache`` attribute to ``False`` to
+                           assemble every source again.
     """
 
-    def __init__(self):
+    def __init__(self, assembly_cache=None):
         self.CPU = GumnutCore()
+        self.assembly_cache = assembly_cache
+        self.use_assembly_cache = True
         self.lsom_map = dict()
         self.lines_of_code = 0
         self.current_line = 0
         self.number_of_instructions = 0
         self.breakpoints = list()
+        self.breakpoint_addresses = set()
+        self.line_of_address = [-1] * self.CPU.instruction_memory_size
+        self.address_of_line = dict()
         self.exception = None
         self.state = SimulatorState.halt
         self.asm_source = ""
         self.debug_symbols = OrderedDict()
         self.previous_PC = -1
         self.steps = 0
+        self.journal = None
+        self.scheduler = None
+        self._change_tokens = OrderedDict()
 
     def reset(self):
         """Reset the simulator and the CPU"""
         self.CPU.reset()
-        self.lsom_map.clear()
+        # The map of a cached program is shared, so it is replaced instead of cleared
+        self.lsom_map = dict()
         self.lines_of_code = 0
         self.number_of_instructions = 0
         self.current_line = 0
         self.breakpoints.clear()
+        self.breakpoint_addresses.clear()
+        self.line_of_address = [-1] * self.CPU.instruction_memory_size
+        self.address_of_line.clear()
         self.exception = None
         self.state = SimulatorState.halt
         self.asm_source = ""
         self.debug_symbols = OrderedDict()
         self.previous_PC = -1
         self.steps = 0
+        if self.journal is not None:
+            self.journal.clear()
+        if self.scheduler is not None:
+            self.scheduler.clear()
 
     def setup(self, source):
         """Initialize the CPU"""
         self.reset()
         try:
-            assembler = GumnutAssembler()  # Create as a persistent member or only when needed here?
-            assembler.load_asm_source(source)
-            assembler.assemble()
-
+            program = self._assemble(source)
             self.asm_source = source
-            self.lsom_map = assembler.source_objectcode_map
-            self.lines_of_code = assembler.ASMLineCount
-            self.number_of_instructions = assembler.InstrCount / 2
+            self.lsom_map = program.source_objectcode_map
+            self.lines_of_code = program.ASMLineCount
+            self.number_of_instructions = program.InstrCount / 2
 
-            self.CPU.upload_data_memory(assembler.get_data_memory())
-            self.CPU.upload_instruction_memory(assembler.get_instruction_memory())
+            self.CPU.upload_data_memory(program.data_memory)
+            self.CPU.upload_instruction_memory(program.instruction_memory)
 
             if self.number_of_instructions > 0:
                 self.state = SimulatorState.idle
             else:
                 self.state = SimulatorState.halt
 
-            self.debug_symbols = assembler.source_objectcode_map
+            self.debug_symbols = program.source_objectcode_map
+            self._build_line_index()
 
         except (InvalidInstruction, InstructionMemorySizeExceeded, UnknownInstruction) as e:
             self.exception = e
@@ -85,13 +155,27 @@ class GumnutSimulator:
         else:
             return True
 
+    def _assemble(self, source):
+        if self.use_assembly_cache:
+            assembly_cache = cache.default_cache if self.assembly_cache is None else self.assembly_cache
+            return assembly_cache.get(source)
+        return cache.assemble(source)
+
     def step(self):
         """Triggers a single step of the CPU"""
+        if self.scheduler:
+            self.scheduler.fire_due(self)
+        if self.journal is not None:
+            self.journal.record(self.previous_PC, self.steps, self.state)
+        steps = self.steps
         try:
             self.previous_PC = self.CPU.PC
+            self.CPU.watchpoint_hit = None
             self.CPU.step()
             self.steps += 1
-            if self.get_current_line() in self.breakpoints:
+            if self.CPU.IO_bus is not None:
+                self.CPU.IO_bus.flush()
+            if self.CPU.PC in self.breakpoint_addresses or self.CPU.watchpoint_hit is not None:
                 self.state = SimulatorState.breakpoint
             else:
                 self.state = SimulatorState.idle
@@ -105,6 +189,326 @@ class GumnutSimulator:
             return True
         else:
             return True
+        finally:
+            # A step which raised isn't counted, so there is nothing to undo either
+            if self.journal is not None and self.steps == steps:
+                self.journal.discard()
+
+    def run(self, max_steps, stop_on=None):
+        """
+        Run up to ``max_steps`` steps of the CPU in a tight loop
+
+        Leaves the simulator in the same state as calling ``step()``
+        ``max_steps`` times would, but stops early on breakpoints, when
+        the CPU enters WAIT or STBY, or when an exception is raised. A CPU
+        halted for good (see ``GumnutCore.is_halted``) isn't stepped at all.
+
+        Scheduled events (see ``schedule_interrupt()``) happen at their
+        steps. While events are pending, entering WAIT or STBY doesn't end
+        the run, the steps up to the next event are skipped instead.
+
+        With loop detection enabled a provable infinite loop halts the
+        simulator with an ``InfiniteLoop`` exception. Watchpoints (see
+        ``add_watchpoint()``) stop the run like breakpoints, after the step
+        accessing the watched address.
+
+        :param stop_on: Optional additional instruction memory addresses to
+                        stop at.
+        :return: ``RunResult(reason, steps, previous_PC, exception)``
+        """
+        if self.CPU.is_halted():
+            return RunResult(StopReason.stby if self.CPU.STBY else StopReason.wait, 0, None, None)
+
+        stop_addresses = self._get_breakpoint_addresses()
+        if stop_on:
+            stop_addresses |= set(stop_on)
+
+        if self.scheduler:
+            result = self._run_scheduled(max_steps, stop_addresses)
+        else:
+            result = self._run_chunk(max_steps, stop_addresses)
+
+        if self.CPU.IO_bus is not None:
+            self.CPU.IO_bus.flush()
+
+        if result.reason == StopReason.exception:
+            if result.steps:
+                self.state = SimulatorState.idle
+            if isinstance(result.exception, (InvalidInstruction, EmptyReturnStack)):
+                self.exception = result.exception
+                self.state = SimulatorState.halt
+            elif isinstance(result.exception, ReturnAddressStackOverflow):
+                self.exception = result.exception
+                self.state = SimulatorState.breakpoint
+            else:
+                raise result.exception
+        elif result.reason == StopReason.loop:
+            PC = self.CPU.PC
+            self.exception = InfiniteLoop(
+                "0x%03X" % PC,
+                "Provable infinite loop at PC 0x%03X / line %d" % (PC, self._get_source_line_from_address(PC)),
+            )
+            self.state = SimulatorState.halt
+        elif result.reason == StopReason.watchpoint:
+            self.state = SimulatorState.breakpoint
+        elif result.steps:
+            if self.CPU.PC in self.breakpoint_addresses:
+                self.state = SimulatorState.breakpoint
+            else:
+                self.state = SimulatorState.idle
+        return result
+
+    def _run_chunk(self, max_steps, stop_on):
+        if self.journal is not None:
+            result = self._run_journaled(max_steps, stop_on)
+        else:
+            if self.CPU.loop_detector is not None:
+                # Pending events are input, states only repeat forever without
+                self.CPU.loop_detector.active = not self.scheduler
+            result = self.CPU.run(max_steps, stop_on)
+        self.steps += result.steps
+        if result.previous_PC is not None:
+            self.previous_PC = result.previous_PC
+        return result
+
+    def _run_scheduled(self, max_steps, stop_on):
+        """Run in chunks ending at the steps events are due at"""
+        cpu = self.CPU
+        steps = 0
+        result = RunResult(StopReason.budget, 0, None, None)
+        while steps < max_steps:
+            self.scheduler.fire_due(self)
+            budget = max_steps - steps
+            due = self.scheduler.next_step()
+            if due is not None:
+                budget = min(budget, due - self.steps)
+            if due is not None and cpu.is_idle() and not cpu.is_halted():
+                steps += self.fast_forward(budget)
+                result = RunResult(StopReason.budget, steps, self.previous_PC, None)
+                continue
+            result = self._run_chunk(budget, stop_on)
+            steps += result.steps
+            if result.reason in (StopReason.wait, StopReason.stby) and self.scheduler and not cpu.is_halted():
+                result = result._replace(reason=StopReason.budget)
+                continue
+            if result.reason != StopReason.budget:
+                break
+        return RunResult(result.reason, steps, self.previous_PC if steps else None, result.exception)
+
+    def _run_journaled(self, max_steps, stop_on):
+        """Same as ``GumnutCore.run`` but records every step in the journal"""
+        cpu = self.CPU
+        record = self.journal.record
+        steps = 0
+        previous_PC = self.previous_PC
+        state = self.state
+        cpu.watchpoint_hit = None
+        try:
+            while steps < max_steps:
+                record(previous_PC, self.steps + steps, state)
+                previous_PC = cpu.PC
+                cpu.step()
+                steps += 1
+                state = SimulatorState.idle
+
+                if cpu.watchpoint_hit is not None:
+                    return RunResult(StopReason.watchpoint, steps, previous_PC, None)
+                if cpu.PC in stop_on:
+                    return RunResult(StopReason.breakpoint, steps, previous_PC, None)
+                if (cpu.STBY or cpu.WAIT) and not (cpu.IREN and cpu.IR):
+                    reason = StopReason.stby if cpu.STBY else StopReason.wait
+                    return RunResult(reason, steps, previous_PC, None)
+        except Exception as e:  # pylint: disable=broad-except
+            self.journal.discard()
+            return RunResult(StopReason.exception, steps, previous_PC, e)
+        return RunResult(StopReason.budget, steps, previous_PC, None)
+
+    def fast_forward(self, max_steps):
+        """
+        Skip up to ``max_steps`` steps while the CPU idles in WAIT or STBY
+
+        Costs the same for any number of steps, e.g. to advance the
+        simulated time until an external event. Doesn't skip past the next
+        scheduled event. A journal undoes the skipped steps as a single step.
+
+        :return: The number of steps skipped, 0 unless the CPU is idle
+        """
+        if self.scheduler:
+            self.scheduler.fire_due(self)
+            if self.scheduler:
+                max_steps = min(max_steps, self.scheduler.next_step() - self.steps)
+        if max_steps <= 0 or not self.CPU.is_idle():
+            return 0
+        if self.journal is not None:
+            self.journal.record(self.previous_PC, self.steps, self.state)
+        skipped = self.CPU.fast_forward(max_steps)
+        self.previous_PC = self.CPU.PC
+        self.steps += skipped
+        self.state = SimulatorState.breakpoint if self.CPU.PC in self.breakpoint_addresses else SimulatorState.idle
+        return skipped
+
+    def enable_journal(self, capacity=None, checkpoint_interval=None):
+        """
+        Record all following steps to be able to step back
+
+        See ``gumnut_simulator.journal.Journal``. Recording slows down
+        ``run()``, as it no longer uses the tight loop of the CPU.
+
+        :param capacity: Maximum number of steps which can be undone
+        :param checkpoint_interval: Number of steps between full snapshots
+        """
+        from gumnut_simulator import journal  # pylint: disable=import-outside-toplevel
+
+        self.journal = journal.Journal(
+            self,
+            capacity or journal.DEFAULT_CAPACITY,
+            checkpoint_interval or journal.DEFAULT_CHECKPOINT_INTERVAL,
+        )
+
+    def disable_journal(self):
+        self.journal = None
+
+    def step_back(self, n=1):
+        """
+        Undo the last ``n`` steps recorded by the journal
+
+        :return: The number of steps actually undone
+        """
+        if self.journal is None:
+            return 0
+        if self.CPU.loop_detector is not None:
+            self.CPU.loop_detector.clear()
+        return self.journal.step_back(n)
+
+    def run_back_to_breakpoint(self):
+        """
+        Step back to the last recorded state with the PC on a breakpoint
+
+        Steps back as far as the journal reaches if there is none.
+
+        :return: The number of steps undone
+        """
+        if self.journal is None:
+            return 0
+        n = self.journal.find_breakpoint(self.breakpoint_addresses)
+        n = self.journal.step_back(n if n is not None else len(self.journal))
+        if self.CPU.PC in self.breakpoint_addresses:
+            self.state = SimulatorState.breakpoint
+        return n
+
+    def enable_profiling(self):
+        """
+        Count how often every address and opcode is executed
+
+        See ``GumnutCore.enable_profiling``. Like the journal this slows down
+        ``run()``. Steps undone by ``step_back()`` stay counted.
+        """
+        self.CPU.enable_profiling()
+
+    def disable_profiling(self):
+        self.CPU.enable_profiling(False)
+
+    def enable_loop_detection(self):
+        """
+        Halt ``run()`` with an ``InfiniteLoop`` exception once the program provably loops forever
+
+        See ``GumnutCore.enable_loop_detection``. Loops are only reported
+        while no events are scheduled and not while the journal records.
+        """
+        self.CPU.enable_loop_detection()
+
+    def disable_loop_detection(self):
+        self.CPU.enable_loop_detection(False)
+
+    def get_profile(self, limit=None):
+        """
+        Return the most executed source lines and the executions per instruction
+
+        :param limit: Maximum number of lines to return
+        :return: ``{'lines': [{'line': 5, 'address': 4, 'count': 300, 'source': 'sub r1, r1, 1'}, ...],
+                    'opcodes': {'sub immediate': 300, ...}, 'interrupts': 0}``
+                 or ``None`` if profiling is disabled
+        """
+        if self.CPU.profiler is None:
+            return None
+        return {
+            "lines": [spot._asdict() for spot in profiler.hot_spots(self, limit)],
+            "opcodes": self.CPU.profiler.get_opcode_counts(),
+            "interrupts": self.CPU.profiler.interrupts,
+        }
+
+    def get_collapsed_stacks(self):
+        """
+        Return the steps per call stack in the collapsed stack format read by flame graph tools
+
+        See ``gumnut_simulator.profiler.collapsed_stacks``, returns an empty
+        string if profiling is disabled.
+        """
+        if self.CPU.profiler is None:
+            return ""
+        return "".join(line + "\n" for line in profiler.collapsed_stacks(self))
+
+    def get_control_flow_graph(self):
+        """
+        Return the ``ControlFlowGraph`` of the program in the instruction memory
+
+        Graphs are cached per program, see ``gumnut_simulator.cfg``. Pass
+        ``lsom_map`` to map its results to source lines, e.g.
+        ``simulator.get_control_flow_graph().get_unreachable_lines(simulator.lsom_map)``.
+        """
+        return cfg.default_cache.get(self.CPU.instruction_memory)
+
+    def start_trace(self, path):
+        """
+        Write a binary trace of all following steps to ``path``
+
+        See ``GumnutCore.start_trace``, the step indices of the records
+        continue the ``steps`` of the simulator. Read the trace with
+        ``gumnut_simulator.trace.TraceReader``.
+        """
+        self.CPU.start_trace(path, self.steps)
+
+    def stop_trace(self):
+        self.CPU.stop_trace()
+
+    def snapshot(self):
+        """
+        Capture the state of the CPU and the simulator counters
+
+        Snapshots are cheap (see ``GumnutCore.snapshot``) and can be
+        restored any number of times as long as the same program is set up.
+        Breakpoints are not part of a snapshot.
+
+        :return: ``SimulatorSnapshot(core, steps, previous_PC, state, exception)``
+        """
+        return SimulatorSnapshot(self.CPU.snapshot(), self.steps, self.previous_PC, self.state, self.exception)
+
+    def restore(self, snapshot):
+        """Restore the state captured by ``snapshot()``, this clears the journal"""
+        self.CPU.restore(snapshot.core)
+        self.steps = snapshot.steps
+        self.previous_PC = snapshot.previous_PC
+        self.state = snapshot.state
+        self.exception = snapshot.exception
+        if self.journal is not None:
+            self.journal.clear()
+
+    def save(self, fp):
+        """
+        Write the simulator state to the binary file object ``fp``
+
+        See ``gumnut_simulator.session`` for what is part of a session.
+        """
+        from gumnut_simulator import session  # pylint: disable=import-outside-toplevel
+
+        session.save(self, fp)
+
+    @classmethod
+    def load(cls, fp):
+        """Return a new simulator restored from a session written by ``save()``"""
+        from gumnut_simulator import session  # pylint: disable=import-outside-toplevel
+
+        return session.load(fp, cls())
 
     def get_flags(self):
         """
@@ -145,38 +549,46 @@ class GumnutSimulator:
 
     def get_instruction_memory(self):
         """
-        Return CPU instruction memory as a list
+        Return CPU instruction memory as a view of the memory buffer
 
         :return: ``[F8, F4, B5, F7, C1, 97, ... , D8, D4, 86, 94, 9B]``"""
-        return self.CPU.instruction_memory
+        return memoryview(self.CPU.instruction_memory)
 
     def get_data_memory(self):
         """
-        Return CPU data memory as a list
+        Return CPU data memory as a view of the memory buffer
 
         :return: ``[F8, F4, B5, F7, C1, 97, ... , D8, D4, 86, 94, 9B]``"""
-        return self.CPU.data_memory
+        return memoryview(self.CPU.data_memory)
 
     def get_IO_controller_register(self):
         """
-        Return IO controller register as a list
+        Return IO controller register as a view of the register buffer
         """
-        return self.CPU.IO_controller_register
+        return memoryview(self.CPU.IO_controller_register)
 
     def set_IO_controller_register(self, address, value):
-        self.CPU.IO_controller_register[address] = value
+        """Set a single IO controller register, this clears the journal"""
+        self.CPU.IO_controller_register[address] = value & 0xFF
+        self.CPU.IO_controller_register_writes.written.add(address)
+        if self.journal is not None:
+            self.journal.clear()
+        if self.CPU.loop_detector is not None:
+            self.CPU.loop_detector.clear()
 
     def get_current_line(self):
         """
         Return the current line number by looking up the current instruction memory pointer
         """
-        for line_number, value in self.lsom_map.items():
-            if value[3] == self.CPU.PC:
-                return line_number
-        return -1
+        return self._get_source_line_from_address(self.CPU.PC)
 
     def get_simulator_data(self):
         """Return some debug/additional information"""
+        result = self._get_simulator_fields()
+        self.exception = None
+        return result
+
+    def _get_simulator_fields(self):
         result = dict()
         result.update({"state": self.state})
         result.update({"lines_of_code": self.lines_of_code})
@@ -189,16 +601,89 @@ class GumnutSimulator:
             current_ret_line = self._get_source_line_from_address(self.previous_PC + 1)
             result.update({"current_ret_line": current_ret_line})
 
+        if self.CPU.watchpoint_hit is not None:
+            result.update({"watchpoint": self.CPU.watchpoint_hit._asdict()})
         if self.exception:
             result.update({"exception": self.exception.as_dict()})
-            self.exception = None
+        return result
+
+    def get_changes(self, since_token=None):
+        """
+        Return only the state which changed since an earlier call
+
+        Registers, flags and simulator data are compared against their
+        values when ``since_token`` was handed out, the memories are
+        tracked by the core (see ``GumnutCore.next_generation``). Without a
+        token, or with one of the more than ``MAX_CHANGE_TOKENS`` calls ago,
+        the complete state is returned.
+
+        :return: ``{'token': 7, 'register': {'r1': 0x20, 'PC': 0x05},
+                    'flags': {'ZERO': True}, 'simulator': {'steps': 12},
+                    'data_memory': [(0x10, [0x01, 0x02])],
+                    'IO_controller_register': [], 'instruction_memory': []}``
+                 with memory changes as ``(start, values)`` ranges. Pass
+                 ``token`` to the next call.
+        """
+        cpu = self.CPU
+        token = cpu.next_generation()
+        current = {
+            "register": self.get_register(),
+            "flags": self.get_flags(),
+            "simulator": self._get_simulator_fields(),
+        }
+        previous = self._change_tokens.get(since_token) if since_token is not None else None
+
+        result = {"token": token}
+        for key, values in current.items():
+            if previous is None:
+                result[key] = values
+            else:
+                changed = {name: value for name, value in values.items() if previous[key].get(name) != value}
+                changed.update({name: None for name in previous[key] if name not in values})
+                result[key] = changed
+
+        since = since_token if previous is not None else 0
+        result["data_memory"] = cpu.data_memory_writes.changed_ranges(cpu.data_memory, since)
+        result["IO_controller_register"] = cpu.IO_controller_register_writes.changed_ranges(
+            cpu.IO_controller_register, since
+        )
+        result["instruction_memory"] = cpu.instruction_memory_writes.changed_ranges(cpu.instruction_memory, since)
+
+        current["simulator"]["breakpoints"] = list(self.breakpoints)
+        self._change_tokens[token] = {key: dict(values) for key, values in current.items()}
+        while len(self._change_tokens) > MAX_CHANGE_TOKENS:
+            self._change_tokens.popitem(last=False)
         return result
 
     def toggle_breakpoint(self, line_number):
+        address = self.address_of_line.get(line_number)
         if line_number in self.breakpoints:
             self.breakpoints.remove(line_number)
+            self.breakpoint_addresses.discard(address)
         else:
             self.breakpoints.append(line_number)
+            if address is not None:
+                self.breakpoint_addresses.add(address)
+
+    def add_watchpoint(self, memory, address, access=watchpoints.WRITE, value=None):
+        """
+        Break after instructions accessing ``address`` of ``memory``
+
+        See ``GumnutCore.add_watchpoint``. Watchpoints are kept by
+        ``reset()`` and ``setup()``.
+
+        :param memory: ``'data_memory'`` or ``'IO_controller_register'``
+        :param access: ``watchpoints.READ``, ``watchpoints.WRITE`` or both
+        :param value: Only break on writes of this value
+        """
+        self.CPU.add_watchpoint(memory, address, access, value)
+
+    def remove_watchpoint(self, memory, address):
+        self.CPU.remove_watchpoint(memory, address)
+
+    def get_watchpoints(self):
+        """Return all watchpoints as ``(memory, address, access, value)`` tuples"""
+        return self.CPU.watchpoints.get() if self.CPU.watchpoints is not None else []
 
     def get_breakpoints(self):
         """
@@ -213,12 +698,47 @@ class GumnutSimulator:
         return self.state
 
     def to_JSON(self):
-        return json.dumps(self, default=lambda o: o.__dict__, sort_keys=True, indent=4)
+        """
+        Return the state of the simulator as JSON
+
+        ``_JSON_FIELDS``, ``_CPU_JSON_FIELDS`` and ``_DECODER_JSON_FIELDS``
+        define the format: only the attributes listed there are serialised,
+        so lookup tables, caches and optional features (journal, profiler,
+        translator, IO devices, ...) are left out. State which belongs to
+        the format has to be added to these lists, see ``test_json_format``.
+        """
+        state = {field: getattr(self, field) for field in _JSON_FIELDS}
+        state["CPU"] = {field: getattr(self.CPU, field) for field in _CPU_JSON_FIELDS}
+        state["CPU"]["decoder"] = {field: getattr(self.CPU.decoder, field) for field in _DECODER_JSON_FIELDS}
+        return json.dumps(state, default=_json_default, sort_keys=True, indent=4)
+
+    def _build_line_index(self):
+        """
+        Build the lookup tables between instruction memory addresses and source lines
+
+        ``line_of_address`` holds the first source line of every address
+        (or -1) and ``address_of_line`` the address of every line that is
+        the current line for its address, so a breakpoint on a line maps to
+        exactly one address.
+        """
+        self.line_of_address = [-1] * self.CPU.instruction_memory_size
+        self.address_of_line = dict()
+        for line_number, field in self.lsom_map.items():
+            address = field[3]
+            if address is not None and 0 <= address < len(self.line_of_address):
+                if self.line_of_address[address] == -1:
+                    self.line_of_address[address] = line_number
+                    self.address_of_line[line_number] = address
+        self.breakpoint_addresses = {
+            self.address_of_line[line_number] for line_number in self.breakpoints if line_number in self.address_of_line
+        }
+
+    def _get_breakpoint_addresses(self):
+        return set(self.breakpoint_addresses)
 
     def _get_source_line_from_address(self, address):
-        for line_number, field in self.debug_symbols.items():
-            if field[3] == address:
-                return line_number
+        if 0 <= address < len(self.line_of_address):
+            return self.line_of_address[address]
         return -1
 
     def trigger_interrupt(self):
@@ -226,11 +746,49 @@ class GumnutSimulator:
         Triggers an CPU interrupt by setting the internal flag
         """
         self.CPU.IR = True
+        if self.CPU.loop_detector is not None:
+            self.CPU.loop_detector.clear()
+
+    def schedule_interrupt(self, step, period=None):
+        """
+        Trigger an interrupt once ``step`` steps have been executed
+
+        Scheduled events are dropped by ``reset()`` and ``setup()``.
+
+        :param period: Trigger the interrupt again every ``period`` steps
+        """
+        self._get_scheduler().add(step, scheduler.INTERRUPT, period=period)
 
+    def schedule_IO_controller_register(self, step, address, value, period=None):
+        """Write ``value`` to IO controller register ``address`` once ``step`` steps have been executed"""
+        self._get_scheduler().add(step, scheduler.IO_WRITE, (address, value), period)
 
-def main():
+    def schedule_callback(self, step, callback, period=None):
+        """Call ``callback(simulator)`` once ``step`` steps have been executed"""
+        self._get_scheduler().add(step, scheduler.CALLBACK, (callback,), period)
+
+    def _get_scheduler(self):
+        if self.scheduler is None:
+            self.scheduler = scheduler.Scheduler()
+        # States seen before the event happens don't prove a loop after it
+        if self.CPU.loop_detector is not None:
+            self.CPU.loop_detector.clear()
+        return self.scheduler
+
+
+def _json_default(o):
+    if isinstance(o, (bytearray, array, memoryview)):
+        return list(o)
+    if isinstance(o, (set, frozenset)):
+        return sorted(o)
+    return o.__dict__
+
+
+def main(argv=None):
     import argparse
 
+    from gumnut_simulator import batch, client, server
+
     parser = argparse.ArgumentParser(description="Gumnut Simulator")
     parser.add_argument(
         "-v",
@@ -239,8 +797,21 @@ def main():
         version="%(prog)s {}".format(__version__),
         help="show the version number and exit",
     )
-
-    parser.parse_args()
+    subparsers = parser.add_subparsers(dest="command")
+    batch.add_arguments(subparsers.add_parser("batch", help="run many programs headless and print JSON lines"))
+    server.add_arguments(subparsers.add_parser("serve", help="serve simulator sessions over JSON-RPC"))
+    client.add_arguments(subparsers.add_parser("loadtest", help="measure the latencies of a simulation server"))
+    cfg.add_arguments(subparsers.add_parser("cfg", help="print the control-flow graph of a program as DOT or JSON"))
+
+    args = parser.parse_args(argv)
+    if args.command == "batch":
+        return batch.main(args)
+    if args.command == "serve":
+        return server.main(args)
+    if args.command == "loadtest":
+        return client.main(args)
+    if args.command == "cfg":
+        return cfg.main(args)
 
     return 0
 
@@ -0,0 +1,225 @@
+import mmap
+import struct
+
+from gumnut_simulator.decoder import OPCODE, OPCODES
+from gumnut_simulator.exceptions import InvalidTraceFile
+
+
+MAGIC = b"GTRC"
+FORMAT_VERSION = 1
+
+# magic, format version, record size, padding
+HEADER = struct.Struct("<4sHH8x")
+
+# step, PC, object code, opcode, rd, value of rd, flags, memory access kind, address and value, padding
+RECORD = struct.Struct("<QHIBBBBBHB2x")
+RECORD_FIELDS = ("step", "PC", "objectcode", "opcode", "rd", "rd_value", "flags", "access", "address", "value")
+
+DEFAULT_BUFFER_RECORDS = 65536
+
+# Opcode of the records written for interrupts, PC is the interrupted address
+OP_INTERRUPT = 0xFE
+
+# Bits of the flags field
+FLAG_CARRY, FLAG_ZERO, FLAG_WAIT, FLAG_STBY, FLAG_IREN, FLAG_IR = (1 << bit for bit in range(6))
+
+# Kinds of memory accesses
+ACCESS_NONE, ACCESS_LDM, ACCESS_STM, ACCESS_INP, ACCESS_OUT = range(5)
+
+_ACCESS = {OPCODE[instruction, None]: i + 1 for i, instruction in enumerate(("ldm", "stm", "inp", "out"))}
+
+
+class TraceWriter:
+    """
+    Append one fixed width binary record per executed instruction to a file
+
+    Every record (see ``RECORD``) holds the step index, the PC and object
+    code of the instruction, its opcode, the destination register and its
+    value after the instruction, the flags after the instruction and, for
+    ``ldm``/``stm``/``inp``/``out``, the kind of access with the memory
+    address and the value read or written. Interrupts get a record with
+    the opcode ``OP_INTERRUPT``. Idle steps (STBY or WAIT) only advance
+    the step index.
+
+    Records are collected in a buffer of ``buffer_records`` records which
+    is written to the file once it is full.
+
+    :param start_step: Step index of the first step traced
+    """
+
+    def __init__(self, path, start_step=0, buffer_records=DEFAULT_BUFFER_RECORDS):
+        self.fp = open(path, "wb")
+        self.fp.write(HEADER.pack(MAGIC, FORMAT_VERSION, RECORD.size))
+        self.step = start_step
+        self.records = 0
+        self.buffer = bytearray(RECORD.size * buffer_records)
+        self.offset = 0
+
+    def record(self, cpu, PC, decoded, base):
+        """
+        Record the instruction ``decoded`` just executed at address ``PC``
+
+        :param base: Value of the ``op1`` register before the instruction,
+                     which is the base of memory addresses
+        """
+        access = _ACCESS.get(decoded.opcode, ACCESS_NONE)
+        address = value = 0
+        if access:
+            address = base + decoded.op2
+            if access == ACCESS_LDM or access == ACCESS_INP:
+                value = cpu.r[decoded.rd]
+            else:
+                memory = cpu.data_memory if access == ACCESS_STM else cpu.IO_controller_register
+                value = memory[address]
+        RECORD.pack_into(
+            self.buffer,
+            self.offset,
+            self.step,
+            PC,
+            cpu.instruction_memory[PC],
+            decoded.opcode,
+            decoded.rd,
+            cpu.r[decoded.rd],
+            _flags(cpu),
+            access,
+            address,
+            value,
+        )
+        self._advance()
+
+    def record_interrupt(self, cpu, PC):
+        """Record an interrupt of the program at address ``PC``"""
+        RECORD.pack_into(self.buffer, self.offset, self.step, PC, 0, OP_INTERRUPT, 0, 0, _flags(cpu), 0, 0, 0)
+        self._advance()
+
+    def skip(self):
+        """Advance the step index for a step without record"""
+        self.step += 1
+
+    def flush(self):
+        self.fp.write(memoryview(self.buffer)[: self.offset])
+        self.fp.flush()
+        self.offset = 0
+
+    def close(self):
+        if not self.fp.closed:
+            self.flush()
+            self.fp.close()
+
+    def _advance(self):
+        self.step += 1
+        self.records += 1
+        self.offset += RECORD.size
+        if self.offset == len(self.buffer):
+            self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _flags(cpu):
+    return (
+        (FLAG_CARRY if cpu.CARRY else 0)
+        | (FLAG_ZERO if cpu.ZERO else 0)
+        | (FLAG_WAIT if cpu.WAIT else 0)
+        | (FLAG_STBY if cpu.STBY else 0)
+        | (FLAG_IREN if cpu.IREN else 0)
+        | (FLAG_IR if cpu.IR else 0)
+    )
+
+
+def record_dtype():
+    """Return the NumPy structured dtype of a trace record"""
+    import numpy as np  # pylint: disable=import-outside-toplevel
+
+    return np.dtype(
+        {
+            "names": RECORD_FIELDS,
+            "formats": ("<u8", "<u2", "<u4", "u1", "u1", "u1", "u1", "u1", "<u2", "u1"),
+            "offsets": (0, 8, 10, 14, 15, 16, 17, 18, 19, 21),
+            "itemsize": RECORD.size,
+        }
+    )
+
+
+class TraceReader:
+    """
+    Read a trace written by ``TraceWriter`` through a memory map
+
+    ``records`` is a NumPy structured array (see ``record_dtype()``)
+    directly on top of the mapped file, so traces larger than the main
+    memory can be read. A partially written last record is ignored.
+    Requires NumPy.
+
+    Views returned by ``records`` or ``filter()`` have to be dropped before
+    calling ``close()``.
+    """
+
+    def __init__(self, path):
+        import numpy as np  # pylint: disable=import-outside-toplevel
+
+        with open(path, "rb") as fp:
+            header = fp.read(HEADER.size)
+            if len(header) < HEADER.size:
+                raise InvalidTraceFile(path, "Trace file is truncated")
+            magic, version, record_size = HEADER.unpack(header)
+            if magic != MAGIC or version != FORMAT_VERSION or record_size != RECORD.size:
+                raise InvalidTraceFile(path, "Not a trace file of format version %d" % FORMAT_VERSION)
+            fp.seek(0, 2)
+            count = (fp.tell() - HEADER.size) // RECORD.size
+            if count:
+                self.mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+                self.records = np.frombuffer(self.mmap, dtype=record_dtype(), count=count, offset=HEADER.size)
+            else:
+                # Empty files can't be mapped
+                self.mmap = None
+                self.records = np.zeros(0, dtype=record_dtype())
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+    def filter(self, PC_range=None, opcodes=None):
+        """
+        Return the records within ``PC_range`` and of one of ``opcodes``
+
+        :param PC_range: ``(first, last)`` addresses, both inclusive
+        :param opcodes: Instruction names (e.g. ``'add'``, which matches
+                        both access modes) or integer opcodes
+        """
+        import numpy as np  # pylint: disable=import-outside-toplevel
+
+        mask = np.ones(len(self.records), dtype=bool)
+        if PC_range is not None:
+            PC = self.records["PC"]
+            mask &= (PC >= PC_range[0]) & (PC <= PC_range[1])
+        if opcodes is not None:
+            mask &= np.isin(self.records["opcode"], _opcode_numbers(opcodes))
+        return self.records[mask]
+
+    def close(self):
+        self.records = None
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _opcode_numbers(opcodes):
+    numbers = list()
+    for opcode in opcodes:
+        if isinstance(opcode, str):
+            numbers.extend(number for number, (instruction, _) in enumerate(OPCODES) if instruction == opcode)
+        else:
+            numbers.append(opcode)
+    return numbers
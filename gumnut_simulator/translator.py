@@ -0,0 +1,345 @@
+from collections import namedtuple
+
+from gumnut_simulator.core import RunResult, StopReason
+from gumnut_simulator.decoder import OPCODE
+
+
+Block = namedtuple("Block", "start length function source truncated")
+
+# Instructions which are translated into straight-line Python code
+_ALU_REGISTER = range(OPCODE["add", "register"], OPCODE["mask", "register"] + 1)
+_ALU_IMMEDIATE = range(OPCODE["add", "immediate"], OPCODE["mask", "immediate"] + 1)
+_SHL, _SHR, _ROL, _ROR = (OPCODE[instruction, None] for instruction in ("shl", "shr", "rol", "ror"))
+_LDM, _STM, _INP, _OUT = (OPCODE[instruction, None] for instruction in ("ldm", "stm", "inp", "out"))
+
+# Instructions which end a block and are translated as well
+_BZ, _BNZ, _BC, _BNC, _JMP = (OPCODE[instruction, None] for instruction in ("bz", "bnz", "bc", "bnc", "jmp"))
+_BRANCH_CONDITIONS = {_BZ: "Z", _BNZ: "not Z", _BC: "C", _BNC: "not C"}
+
+# Everything else (jsb, ret, reti, enai, disi, wait, stby and invalid
+# instructions) ends a block and is left to the interpreter.
+
+_ALU_EXPRESSIONS = ("%s + %s", "%s + %s + C", "%s - %s", "%s - %s - C", "%s & %s", "%s | %s", "%s ^ %s", "%s & ~%s")
+
+MAX_BLOCK_LENGTH = 256
+
+# Number of times a block has to be entered before it is translated, compiling
+# a block costs about as much as interpreting its instructions a hundred times
+HOT_THRESHOLD = 16
+
+# Number of cached blocks, all of them are dropped once there are more
+MAX_CACHED_BLOCKS = 512
+
+
+class _InterpreterAccess(Exception):
+    """Raised by blocks before an access the interpreter has to handle, of IO devices or watched addresses"""
+
+
+_INTERPRETER_ACCESS = _InterpreterAccess()
+
+
+class BlockTranslator:
+    """
+    Execution engine which translates basic blocks into Python functions
+
+    A block is a run of arithmetic, shift and memory instructions which is
+    optionally terminated by ``bz``, ``bnz``, ``bc``, ``bnc`` or ``jmp``.
+    Each block is translated once into Python source with the registers and
+    flags held in local variables, compiled and cached by its start address.
+    Only addresses entered ``HOT_THRESHOLD`` times are translated, code
+    running less often is interpreted. All other instructions (``jsb``,
+    ``ret``, ``reti``, ``enai``, ``disi``, ``wait``, ``stby``) are executed
+    by the interpreter, as are the steps of a block which doesn't fit into
+    the step budget or which would pass a stop address in the middle.
+
+    Interrupts are only taken between blocks. As an interrupt request can't
+    be raised while a block executes this is exactly when the interpreter
+    would take it. To keep it that way ``inp`` and ``out`` instructions
+    accessing an IO device (see ``GumnutCore.attach_IO_device``) end the
+    block and are executed by the interpreter, unmapped addresses are
+    accessed directly. Memory instructions accessing watched addresses
+    (see ``GumnutCore.add_watchpoint``) are left to the interpreter the
+    same way.
+    """
+
+    def __init__(self, core):
+        self.core = core
+        self.blocks = dict()
+        # Number of times every address was entered without a cached block, up to HOT_THRESHOLD
+        self.entries = bytearray(core.instruction_memory_size)
+
+    def invalidate(self, address=None):
+        """Drop all cached blocks or only those containing ``address``"""
+        if address is None:
+            self.blocks.clear()
+            self.entries = bytearray(self.core.instruction_memory_size)
+            return
+        stale = [start for start, block in self.blocks.items() if block and start <= address < start + block.length]
+        for start in stale:
+            del self.blocks[start]
+
+    def get_block(self, address, limit=MAX_BLOCK_LENGTH):
+        """
+        Return the translated block starting at ``address`` or ``None`` if there is none
+
+        :param limit: Maximum number of instructions of a block which isn't
+                      cached yet
+        """
+        try:
+            return self.blocks[address]
+        except KeyError:
+            return self._store(address, self.translate(address, limit))
+
+    def _store(self, address, block):
+        if len(self.blocks) >= MAX_CACHED_BLOCKS:
+            self.blocks.clear()
+        self.blocks[address] = block
+        return block
+
+    def _hot_block(self, address, cached, remaining, stop_on):
+        """
+        Return the block to execute at ``address`` or ``None`` to interpret the next step
+
+        Addresses are only translated once they were entered ``HOT_THRESHOLD``
+        times, so code which runs just a few times isn't compiled. New blocks
+        end at the step budget and before the next stop address, such
+        truncated blocks are translated again in full once the budget allows.
+        """
+        if cached is False and 0 <= address < len(self.entries) and self.entries[address] < HOT_THRESHOLD - 1:
+            self.entries[address] += 1
+            return None
+        limit = min([MAX_BLOCK_LENGTH, remaining] + [stop - address for stop in stop_on if stop > address])
+        if cached is not False and limit < MAX_BLOCK_LENGTH:
+            return cached
+        return self._store(address, self.translate(address, limit))
+
+    def translate(self, start, limit=MAX_BLOCK_LENGTH):
+        """Translate the block of up to ``limit`` instructions starting at ``start``"""
+        core = self.core
+        size = core.instruction_memory_size
+        if not 0 <= start < len(core.decoded_instruction_memory):
+            return None
+
+        lines = list()
+        instructions = list()
+        used = set()
+        written = set()
+        next_PC = None
+        loops = False
+        address = start
+        # The last instruction word is left to the interpreter which raises
+        # when the PC is incremented past the end of the instruction memory
+        end = min(size - 1, len(core.decoded_instruction_memory), start + min(limit, MAX_BLOCK_LENGTH))
+        while address < end:
+            decoded = core.decoded_instruction_memory[address]
+            if decoded is None:
+                decoded = core.decode(core.instruction_memory[address])
+                core.decoded_instruction_memory[address] = decoded
+            opcode, rd, op1, op2, _ = decoded
+
+            if opcode in _BRANCH_CONDITIONS or opcode == _JMP:
+                if opcode == _JMP:
+                    taken = op2
+                elif op2 & 0x80:
+                    taken = address + op2 - 0xFF
+                else:
+                    taken = address + op2 + 1
+                if not 0 <= taken < size:
+                    break
+                instructions.append(decoded.instruction)
+                if opcode == _JMP:
+                    lines.append("PC = %d" % taken)
+                else:
+                    lines.append("PC = %d if %s else %d" % (taken, _BRANCH_CONDITIONS[opcode], address + 1))
+                next_PC = "PC"
+                loops = taken == start
+                break
+
+            code = _translate_instruction(opcode, rd, op1, op2, len(instructions), core.data_memory_size, used, written)
+            if code is not None and core.IO_bus is not None and opcode in (_INP, _OUT):
+                code[2:2] = ["if devs[a] is not None:", "    raise INTERPRETER_ACCESS"]
+            if code is not None and core.watchpoints is not None and opcode in (_LDM, _STM, _INP, _OUT):
+                # After the range check of the data memory, right before the access
+                position = 2 if opcode in (_INP, _OUT) else 5
+                watched = "dw" if opcode in (_LDM, _STM) else "iow"
+                code[position:position] = ["if %s[a]:" % watched, "    raise INTERPRETER_ACCESS"]
+            if code is None:
+                break
+            instructions.append(decoded.instruction)
+            lines.append("# 0x%03X: %s" % (address, decoded.instruction.instruction))
+            lines.extend(code or ["pass"])
+            address += 1
+
+        if not instructions:
+            return None
+        if next_PC is None:
+            next_PC = str(start + len(instructions))
+
+        length = len(instructions)
+        registers = sorted(used | written)
+        writeback = ["r[%d] = r%d" % (register, register) for register in sorted(written)]
+        writeback += ["cpu.CARRY = C", "cpu.ZERO = Z", "cpu.data_memory_access_addr = dma"]
+
+        source = ["def block(cpu, r, dm, io, budget):"]
+        source += ["    r%d = r[%d]" % (register, register) for register in registers]
+        source += ["    C = cpu.CARRY", "    Z = cpu.ZERO", "    dma = cpu.data_memory_access_addr", "    n = 0"]
+        # Memory writes are logged in the current generation, see GumnutCore.next_generation()
+        source += ["    dmlog = cpu.data_memory_writes.written"]
+        source += ["    iolog = cpu.IO_controller_register_writes.written"]
+        if core.IO_bus is not None:
+            source += ["    devs = cpu.IO_bus.devices"]
+        if core.watchpoints is not None:
+            source += ["    dw = cpu.watchpoints.data_memory", "    iow = cpu.watchpoints.IO_controller_register"]
+        if loops:
+            # Blocks branching back to their own start iterate as long as the budget allows
+            source += ["    steps = 0", "    try:", "        while True:"]
+            source += ["            " + line for line in lines]
+            source += ["            steps += %d" % length]
+            source += ["            if PC != %d or steps + %d > budget:" % (start, length), "                break"]
+        else:
+            source += ["    steps = %d" % length, "    try:"]
+            source += ["        " + line for line in lines]
+        source += ["    except Exception as e:  # pylint: disable=broad-except"]
+        source += ["        " + line for line in writeback]
+        source += ["        cpu.PC = %d + n" % start, "        cpu.instruction = INSTRUCTIONS[n]"]
+        source += ["        return %sn, e" % ("steps + " if loops else "")]
+        source += ["    " + line for line in writeback]
+        source += ["    cpu.PC = %s" % next_PC, "    cpu.instruction = INSTRUCTIONS[-1]", "    return steps, None"]
+        source = "\n".join(source) + "\n"
+
+        namespace = {"INSTRUCTIONS": tuple(instructions), "INTERPRETER_ACCESS": _INTERPRETER_ACCESS}
+        exec(compile(source, "<gumnut block 0x%03X>" % start, "exec"), namespace)  # pylint: disable=exec-used
+        truncated = next_PC == str(start + length) and length == limit < MAX_BLOCK_LENGTH
+        return Block(start, length, namespace["block"], source, truncated)
+
+    def run(self, max_steps, stop_on=()):
+        """
+        Perform up to ``max_steps`` steps by chaining translated blocks
+
+        Behaves exactly like ``GumnutCore.run``.
+        """
+        core = self.core
+        stop_on = frozenset(stop_on)
+        step = core.step
+        hot_block = self._hot_block
+        blocks = self.blocks
+        r = core.r
+        data_memory = core.data_memory
+        io = core.IO_controller_register
+        steps = 0
+        previous_PC = None
+        # Addresses within a block which didn't fit, reached by interpreting it step by step
+        covered = range(0)
+        try:
+            while steps < max_steps:
+                previous_PC = PC = core.PC
+                block = None
+                if not ((core.IREN and core.IR) or core.STBY or core.WAIT or PC in covered):
+                    block = blocks.get(PC, False)
+                    if block is False or (block is not None and block.truncated):
+                        block = hot_block(PC, block, max_steps - steps, stop_on)
+                    if block is not None and (
+                        steps + block.length > max_steps
+                        or (stop_on and not stop_on.isdisjoint(range(PC + 1, PC + block.length)))
+                    ):
+                        # Instead of translating more blocks starting within this one
+                        covered = range(PC + 1, PC + block.length)
+                        block = None
+
+                if block is None:
+                    step()
+                    steps += 1
+                    if core.watchpoint_hit is not None:
+                        return RunResult(StopReason.watchpoint, steps, previous_PC, None)
+                else:
+                    budget = block.length if PC in stop_on else max_steps - steps
+                    executed, exception = block.function(core, r, data_memory, io, budget)
+                    steps += executed
+                    if exception is _INTERPRETER_ACCESS:
+                        previous_PC = core.PC
+                        step()
+                        steps += 1
+                        if core.watchpoint_hit is not None:
+                            return RunResult(StopReason.watchpoint, steps, previous_PC, None)
+                    elif exception is not None:
+                        previous_PC = core.PC
+                        raise exception
+                    else:
+                        previous_PC = PC + block.length - 1
+
+                if core.PC in stop_on:
+                    return RunResult(StopReason.breakpoint, steps, previous_PC, None)
+                if (core.STBY or core.WAIT) and not (core.IREN and core.IR):
+                    reason = StopReason.stby if core.STBY else StopReason.wait
+                    return RunResult(reason, steps, previous_PC, None)
+        except Exception as e:  # pylint: disable=broad-except
+            return RunResult(StopReason.exception, steps, previous_PC, e)
+        return RunResult(StopReason.budget, steps, previous_PC, None)
+
+
+def _register(register):
+    return "r%d" % register if register else "0"
+
+
+def _translate_instruction(opcode, rd, op1, op2, index, data_memory_size, used, written):
+    """Return the lines of Python code for a single instruction or ``None`` if it can't be translated"""
+    if opcode in _ALU_REGISTER or opcode in _ALU_IMMEDIATE:
+        if opcode in _ALU_REGISTER:
+            fn = opcode - _ALU_REGISTER.start
+            operand = _register(op2)
+            used.add(op2)
+        else:
+            fn = opcode - _ALU_IMMEDIATE.start
+            operand = str(op2)
+        used.add(op1)
+        lines = ["t = " + _ALU_EXPRESSIONS[fn] % (_register(op1), operand)]
+        # Same flag handling as GumnutCore.check_range
+        if fn < 4:
+            lines += ["if t > 0xFF:", "    C = True", "    t %= 0x100"]
+            lines += ["elif t < 0:", "    C = True", "    t += 0x100"]
+            lines += ["elif t == 0:", "    Z = True", "else:", "    Z = False", "    C = False"]
+        else:
+            lines += ["if t == 0:", "    Z = True", "else:", "    Z = False", "    C = False"]
+        if rd:
+            lines.append("r%d = t" % rd)
+            written.add(rd)
+        return lines
+
+    if opcode in (_SHL, _SHR, _ROL, _ROR):
+        used.add(op1)
+        source = _register(op1)
+        if opcode == _SHL:
+            expression = "(%s << %d) & 0xFF" % (source, op2)
+        elif opcode == _SHR:
+            expression = "%s >> %d" % (source, op2)
+        elif op2 == 0:
+            return []  # Rotating by 0 leaves rd untouched
+        elif opcode == _ROL:
+            expression = "((%s << %d) | (%s >> %d)) & 0xFF" % (source, op2, source, 8 - op2)
+        else:
+            expression = "((%s >> %d) | (%s << %d)) & 0xFF" % (source, op2, source, 8 - op2)
+        if not rd:
+            return []
+        written.add(rd)
+        return ["r%d = %s" % (rd, expression)]
+
+    if opcode in (_LDM, _STM, _INP, _OUT):
+        used.add(op1)
+        lines = ["n = %d" % index, "a = %s + %d" % (_register(op1), op2)]
+        if opcode in (_LDM, _STM):
+            lines += ["dma = a", "if a > %d:" % data_memory_size, "    cpu.check_data_memory_access(a)"]
+        if opcode == _LDM:
+            lines.append("r%d = dm[a]" % rd if rd else "dm[a]")
+        elif opcode == _STM:
+            lines += ["dm[a] = %s" % _register(rd), "dmlog.add(a)"]
+        elif opcode == _INP:
+            lines.append("r%d = io[a]" % rd if rd else "io[a]")
+        else:
+            lines += ["io[a] = %s" % _register(rd), "iolog.add(a)"]
+        if rd:
+            used.add(rd)
+            if opcode in (_LDM, _INP):
+                written.add(rd)
+        return lines
+
+    return None
@@ -0,0 +1,351 @@
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from gumnut_simulator import alu
+from gumnut_simulator.core import GumnutCore, StopReason
+from gumnut_simulator.decoder import GumnutDecoder, OPCODE, OP_INVALID, decode_opcode
+from gumnut_simulator.exceptions import (
+    DataMemoryAccessViolation,
+    DataMemorySizeExceeded,
+    InstructionMemorySizeExceeded,
+    InvalidInstruction,
+    InvalidPCValue,
+)
+
+
+VectorRunResult = namedtuple("VectorRunResult", "reason steps")
+
+# Per lane error codes, index into LANE_EXCEPTIONS
+NO_ERROR = 0
+INVALID_INSTRUCTION = 1
+INVALID_PC_VALUE = 2
+DATA_MEMORY_ACCESS_VIOLATION = 3
+INDEX_ERROR = 4
+LANE_EXCEPTIONS = (None, InvalidInstruction, InvalidPCValue, DataMemoryAccessViolation, IndexError)
+
+# Instruction groups which are executed together
+_ALU, _SHIFT, _LDM, _STM, _INP, _OUT, _BRANCH, _JMP, _JSB, _RET, _RETI, _ENAI, _DISI, _WAIT, _STBY, _INVALID = range(16)
+
+
+def _opcode_groups():
+    groups = [_INVALID] * (OP_INVALID + 1)
+    for opcode in range(OPCODE["add", "register"], OPCODE["mask", "immediate"] + 1):
+        groups[opcode] = _ALU
+    for instruction in ("shl", "shr", "rol", "ror"):
+        groups[OPCODE[instruction, None]] = _SHIFT
+    for instruction in ("bz", "bnz", "bc", "bnc"):
+        groups[OPCODE[instruction, None]] = _BRANCH
+    for instruction, group in (
+        ("ldm", _LDM),
+        ("stm", _STM),
+        ("inp", _INP),
+        ("out", _OUT),
+        ("jmp", _JMP),
+        ("jsb", _JSB),
+        ("ret", _RET),
+        ("reti", _RETI),
+        ("enai", _ENAI),
+        ("disi", _DISI),
+        ("wait", _WAIT),
+        ("stby", _STBY),
+    ):
+        groups[OPCODE[instruction, None]] = group
+    return groups
+
+
+# Views of the ALU tables, shared by all engines
+if np is not None:
+    _ARITHMETIC_RESULT = np.frombuffer(alu.ARITHMETIC_RESULT, dtype=np.uint8)
+    _ARITHMETIC_FLAGS = np.frombuffer(alu.ARITHMETIC_FLAGS, dtype=np.uint8)
+    _SHIFT_RESULT = np.frombuffer(alu.SHIFT_RESULT, dtype=np.uint8)
+
+
+class GumnutVectorCore:
+    """
+    Lockstep engine running one program on many independent Gumnut cores
+
+    All architectural state is kept in NumPy arrays with one row (lane)
+    per instance, e.g. ``r`` has the shape ``(instances, 8)`` and
+    ``data_memory`` the shape ``(instances, 256)``. Each iteration executes
+    one instruction on every active lane, grouping lanes by opcode so lanes
+    with diverging PCs are handled as well. The initial data memory and IO
+    controller registers can be set per lane through the arrays before
+    calling ``run()``.
+
+    Per lane results are identical to running a ``GumnutCore`` with the
+    same initial state. Exceptions only stop the faulting lane; its error
+    is recorded in ``error`` (see ``LANE_EXCEPTIONS``).
+
+    :param instances: Number of lanes
+    :param instruction_memory: Program shared by all lanes
+    :param data_memory: Initial data memory, shared or one row per lane
+    """
+
+    def __init__(self, instances, instruction_memory, data_memory=None):
+        if np is None:
+            raise ImportError("GumnutVectorCore requires numpy")
+        self.instances = instances
+        self.instruction_memory_size = 4096
+        self.data_memory_size = 256
+        self.IO_controller_register_size = 256
+
+        if len(instruction_memory) > self.instruction_memory_size:
+            raise InstructionMemorySizeExceeded(len(instruction_memory), "Instruction memory size exceeded")
+        decoder = GumnutDecoder()
+        decoded = dict()
+        for objectcode in set(instruction_memory):
+            instruction = decoder.decode_instruction(objectcode)
+            decoded[objectcode] = (decode_opcode(instruction), instruction.rd, instruction.op1, instruction.op2)
+        fields = np.zeros((4, self.instruction_memory_size), dtype=np.int32)
+        fields[0, :] = decode_opcode(decoder.decode_instruction(0))
+        if instruction_memory:
+            program = np.array([decoded[objectcode] for objectcode in instruction_memory])
+            fields[:, : len(instruction_memory)] = program.T
+        self.opcode, self.rd, self.op1, self.op2 = fields
+        self.program = list(instruction_memory)
+        self._groups = np.array(_opcode_groups(), dtype=np.int8)
+
+        self.r = np.zeros((instances, 8), dtype=np.int32)
+        self.PC = np.zeros(instances, dtype=np.int32)
+        self.SP = np.zeros(instances, dtype=np.int32)
+        self.CARRY = np.zeros(instances, dtype=bool)
+        self.ZERO = np.zeros(instances, dtype=bool)
+        self.WAIT = np.zeros(instances, dtype=bool)
+        self.STBY = np.zeros(instances, dtype=bool)
+        self.IREN = np.zeros(instances, dtype=bool)
+        self.IR = np.zeros(instances, dtype=bool)
+        self._PC = np.zeros(instances, dtype=np.int32)
+        self._CARRY = np.zeros(instances, dtype=bool)
+        self._ZERO = np.zeros(instances, dtype=bool)
+        self.return_address_stack = np.zeros((instances, 8), dtype=np.int32)
+        self.data_memory = np.zeros((instances, self.data_memory_size), dtype=np.uint8)
+        self.IO_controller_register = np.zeros((instances, self.IO_controller_register_size), dtype=np.uint8)
+        self.data_memory_access_addr = np.full(instances, -1, dtype=np.int32)
+        self.error = np.zeros(instances, dtype=np.int8)
+        self.steps = np.zeros(instances, dtype=np.int64)
+
+        if data_memory is not None:
+            data_memory = np.asarray(data_memory, dtype=np.uint8)
+            if data_memory.shape[-1] > self.data_memory_size:
+                raise DataMemorySizeExceeded(data_memory.shape[-1], "Data memory size exceeded")
+            self.data_memory[:, : data_memory.shape[-1]] = data_memory
+
+    def run(self, max_steps, stop_on=()):
+        """
+        Perform up to ``max_steps`` steps on every lane
+
+        Each lane stops under the same conditions as ``GumnutCore.run``:
+        on an address in ``stop_on``, when entering WAIT or STBY without a
+        pending interrupt, or on an exception. Lanes which faulted in an
+        earlier run don't execute at all.
+
+        :return: ``VectorRunResult(reason, steps)`` with one ``StopReason``
+                 and the number of completed steps per lane
+        """
+        reason = np.full(self.instances, int(StopReason.budget), dtype=np.int8)
+        reason[self.error != NO_ERROR] = StopReason.exception
+        steps = np.zeros(self.instances, dtype=np.int64)
+        active = self.error == NO_ERROR
+        stop_on = np.array(sorted(stop_on), dtype=np.int32)
+
+        for _ in range(max_steps):
+            if not active.any():
+                break
+            completed = self.step(active)
+            steps += completed
+
+            faulted = active & ~completed
+            reason[faulted] = StopReason.exception
+            active &= completed
+
+            if stop_on.size:
+                hit = active & np.isin(self.PC, stop_on)
+                reason[hit] = StopReason.breakpoint
+                active &= ~hit
+
+            idle = active & (self.STBY | self.WAIT) & ~(self.IREN & self.IR)
+            reason[idle & self.STBY] = StopReason.stby
+            reason[idle & ~self.STBY] = StopReason.wait
+            active &= ~idle
+
+        return VectorRunResult(reason, steps)
+
+    def step(self, active=None):
+        """
+        Perform a single step on all ``active`` lanes (default: all lanes)
+
+        :return: Boolean array of the lanes which completed the step
+        """
+        if active is None:
+            active = self.error == NO_ERROR
+        lanes = np.flatnonzero(active)
+
+        # Take pending interrupts
+        interrupted = self.IREN[lanes] & self.IR[lanes]
+        irq = lanes[interrupted]
+        if irq.size:
+            self.IREN[irq] = False
+            self.WAIT[irq] = False
+            self.STBY[irq] = False
+            self._PC[irq] = self.PC[irq]
+            self._CARRY[irq] = self.CARRY[irq]
+            self._ZERO[irq] = self.ZERO[irq]
+            self.PC[irq] = 1
+
+        lanes = lanes[~interrupted & ~self.WAIT[lanes] & ~self.STBY[lanes]]
+        faulted = np.zeros(self.instances, dtype=bool)
+
+        invalid_PC = (self.PC[lanes] < 0) | (self.PC[lanes] >= self.instruction_memory_size)
+        if invalid_PC.any():
+            self._fault(faulted, lanes[invalid_PC], INVALID_PC_VALUE)
+            lanes = lanes[~invalid_PC]
+        PC = self.PC[lanes]
+        groups = self._groups[self.opcode[PC]]
+        for group in np.unique(groups):
+            selected = groups == group
+            sel = lanes[selected]
+            pc = PC[selected]
+            self._execute(group, sel, self.opcode[pc], self.rd[pc], self.op1[pc], self.op2[pc], faulted)
+
+        lanes = lanes[~faulted[lanes]]
+        self.r[lanes, 0] = 0
+        self.PC[lanes] += 1
+        overflow = (self.PC[lanes] >= self.instruction_memory_size) | (self.PC[lanes] < 0)
+        if overflow.any():
+            self._fault(faulted, lanes[overflow], INVALID_PC_VALUE)
+
+        self.steps[active & ~faulted] += 1
+        return active & ~faulted
+
+    def _fault(self, faulted, lanes, error):
+        faulted[lanes] = True
+        self.error[lanes] = error
+
+    def _set_flags(self, lanes, flags):
+        """Apply the flag updates of ``alu.ARITHMETIC_FLAGS``, like GumnutCore.check_range does"""
+        carry = flags == alu.CARRY_SET
+        zero = flags == alu.ZERO_SET
+        self.CARRY[lanes], self.ZERO[lanes] = carry | (self.CARRY[lanes] & zero), zero | (self.ZERO[lanes] & carry)
+
+    def _execute(self, group, lanes, opcode, rd, op1, op2, faulted):
+        r = self.r
+        if group == _ALU:
+            fn = opcode & 0x7
+            a = r[lanes, op1]
+            b = np.where(opcode >= OPCODE["add", "immediate"], op2, r[lanes, op2 & 0x7])
+            # add, addc, sub and subc are looked up, fn bit 1 selects SUB and bit 0 the carry in
+            arithmetic = fn < 4
+            carry = (fn & 1) & self.CARRY[lanes]
+            index = np.where(arithmetic, (fn >> 1) << 17 | carry << 16 | a << 8 | b, 0)
+            result = _ARITHMETIC_RESULT[index]
+            flags = _ARITHMETIC_FLAGS[index]
+            if not arithmetic.all():
+                logic = np.select([fn == 4, fn == 5, fn == 6], [a & b, a | b, a ^ b], a & ~b)
+                result = np.where(arithmetic, result, logic)
+                flags = np.where(arithmetic, flags, np.where(logic == 0, alu.ZERO_SET, alu.FLAGS_CLEARED))
+            self._set_flags(lanes, flags)
+            r[lanes, rd] = result
+
+        elif group == _SHIFT:
+            a = r[lanes, op1]
+            fn = opcode - OPCODE["shl", None]
+            result = _SHIFT_RESULT[fn << 11 | op2 << 8 | a]
+            unchanged = (op2 == 0) & (fn >= alu.ROL)  # Rotating by 0 leaves rd untouched
+            r[lanes, rd] = np.where(unchanged, r[lanes, rd], result)
+
+        elif group in (_LDM, _STM):
+            address = r[lanes, op1] + op2
+            self.data_memory_access_addr[lanes] = address
+            violation = address > self.data_memory_size
+            self._fault(faulted, lanes[violation], DATA_MEMORY_ACCESS_VIOLATION)
+            out_of_range = ~violation & (address >= self.data_memory_size)
+            self._fault(faulted, lanes[out_of_range], INDEX_ERROR)
+            ok = ~violation & ~out_of_range
+            lanes, address, rd = lanes[ok], address[ok], rd[ok]
+            if group == _LDM:
+                r[lanes, rd] = self.data_memory[lanes, address]
+            else:
+                self.data_memory[lanes, address] = r[lanes, rd]
+
+        elif group in (_INP, _OUT):
+            address = r[lanes, op1] + op2
+            out_of_range = address >= self.IO_controller_register_size
+            self._fault(faulted, lanes[out_of_range], INDEX_ERROR)
+            lanes, address, rd = lanes[~out_of_range], address[~out_of_range], rd[~out_of_range]
+            if group == _INP:
+                r[lanes, rd] = self.IO_controller_register[lanes, address]
+            else:
+                self.IO_controller_register[lanes, address] = r[lanes, rd]
+
+        elif group == _BRANCH:
+            fn = opcode - OPCODE["bz", None]
+            zero = self.ZERO[lanes]
+            carry = self.CARRY[lanes]
+            taken = np.select([fn == 0, fn == 1, fn == 2], [zero, ~zero, carry], ~carry)
+            offset = np.where(op2 & 0x80, op2 - 0xFF - 1, op2)
+            self.PC[lanes] += np.where(taken, offset, 0)
+
+        elif group == _JMP:
+            self.PC[lanes] = op2 - 1
+
+        elif group == _JSB:
+            stack = self.return_address_stack
+            stack[lanes, :-1] = stack[lanes, 1:]
+            stack[lanes, -1] = self.PC[lanes]
+            self.SP[lanes] += 1
+            self.PC[lanes] = op2 - 1
+
+        elif group == _RET:
+            stack = self.return_address_stack
+            self.SP[lanes] -= 1
+            self.PC[lanes] = stack[lanes, -1]
+            stack[lanes, 1:] = stack[lanes, :-1]
+            stack[lanes, 0] = 0
+
+        elif group == _RETI:
+            self.PC[lanes] = self._PC[lanes] - 1
+            self.CARRY[lanes] = self._CARRY[lanes]
+            self.ZERO[lanes] = self._ZERO[lanes]
+            self.IREN[lanes] = True
+            self.IR[lanes] = False
+
+        elif group == _ENAI:
+            self.IREN[lanes] = True
+
+        elif group == _DISI:
+            self.IREN[lanes] = False
+
+        elif group == _WAIT:
+            self.WAIT[lanes] = True
+
+        elif group == _STBY:
+            self.STBY[lanes] = True
+
+        else:
+            self._fault(faulted, lanes, INVALID_INSTRUCTION)
+
+    def get_lane(self, lane):
+        """Return the state of a single lane as a ``GumnutCore``"""
+        core = GumnutCore()
+        core.upload_instruction_memory(self.program)
+        core.r = [int(value) for value in self.r[lane]]
+        core.PC = int(self.PC[lane])
+        core.SP = int(self.SP[lane])
+        core.CARRY = bool(self.CARRY[lane])
+        core.ZERO = bool(self.ZERO[lane])
+        core.WAIT = bool(self.WAIT[lane])
+        core.STBY = bool(self.STBY[lane])
+        core.IREN = bool(self.IREN[lane])
+        core.IR = bool(self.IR[lane])
+        core._PC = int(self._PC[lane])  # pylint: disable=protected-access
+        core._CARRY = bool(self._CARRY[lane])  # pylint: disable=protected-access
+        core._ZERO = bool(self._ZERO[lane])  # pylint: disable=protected-access
+        core.return_address_stack = [int(value) for value in self.return_address_stack[lane]]
+        core.data_memory[:] = [int(value) for value in self.data_memory[lane]]
+        core.IO_controller_register[:] = [int(value) for value in self.IO_controller_register[lane]]
+        core.data_memory_access_addr = int(self.data_memory_access_addr[lane])
+        return core
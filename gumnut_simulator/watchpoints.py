@@ -0,0 +1,85 @@
+from collections import namedtuple
+
+
+# Memories which can be watched
+DATA_MEMORY = "data_memory"
+IO_CONTROLLER_REGISTER = "IO_controller_register"
+
+# Kinds of accesses, can be combined
+READ = 1
+WRITE = 2
+# Flag of addresses with writes of specific values watched
+_VALUE = 4
+
+WatchpointHit = namedtuple("WatchpointHit", "memory address access value PC")
+
+
+class Watchpoints:
+    """
+    Watched addresses of the data memory and the IO controller register
+
+    The watched kinds of access are stored as flags in one byte per
+    address (``data_memory`` and ``IO_controller_register``), so ``ldm``,
+    ``stm``, ``inp`` and ``out`` only have to index them to find out
+    whether they accessed a watched address. Values of watched writes are
+    kept in sets per address, looked up only when such an address is
+    written.
+    """
+
+    def __init__(self, data_memory_size, IO_controller_register_size):
+        self.data_memory = bytearray(data_memory_size)
+        self.IO_controller_register = bytearray(IO_controller_register_size)
+        self.values = {DATA_MEMORY: dict(), IO_CONTROLLER_REGISTER: dict()}
+
+    def __len__(self):
+        return len(self.get())
+
+    def _flags(self, memory):
+        if memory == DATA_MEMORY:
+            return self.data_memory
+        if memory == IO_CONTROLLER_REGISTER:
+            return self.IO_controller_register
+        raise ValueError("Unknown memory %r" % (memory,))
+
+    def add(self, memory, address, access=WRITE, value=None):
+        """
+        Watch ``access`` (``READ``, ``WRITE`` or both) of ``address`` in ``memory``
+
+        :param value: Only watch writes of this value
+        """
+        flags = self._flags(memory)
+        if not 0 <= address < len(flags):
+            raise ValueError("Address 0x%02X is out of range" % address)
+        if not access or access & ~(READ | WRITE):
+            raise ValueError("Unknown access %r" % (access,))
+        if value is None:
+            flags[address] |= access
+        else:
+            if access != WRITE:
+                raise ValueError("Values can only be watched for writes")
+            self.values[memory].setdefault(address, set()).add(value & 0xFF)
+            flags[address] |= _VALUE
+
+    def remove(self, memory, address):
+        """Stop watching ``address`` in ``memory``"""
+        self._flags(memory)[address] = 0
+        self.values[memory].pop(address, None)
+
+    def matches(self, memory, address, access, value):
+        """Return True if an ``access`` of ``address`` in ``memory`` with ``value`` is watched"""
+        flags = self._flags(memory)[address]
+        if flags & access:
+            return True
+        return bool(access == WRITE and flags & _VALUE and value in self.values[memory][address])
+
+    def get(self):
+        """Return all watchpoints as ``(memory, address, access, value)`` tuples, ``value`` may be ``None``"""
+        result = list()
+        for memory in (DATA_MEMORY, IO_CONTROLLER_REGISTER):
+            values = self.values[memory]
+            for address, flags in enumerate(self._flags(memory)):
+                if flags & (READ | WRITE):
+                    result.append((memory, address, flags & (READ | WRITE), None))
+                if flags & _VALUE:
+                    result += [(memory, address, WRITE, value) for value in sorted(values[address])]
+        return result
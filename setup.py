@@ -32,7 +32,7 @@ setuptools.setup(
     long_description=long_description,
     long_description_content_type="text/x-rst",
     url="https://github.com/bwiessneth/gumnut-simulator",
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=["benchmarks", "benchmarks.*"]),
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: GNU General Public License v3 or later (GPLv3+)",
@@ -60,5 +60,6 @@ setuptools.setup(
             "sphinx_rtd_theme",
             "sphinx-autoapi",
         ],
+        "numpy": ["numpy"],
     },
 )
@@ -0,0 +1,63 @@
+from gumnut_simulator import alu
+from gumnut_simulator.core import GumnutCore
+from gumnut_simulator.decoder import INSTR
+
+
+def rotate_left(value, count):
+    """Rotate bit by bit like the original implementation of rol"""
+    for _ in range(count):
+        value = ((value << 1) | (value >> 7)) & 0xFF
+    return value
+
+
+def rotate_right(value, count):
+    for _ in range(count):
+        value = ((value >> 1) | (value << 7)) & 0xFF
+    return value
+
+
+def test_arithmetic_tables_match_check_range():
+    cpu = GumnutCore()
+    mismatches = list()
+    for operation in (alu.ADD, alu.SUB):
+        for carry in (0, 1):
+            for a in range(256):
+                for b in range(256):
+                    result = a + b + carry if operation == alu.ADD else a - b - carry
+                    index = alu.arithmetic_index(operation, a, b, carry)
+                    flags = alu.ARITHMETIC_FLAGS[index]
+                    # Starting from both flags cleared and both set reveals which flag is left unchanged
+                    for previous in (False, True):
+                        cpu.CARRY = cpu.ZERO = previous
+                        expected = (cpu.check_range(result), cpu.CARRY, cpu.ZERO)
+                        if flags == alu.CARRY_SET:
+                            actual = (alu.ARITHMETIC_RESULT[index], True, previous)
+                        elif flags == alu.ZERO_SET:
+                            actual = (alu.ARITHMETIC_RESULT[index], previous, True)
+                        else:
+                            actual = (alu.ARITHMETIC_RESULT[index], False, False)
+                        if actual != expected:
+                            mismatches.append((operation, a, b, carry, previous))
+    assert not mismatches
+    assert len(alu.ARITHMETIC_RESULT) == len(alu.ARITHMETIC_FLAGS) == 4 * 256 * 256
+
+
+def test_shift_table():
+    for a in range(256):
+        for count in range(8):
+            assert alu.SHIFT_RESULT[alu.shift_index(alu.SHL, a, count)] == (a << count) & 0xFF
+            assert alu.SHIFT_RESULT[alu.shift_index(alu.SHR, a, count)] == a >> count
+            assert alu.SHIFT_RESULT[alu.shift_index(alu.ROL, a, count)] == rotate_left(a, count)
+            assert alu.SHIFT_RESULT[alu.shift_index(alu.ROR, a, count)] == rotate_right(a, count)
+
+
+def test_core_rotations():
+    cpu = GumnutCore()
+    for a in range(256):
+        for count in range(10):
+            cpu.r[1], cpu.r[2], cpu.r[3] = a, 0x5A, 0x5A
+            cpu.execute(INSTR("rol", None, 2, 1, count, "immediate"))
+            cpu.execute(INSTR("ror", None, 3, 1, count, "immediate"))
+            # Rotating by 0 leaves rd untouched
+            assert cpu.r[2] == (rotate_left(a, count) if count else 0x5A)
+            assert cpu.r[3] == (rotate_right(a, count) if count else 0x5A)
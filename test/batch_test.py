@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from gumnut_simulator import batch
+from gumnut_simulator.simulator import main
+
+
+COUNTDOWN_SOURCE = """
+start:  add r1, r0, 3
+loop:   stm r1, (r1)
+        sub r1, r1, 1
+        bnz loop
+        stby
+"""
+
+ENDLESS_SOURCE = """
+loop:   add r1, r1, 1
+        jmp loop
+"""
+
+
+@pytest.fixture
+def sources(tmp_path):
+    (tmp_path / "countdown.asm").write_text(COUNTDOWN_SOURCE)
+    (tmp_path / "endless.asm").write_text(ENDLESS_SOURCE)
+    (tmp_path / "broken.asm").write_text("foo r1, r2, r3\n")
+    (tmp_path / "notes.txt").write_text("not a source file")
+    return tmp_path
+
+
+def test_collect_sources(sources):
+    expected = [str(sources / name) for name in ("broken.asm", "countdown.asm", "endless.asm")]
+    assert batch.collect_sources([str(sources)]) == expected
+
+    manifest = sources / "manifest"
+    manifest.write_text("# programs\ncountdown.asm\n\nendless.asm\n")
+    assert batch.collect_sources([str(manifest), str(sources / "broken.asm")]) == expected[1:] + expected[:1]
+
+
+def test_run_job(sources):
+    record = batch.run_job(str(sources / "countdown.asm"))
+    assert record["status"] == "stby"
+    assert record["steps"] == 11
+    assert record["register"]["r1"] == 0
+    assert record["flags"]["ZERO"] is True
+    assert record["data_memory"][1:4] == [1, 2, 3]
+    assert record["run_time"] >= 0
+
+    record = batch.run_job(str(sources / "endless.asm"), max_steps=25000)
+    assert record["status"] == "budget"
+    assert record["steps"] == 25000
+
+    record = batch.run_job(str(sources / "endless.asm"), timeout=0)
+    assert record["status"] == "timeout"
+    assert record["steps"] == batch.TIMEOUT_CHECK_STEPS
+
+    record = batch.run_job(str(sources / "broken.asm"))
+    assert record["status"] == "assembly_error"
+    assert record["exception"]["type"]
+
+
+def test_batch_command(sources, capsys):
+    assert main(["batch", str(sources), "--max-steps", "100", "--workers", "2", "--chunk-size", "1"]) == 0
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    status = {record["file"]: record["status"] for record in records}
+    assert status == {
+        str(sources / "broken.asm"): "assembly_error",
+        str(sources / "countdown.asm"): "stby",
+        str(sources / "endless.asm"): "budget",
+    }
+
+
+def test_batch_command_output_file(sources, tmp_path):
+    output = tmp_path / "results.jsonl"
+    assert main(["batch", str(sources / "countdown.asm"), "--workers", "1", "-o", str(output)]) == 0
+    (record,) = [json.loads(line) for line in output.read_text().splitlines()]
+    assert record["status"] == "stby"
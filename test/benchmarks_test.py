@@ -0,0 +1,45 @@
+import pytest
+
+from benchmarks import macro, micro, results
+from gumnut_simulator.simulator import GumnutSimulator
+
+
+def test_programs():
+    simulator = GumnutSimulator()
+    simulator.setup(macro.load("bubble_sort.asm"))
+    data = list(simulator.get_data_memory()[:32])
+    macro.run_to_stby(simulator)
+    assert list(simulator.get_data_memory()[:32]) == sorted(data)
+
+    simulator.setup(macro.load("multiply.asm"))
+    macro.run_to_stby(simulator)
+    total = sum(i * i for i in range(1, 101)) % 65536
+    assert list(simulator.get_data_memory()[:2]) == [total & 0xFF, total >> 8]
+
+    simulator.setup(macro.load("interrupt_io.asm"))
+    macro.run_interrupts(simulator)
+    total = sum(i & 0xFF for i in range(macro.INTERRUPTS))
+    assert list(simulator.get_IO_controller_register()[1:4]) == [total & 0xFF, total >> 8 & 0xFF, 1000 & 0xFF]
+
+    simulator.setup(macro.load("timer.asm"))
+    steps = macro.run_timer(simulator)
+    assert steps == simulator.steps
+    assert 100 * macro.TIMER_PERIOD <= steps < 101 * macro.TIMER_PERIOD
+
+
+def test_micro_benchmarks_run():
+    measured = micro.bench_core(0.001)
+    assert set(measured) == {"core.step", "core.reset"}
+    assert all(value > 0 for value in measured.values())
+
+
+def test_results_compare(tmp_path):
+    path = str(tmp_path / "baseline.json")
+    results.save({"core.step": 1000.0, "core.reset": 100.0, "removed": 1.0}, path)
+    baseline = results.load(path)
+
+    rows, regressions = results.compare({"core.step": 850.0, "core.reset": 95.0, "added": 1.0}, baseline, 0.1)
+    assert [row[0] for row in rows] == ["core.reset", "core.step"]
+    assert rows[1][1:] == (850.0, 1000.0, pytest.approx(-0.15))
+    assert regressions == ["core.step"]
+    assert results.compare({"core.step": 850.0}, baseline, 0.2)[1] == []
@@ -0,0 +1,92 @@
+import os
+
+from gumnut_simulator.cache import AssemblyCache, CacheStats
+from gumnut_simulator.simulator import GumnutSimulator
+
+
+SOURCE = """
+start:  add r1, r0, 3
+loop:   stm r1, (r1)
+        sub r1, r1, 1
+        bnz loop
+        stby
+"""
+
+
+def test_cache_hits_and_misses():
+    cache = AssemblyCache()
+    program = cache.get(SOURCE)
+    assert cache.get(SOURCE) is program
+    assert cache.get(SOURCE + "\n") is not program
+    assert cache.stats() == CacheStats(hits=1, disk_hits=0, misses=2, entries=2)
+    assert program.InstrCount == 10
+    # Trailing empty words are not kept
+    assert len(program.instruction_memory) == 5
+    assert program.instruction_memory[0] == 0x00803
+
+    cache.clear()
+    assert cache.stats() == CacheStats(0, 0, 0, 0)
+
+
+def test_cache_evicts_least_recently_used():
+    cache = AssemblyCache(maxsize=2)
+    sources = ["add r%d, r0, 1\n" % register for register in range(3)]
+    cache.get(sources[0])
+    cache.get(sources[1])
+    cache.get(sources[0])
+    cache.get(sources[2])
+    assert list(cache.entries) == [cache.key(sources[0]), cache.key(sources[2])]
+    cache.get(sources[1])
+    assert cache.stats() == CacheStats(hits=1, disk_hits=0, misses=4, entries=2)
+
+
+def test_cache_directory(tmp_path):
+    program = AssemblyCache(directory=str(tmp_path)).get(SOURCE)
+    assert os.listdir(str(tmp_path)) == [AssemblyCache.key(SOURCE) + ".pickle"]
+
+    cache = AssemblyCache(directory=str(tmp_path))
+    assert cache.get(SOURCE) == program
+    assert cache.stats() == CacheStats(hits=0, disk_hits=1, misses=0, entries=1)
+
+    # Broken files are treated as a miss and replaced
+    (tmp_path / (AssemblyCache.key(SOURCE) + ".pickle")).write_bytes(b"broken")
+    cache = AssemblyCache(directory=str(tmp_path))
+    assert cache.get(SOURCE) == program
+    assert cache.get(SOURCE) == program
+    assert cache.stats() == CacheStats(hits=1, disk_hits=0, misses=1, entries=1)
+    assert AssemblyCache(directory=str(tmp_path)).get(SOURCE) == program
+
+
+def test_simulator_setup_uses_cache():
+    cache = AssemblyCache()
+    first = GumnutSimulator(assembly_cache=cache)
+    second = GumnutSimulator(assembly_cache=cache)
+    assert first.setup(SOURCE)
+    assert second.setup(SOURCE)
+    assert cache.stats().hits == 1
+    assert second.lsom_map is first.lsom_map
+
+    # Resetting one simulator must not clear the shared program
+    first.reset()
+    assert first.lsom_map == {}
+    assert len(second.lsom_map) > 0
+    assert second.run(100).steps == 11
+
+    assert not first.setup("foo r1, r2, r3\n")
+    assert not second.setup("foo r1, r2, r3\n")
+    assert cache.stats() == CacheStats(hits=1, disk_hits=0, misses=1, entries=1)
+
+    uncached = GumnutSimulator(assembly_cache=cache)
+    uncached.use_assembly_cache = False
+    assert uncached.setup(SOURCE)
+    assert list(uncached.get_instruction_memory()[:5]) == list(cache.get(SOURCE).instruction_memory)
+    assert cache.stats().hits == 2
+
+
+def test_shared_cache_is_not_serialised():
+    first = GumnutSimulator()
+    first.setup("secret: add r7, r0, 42\n")
+    second = GumnutSimulator()
+    second.setup(SOURCE)
+    assert second.assembly_cache is None
+    assert "secret" not in second.to_JSON()
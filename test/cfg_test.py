@@ -0,0 +1,126 @@
+from gumnut_simulator import cfg, simulator
+from gumnut_simulator.cfg import BRANCH, CALL, CALL_RETURN, FALLTHROUGH, INTERRUPT, JUMP, RESET, RETURN, Edge
+from gumnut_simulator.simulator import GumnutSimulator
+
+
+# Calls a subroutine with a loop twice and has an interrupt service routine and dead code
+SOURCE = """
+        jmp start
+isr:    add r7, r7, 1
+        reti
+start:  enai
+        jsb double
+        jsb double
+        stby
+dead:   add r1, r1, 1
+        jmp dead
+double: add r2, r0, 4
+again:  add r1, r1, r1
+        sub r2, r2, 1
+        bnz again
+        ret
+"""
+
+
+def test_blocks_and_edges():
+    gsimulator = GumnutSimulator()
+    gsimulator.setup(SOURCE)
+    graph = gsimulator.get_control_flow_graph()
+
+    assert graph.length == 14
+    assert dict(graph.entries) == {0: RESET, 1: INTERRUPT}
+    assert [(block.start, block.end) for block in graph.blocks.values()] == [
+        (0, 1),
+        (1, 3),
+        (3, 5),
+        (5, 6),
+        (6, 7),
+        (7, 9),
+        (9, 10),
+        (10, 13),
+        (13, 14),
+    ]
+    assert graph.blocks[0].successors == (Edge(3, JUMP),)
+    assert graph.blocks[1].successors == ()
+    assert graph.blocks[3].successors == (Edge(9, CALL), Edge(5, CALL_RETURN))
+    assert graph.blocks[9].successors == (Edge(10, FALLTHROUGH),)
+    assert graph.blocks[10].successors == (Edge(10, BRANCH), Edge(13, FALLTHROUGH))
+    # ret returns to both callers
+    assert graph.blocks[13].successors == (Edge(5, RETURN), Edge(6, RETURN))
+    assert graph.get_block(11) is graph.blocks[10]
+    assert graph.get_block(14) is None
+
+
+def test_unreachable_code_and_loops():
+    gsimulator = GumnutSimulator()
+    gsimulator.setup(SOURCE)
+    graph = gsimulator.get_control_flow_graph()
+
+    assert graph.get_unreachable_addresses() == [7, 8]
+    assert graph.get_unreachable_lines(gsimulator.lsom_map) == [8, 9]
+    # Calling a subroutine twice doesn't make a loop, neither does the dead one count
+    assert graph.loop_headers == {10}
+    assert graph.get_loop_header_lines(gsimulator.lsom_map) == [11]
+
+
+def test_programs_without_interrupts_and_targets_outside():
+    # add r1, r0, 1 / add r1, r1, 1 / jmp 0x100
+    graph = cfg.build([0x00801, 0x00901, 0x3C100])
+    assert dict(graph.entries) == {0: RESET}
+    assert list(graph.blocks) == [0]
+    assert graph.blocks[0].successors == (Edge(0x100, JUMP),)
+    assert 'b256 [shape=plaintext, label="0x100"];' in graph.to_dot()
+
+    # Code behind an enai which is never executed doesn't make the interrupt vector an entry
+    graph = cfg.build([0x3F500, 0x00801, 0x3F200])  # stby / add r1, r0, 1 / enai
+    assert dict(graph.entries) == {0: RESET}
+    assert graph.get_unreachable_addresses() == [1, 2]
+
+
+def test_graph_cache():
+    graphs = cfg.GraphCache(maxsize=1)
+    program = [0x00801, 0x3F500]
+    graph = graphs.get(program)
+    assert graphs.get(program + [0] * 10) is graph
+    assert graphs.stats() == cfg.GraphCacheStats(1, 1, 1)
+    graphs.get([0x3F500])
+    assert graphs.get(program) is not graph
+    assert graphs.stats() == cfg.GraphCacheStats(1, 3, 1)
+
+    # The graph follows changes of the instruction memory
+    gsimulator = GumnutSimulator()
+    gsimulator.setup(SOURCE)
+    graph = gsimulator.get_control_flow_graph()
+    assert gsimulator.get_control_flow_graph() is graph
+    gsimulator.CPU.write_instruction_memory(0, 0x3F500)  # stby
+    assert gsimulator.get_control_flow_graph().get_unreachable_addresses() == list(range(1, 14))
+
+
+def test_export(tmp_path):
+    gsimulator = GumnutSimulator()
+    gsimulator.setup(SOURCE)
+    graph = gsimulator.get_control_flow_graph()
+
+    dot = graph.to_dot(gsimulator.lsom_map)
+    assert dot.startswith("digraph cfg {")
+    assert "interrupt -> b1;" in dot
+    assert 'b10 -> b10 [label="branch"];' in dot
+    assert "again:  add r1, r1, r1\\l" in dot
+    assert 'b7 [label="0x007 - 0x008\\ndead:   add r1, r1, 1\\ljmp dead\\l", style=dashed];' in dot
+
+    data = graph.to_dict(gsimulator.lsom_map)
+    assert data["unreachable_lines"] == [8, 9]
+    assert data["loop_header_lines"] == [11]
+    assert data["blocks"][7] == {
+        "start": 10,
+        "end": 13,
+        "successors": [{"target": 10, "kind": BRANCH}, {"target": 13, "kind": FALLTHROUGH}],
+        "reachable": True,
+        "loop_header": True,
+        "lines": [11, 12, 13],
+    }
+
+    (tmp_path / "program.asm").write_text(SOURCE)
+    output = tmp_path / "cfg.json"
+    assert simulator.main(["cfg", str(tmp_path / "program.asm"), "--format", "json", "-o", str(output)]) == 0
+    assert output.read_text() == graph.to_JSON(gsimulator.lsom_map) + "\n"
@@ -1,7 +1,7 @@
 import random
 import pytest
 
-from gumnut_simulator.core import GumnutCore  # noqa: E402
+from gumnut_simulator.core import WRITE_LOG_LENGTH, GumnutCore, StopReason  # noqa: E402
 from gumnut_simulator.exceptions import (
     InvalidPCValue,
     InstructionMemorySizeExceeded,
@@ -117,6 +117,14 @@ def test_unknown_instruction(gcore):
     print(e.value.as_dict())
 
 
+def test_unknown_instruction_step(gcore):
+    gcore.upload_instruction_memory([0x3F600])
+    with pytest.raises(InvalidInstruction) as e:
+        gcore.step()
+    print(e.__repr__())
+    print(e.value.as_dict())
+
+
 def test_empty_instruction(gcore):
     instr = None
     with pytest.raises(InvalidInstruction) as e:
@@ -934,3 +942,179 @@ def test_ret_instruction(gcore):
     assert gcore.PC == 128
     assert gcore.SP == 0
     assert gcore.return_address_stack[-1] == 0
+
+
+def test_upload_instruction_memory_predecodes(gcore):
+    # add r1, r0, 5 / sub r1, r1, 1 / stby
+    program = [0x00805, 0x08901, 0x3F500]
+    gcore.upload_instruction_memory(program)
+    assert [decoded.instruction for decoded in gcore.decoded_instruction_memory[:4]] == [
+        INSTR("add", 0, 1, 0, 5, "immediate"),
+        INSTR("sub", 2, 1, 1, 1, "immediate"),
+        INSTR("stby", 5, 0, 0, 0, None),
+        INSTR("add", 0, 0, 0, 0, "immediate"),
+    ]
+    assert len(gcore.decoded_instruction_memory) == gcore.instruction_memory_size
+
+
+def test_write_instruction_memory_invalidates_slot(gcore):
+    program = [0x00805, 0x08901, 0x3F500]
+    gcore.upload_instruction_memory(program)
+
+    # Replace 'sub r1, r1, 1' with 'add r1, r1, 1'
+    gcore.write_instruction_memory(1, 0x00901)
+    assert gcore.decoded_instruction_memory[0].instruction == INSTR("add", 0, 1, 0, 5, "immediate")
+    assert gcore.decoded_instruction_memory[1] is None
+    assert gcore.decoded_instruction_memory[2].instruction == INSTR("stby", 5, 0, 0, 0, None)
+
+    gcore.step()
+    gcore.step()
+    assert gcore.r[1] == 6
+    assert gcore.decoded_instruction_memory[1].instruction == INSTR("add", 0, 1, 1, 1, "immediate")
+
+    with pytest.raises(InstructionMemorySizeExceeded):
+        gcore.write_instruction_memory(gcore.instruction_memory_size, 0)
+
+
+def test_run_returns_exception(gcore):
+    gcore.upload_instruction_memory([0x3F600])
+    result = gcore.run(10)
+    assert result.reason == StopReason.exception
+    assert result.steps == 0
+    assert isinstance(result.exception, InvalidInstruction)
+
+
+def test_run_stops_on_wait(gcore):
+    # add r1, r0, 5 / wait
+    gcore.upload_instruction_memory([0x00805, 0x3F400])
+    result = gcore.run(10)
+    assert result == (StopReason.wait, 2, 1, None)
+    assert gcore.WAIT
+    assert gcore.PC == 2
+
+    # A pending interrupt wakes the core up again
+    gcore.IREN = True
+    gcore.IR = True
+    result = gcore.run(10, stop_on={1})
+    assert result == (StopReason.breakpoint, 1, 2, None)
+    assert not gcore.WAIT
+
+
+def test_idle_and_halted(gcore):
+    # add r1, r0, 5 / wait
+    gcore.upload_instruction_memory([0x00805, 0x3F400])
+    assert not gcore.is_idle()
+    assert gcore.fast_forward(100) == 0
+    gcore.run(10)
+    assert gcore.is_idle()
+    assert gcore.is_halted()
+
+    gcore.IREN = True
+    assert gcore.is_idle()
+    assert not gcore.is_halted()
+    assert gcore.fast_forward(10**9) == 10**9
+    assert gcore.PC == 2
+    assert gcore.WAIT
+
+    gcore.IR = True
+    assert not gcore.is_idle()
+    assert gcore.fast_forward(100) == 0
+
+
+def test_memories_are_compact_buffers(gcore):
+    assert isinstance(gcore.data_memory, bytearray)
+    assert isinstance(gcore.IO_controller_register, bytearray)
+    assert gcore.instruction_memory.itemsize >= 3
+
+    gcore.upload_data_memory([0x1FF, 2, 3])
+    assert list(gcore.data_memory[:4]) == [0xFF, 2, 3, 0]
+    gcore.upload_instruction_memory([0x3F500, 0x7FFFF])
+    assert list(gcore.instruction_memory[:3]) == [0x3F500, 0x3FFFF, 0]
+
+    data_memory = gcore.data_memory
+    view = memoryview(gcore.instruction_memory)
+    gcore.IO_controller_register[7] = 42
+    gcore.reset()
+    assert gcore.data_memory is data_memory
+    assert not any(gcore.data_memory) and not any(gcore.IO_controller_register) and not any(view)
+    assert len(gcore.instruction_memory) == gcore.instruction_memory_size
+
+
+def core_state(core):
+    return (
+        core.r[:],
+        core.PC,
+        core.SP,
+        core.CARRY,
+        core.ZERO,
+        core.WAIT,
+        core.STBY,
+        core.IREN,
+        core.return_address_stack[:],
+        bytes(core.data_memory),
+        bytes(core.IO_controller_register),
+        core.instruction_memory.tobytes(),
+        core.data_memory_access_addr,
+        core.instruction,
+    )
+
+
+def test_snapshot_restore(gcore):
+    # add r1, r0, 5 / jsb 4 / sub r1, r1, 1 / stby / stm r1, (r1)+16 / ret
+    program = [0x00805, 0x3D004, 0x08901, 0x3F500, 0x24910, 0x3F000]
+    gcore.upload_instruction_memory(program)
+    gcore.IO_controller_register[1] = 7
+    gcore.run(2)
+    snapshot = gcore.snapshot()
+    state = core_state(gcore)
+
+    gcore.run(10)
+    assert gcore.STBY
+    assert gcore.data_memory[21] == 5
+    gcore.restore(snapshot)
+    assert core_state(gcore) == state
+    assert gcore.data_memory[21] == 0
+    assert gcore.IO_controller_register[1] == 7
+
+    # Snapshots share the instruction memory until it is written
+    assert gcore.snapshot().instruction_memory is snapshot.instruction_memory
+    gcore.write_instruction_memory(2, 0x08902)  # sub r1, r1, 2
+    changed = gcore.snapshot()
+    assert changed.instruction_memory is not snapshot.instruction_memory
+    gcore.run(10)
+    assert gcore.r[1] == 3
+
+    gcore.restore(snapshot)
+    assert gcore.instruction_memory[2] == 0x08901
+    assert gcore.decoded_instruction_memory[2].instruction == INSTR("sub", 2, 1, 1, 1, "immediate")
+    gcore.run(10)
+    assert gcore.r[1] == 4
+
+    with pytest.raises(AttributeError):
+        snapshot.PC = 0
+
+
+def test_write_log(gcore):
+    # stm r1, (r0)+4 / stm r1, (r0)+5 / out r1, (r0)+7 / stm r1, (r0)+9 / stby
+    gcore.upload_instruction_memory([0x24804, 0x24805, 0x2C807, 0x24809, 0x3F500])
+    writes = gcore.data_memory_writes
+    first = gcore.next_generation()
+    assert writes.changed_ranges(gcore.data_memory, first - 1) == [(0, [0] * 256)]
+    assert writes.changed_ranges(gcore.data_memory, first) == []
+
+    gcore.r[1] = 3
+    gcore.run(2)
+    second = gcore.next_generation()
+    gcore.run(3)
+    gcore.next_generation()
+    assert writes.changed_ranges(gcore.data_memory, first) == [(4, [3, 3]), (9, [3])]
+    assert writes.changed_ranges(gcore.data_memory, second) == [(9, [3])]
+    assert gcore.IO_controller_register_writes.changed_ranges(gcore.IO_controller_register, second) == [(7, [3])]
+
+    # Generations beyond the kept ones return the whole memory
+    for _ in range(WRITE_LOG_LENGTH):
+        gcore.next_generation()
+    assert writes.changed_ranges(gcore.data_memory, second) == [(0, list(gcore.data_memory))]
+    gcore.upload_data_memory([1])
+    assert writes.changed_ranges(gcore.data_memory, gcore.next_generation()) == []
+    assert writes.changed_ranges(gcore.data_memory, gcore.generation - 1) == [(0, list(gcore.data_memory))]
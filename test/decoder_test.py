@@ -1,5 +1,13 @@
 import pytest
-from gumnut_simulator.decoder import GumnutDecoder, INSTR
+from gumnut_simulator.decoder import (
+    GumnutDecoder,
+    INSTR,
+    OPCODES,
+    OP_INVALID,
+    build_decode_table,
+    decode_opcode,
+    get_decode_table_stats,
+)
 
 
 @pytest.fixture
@@ -94,3 +102,36 @@ def test_decode_misc_instructions(gdecoder):
     assert gdecoder.decode_instruction(0x3F300) == INSTR("disi", 3, 0, 0, 0, None)
     assert gdecoder.decode_instruction(0x3F400) == INSTR("wait", 4, 0, 0, 0, None)
     assert gdecoder.decode_instruction(0x3F500) == INSTR("stby", 5, 0, 0, 0, None)
+
+
+def test_decode_table_matches_decoder(gdecoder):
+    table = build_decode_table()
+    assert len(table) == 2 ** 18
+    for objectcode, instruction in enumerate(table):
+        assert gdecoder.decode_instruction(objectcode) == instruction
+
+
+def test_decode_table_shared():
+    decoder_a = GumnutDecoder(use_table=True)
+    decoder_b = GumnutDecoder(use_table=True, eager=True)
+    assert decoder_a.decode_instruction(0x38A60) == INSTR("add", 0, 1, 2, 3, "register")
+    assert decoder_a.decode_instruction(0x3F500) is decoder_b.decode_instruction(0x3F500)
+    # Bits above the 18 bit object code are ignored just like in the bitfield decoder
+    assert decoder_a.decode_instruction(0x3F500 | 0x40000) == INSTR("stby", 5, 0, 0, 0, None)
+
+    stats = get_decode_table_stats()
+    assert stats.entries == 2 ** 18
+    assert 0 < stats.unique_entries < stats.entries
+    assert stats.build_time > 0
+    assert stats.size > 0
+
+
+def test_decode_opcode(gdecoder):
+    assert OPCODES[decode_opcode(gdecoder.decode_instruction(0x38A60))] == ("add", "register")
+    assert OPCODES[decode_opcode(gdecoder.decode_instruction(0xA12))] == ("add", "immediate")
+    assert OPCODES[decode_opcode(gdecoder.decode_instruction(0x30A82))] == ("rol", None)
+    assert OPCODES[decode_opcode(gdecoder.decode_instruction(0x3F500))] == ("stby", None)
+    # Access mode is ignored for non arithmetic/logical instructions
+    assert OPCODES[decode_opcode(INSTR("shl", None, 2, 1, 1, "immediate"))] == ("shl", None)
+    assert decode_opcode(gdecoder.decode_instruction(0x3F600)) == OP_INVALID
+    assert decode_opcode(INSTR("add", 0, 1, 1, 1, None)) == OP_INVALID
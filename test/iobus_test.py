@@ -0,0 +1,93 @@
+import pytest
+
+from gumnut_simulator.core import GumnutCore, StopReason
+from gumnut_simulator.iobus import UART, CallbackDevice, Device
+from gumnut_simulator.simulator import GumnutSimulator
+
+
+# Echo every byte received by the UART at 0x10 in upper case, count the bytes at 0x20
+SOURCE = """
+loop:   inp r1, (r0)+0x11
+        sub r0, r1, 1
+        bnz done
+        inp r2, (r0)+0x10
+        sub r2, r2, 0x20
+        out r2, (r0)+0x10
+        add r3, r3, 1
+        out r3, (r0)+0x20
+        jmp loop
+done:   stby
+"""
+
+
+class Counter(Device):
+    def __init__(self):
+        self.reads = list()
+        self.writes = list()
+        self.flushes = 0
+
+    def read(self, offset):
+        self.reads.append(offset)
+        return 0x100 + offset
+
+    def write(self, offset, value):
+        self.writes.append((offset, value))
+
+    def flush(self):
+        self.flushes += 1
+
+
+def test_device_hooks():
+    core = GumnutCore()
+    counter = Counter()
+    core.attach_IO_device(counter, 4, 2)
+    # inp r1, (r0)+5 / out r1, (r0)+4 / inp r2, (r0)+3 / out r1, (r0)+3
+    core.upload_instruction_memory([0x28805, 0x2C804, 0x29003, 0x2C803])
+    assert core.run(4).reason == StopReason.budget
+    assert counter.reads == [1]
+    assert counter.writes == [(0, 1)]
+    assert core.r[1] == 1
+    assert list(core.IO_controller_register[3:6]) == [1, 1, 0]
+
+    with pytest.raises(ValueError):
+        core.attach_IO_device(Device(), 5)
+    with pytest.raises(ValueError):
+        core.attach_IO_device(Device(), 255, 2)
+    core.detach_IO_device(counter)
+    core.attach_IO_device(Device(), 5)
+    assert core.IO_bus.devices[4] is None
+
+
+@pytest.mark.parametrize("translate", [False, True])
+def test_uart_echo(translate):
+    output = list()
+    uart = UART(on_output=output.append)
+    counter = CallbackDevice()
+    simulator = GumnutSimulator()
+    if translate:
+        simulator.CPU.enable_translation()
+    simulator.setup(SOURCE)
+    simulator.CPU.attach_IO_device(uart, 0x10, 2)
+    simulator.CPU.attach_IO_device(counter, 0x20)
+
+    uart.feed(b"hello")
+    assert simulator.run(1000).reason == StopReason.stby
+    assert output == [b"HELLO"]
+    assert counter.values[0] == 5
+    assert simulator.get_IO_controller_register()[0x20] == 5
+
+    simulator.reset()
+    assert len(uart.output) == len(uart.input) == 0
+    assert counter.values[0] == 0
+
+
+def test_uart_ring_buffer():
+    uart = UART(capacity=4)
+    for value in b"abcdef":
+        uart.write(UART.DATA, value)
+    uart.flush()
+    assert uart.drain() == b"cdef"
+    assert uart.drain() == b""
+    assert uart.read(UART.STATUS) == 0
+    uart.feed(b"x")
+    assert (uart.read(UART.STATUS), uart.read(UART.DATA), uart.read(UART.STATUS)) == (1, ord("x"), 0)
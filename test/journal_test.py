@@ -0,0 +1,156 @@
+import pytest
+
+from gumnut_simulator.core import StopReason
+from gumnut_simulator.simulator import GumnutSimulator, SimulatorState
+
+
+SOURCE = """
+        jmp start
+isr:    add r5, r5, 1
+        reti
+start:  add r1, r0, 5
+loop:   jsb store
+        out r1, (r0)+1
+        sub r1, r1, 1
+        bnz loop
+        stby
+store:  stm r1, (r1)+16
+        ret
+"""
+
+
+def simulator_state(simulator):
+    cpu = simulator.CPU
+    return (
+        cpu.r[:],
+        cpu.CARRY,
+        cpu.ZERO,
+        cpu.PC,
+        cpu.SP,
+        cpu.return_address_stack[:],
+        cpu.IREN,
+        cpu.IR,
+        cpu.WAIT,
+        cpu.STBY,
+        bytes(cpu.data_memory),
+        bytes(cpu.IO_controller_register),
+        cpu.data_memory_access_addr,
+        cpu.instruction,
+        simulator.steps,
+        simulator.previous_PC,
+        simulator.state,
+    )
+
+
+@pytest.fixture
+def gsimulator():
+    simulator = GumnutSimulator()
+    simulator.setup(SOURCE)
+    return simulator
+
+
+@pytest.mark.parametrize("capacity, checkpoint_interval", [(1000, 1000), (1000, 4), (10, 3)])
+def test_step_back(gsimulator, capacity, checkpoint_interval):
+    gsimulator.enable_journal(capacity, checkpoint_interval)
+    gsimulator.CPU.IREN = True
+    history = [simulator_state(gsimulator)]
+    for step in range(40):
+        if step == 12:
+            gsimulator.trigger_interrupt()
+            history[-1] = simulator_state(gsimulator)
+        gsimulator.step()
+        history.append(simulator_state(gsimulator))
+    assert gsimulator.CPU.STBY
+    assert gsimulator.CPU.r[5] == 1
+
+    assert gsimulator.step_back(1) == 1
+    assert simulator_state(gsimulator) == history[-2]
+    assert gsimulator.step_back(7) == 7
+    assert simulator_state(gsimulator) == history[-9]
+
+    # Stepping forward again replaces the undone steps
+    gsimulator.step()
+    gsimulator.step()
+    assert simulator_state(gsimulator) == history[-7]
+
+    expected = 34 if capacity > 34 else 4
+    assert gsimulator.step_back(100) == expected
+    assert simulator_state(gsimulator) == history[34 - expected]
+    assert gsimulator.step_back(1) == 0
+
+
+def test_run_is_journaled(gsimulator):
+    stepped = GumnutSimulator()
+    stepped.setup(SOURCE)
+    gsimulator.enable_journal()
+    history = [simulator_state(stepped)]
+    for _ in range(30):
+        stepped.step()
+        history.append(simulator_state(stepped))
+
+    result = gsimulator.run(30)
+    assert result.steps == 30
+    assert simulator_state(gsimulator) == history[30]
+    gsimulator.step_back(30)
+    assert simulator_state(gsimulator) == history[0]
+
+    assert gsimulator.run(1000).reason == StopReason.stby
+    assert gsimulator.steps == len(gsimulator.journal)
+
+
+def test_run_back_to_breakpoint(gsimulator):
+    gsimulator.enable_journal()
+    gsimulator.run(23)
+    assert gsimulator.CPU.r[1] == 2
+
+    gsimulator.toggle_breakpoint(10)  # stm r1, (r1)+16
+    assert gsimulator.run_back_to_breakpoint() == 2
+    assert gsimulator.get_current_line() == 10
+    assert gsimulator.get_state() == SimulatorState.breakpoint
+    assert list(gsimulator.get_data_memory()[18:22]) == [0, 3, 4, 5]
+
+    assert gsimulator.run_back_to_breakpoint() == 6
+    assert gsimulator.CPU.r[1] == 3
+    assert list(gsimulator.get_data_memory()[18:22]) == [0, 0, 4, 5]
+    assert gsimulator.steps == 15
+
+    # Without a breakpoint further back, step back to the oldest recorded state
+    gsimulator.toggle_breakpoint(10)
+    assert gsimulator.run_back_to_breakpoint() == 15
+    assert gsimulator.steps == 0
+    assert not any(gsimulator.get_data_memory())
+
+
+def test_journal_is_cleared(gsimulator):
+    assert gsimulator.step_back() == 0
+    gsimulator.enable_journal()
+    gsimulator.run(10)
+    gsimulator.set_IO_controller_register(0, 1)
+    assert gsimulator.step_back() == 0
+    gsimulator.run(10)
+    gsimulator.setup(SOURCE)
+    assert len(gsimulator.journal) == 0
+
+
+def test_raising_steps_are_not_journaled():
+    # The IO register address 10 + 255 is out of range
+    source = """
+        add r1, r0, 10
+        inp r2, (r1)+255
+        stby
+"""
+    simulator = GumnutSimulator()
+    simulator.setup(source)
+    simulator.enable_journal(checkpoint_interval=1)
+    with pytest.raises(IndexError):
+        simulator.run(10)
+    assert simulator.steps == len(simulator.journal) == 1
+    assert simulator.step_back(5) == 1
+    assert (simulator.steps, simulator.CPU.PC, simulator.CPU.r[1]) == (0, 0, 0)
+
+    simulator.step()
+    with pytest.raises(IndexError):
+        simulator.step()
+    assert simulator.steps == len(simulator.journal) == 1
+    assert simulator.step_back(5) == 1
+    assert simulator.steps == 0
@@ -0,0 +1,121 @@
+from benchmarks import macro
+from gumnut_simulator import batch
+from gumnut_simulator.core import GumnutCore, StopReason
+from gumnut_simulator.iobus import CallbackDevice
+from gumnut_simulator.simulator import GumnutSimulator, SimulatorState
+
+
+# Counts down, then increments r2 forever, which repeats every 512 steps
+SPIN_SOURCE = """
+        add r1, r0, 3
+count:  sub r1, r1, 1
+        bnz count
+spin:   add r2, r2, 1
+        jmp spin
+"""
+
+# Waits for interrupts forever
+WAIT_SOURCE = """
+        jmp start
+isr:    add r1, r1, 1
+        reti
+start:  enai
+loop:   wait
+        jmp loop
+"""
+
+# Polls IO register 0 until it isn't 0
+POLL_SOURCE = """
+poll:   inp r1, (r0)
+        add r0, r1, 0
+        bz poll
+        stby
+"""
+
+
+def test_infinite_loop_is_detected():
+    simulator = GumnutSimulator()
+    simulator.setup(SPIN_SOURCE)
+    simulator.enable_loop_detection()
+    result = simulator.run(100000)
+    assert result.reason == StopReason.loop
+    # Found within twice the length of the loop after entering it
+    assert result.steps < 7 + 2 * 512 + 2
+    assert simulator.state == SimulatorState.halt
+    assert simulator.exception.type == "InfiniteLoop"
+    assert simulator.exception.message == "Provable infinite loop at PC 0x003 / line 4"
+    assert simulator.get_current_line() == 4
+
+    # The reported state really repeats
+    cpu = simulator.CPU
+    state = (cpu.PC, list(cpu.r), cpu.CARRY, cpu.ZERO, bytes(cpu.data_memory))
+    simulator.disable_loop_detection()
+    simulator.run(512)
+    assert (cpu.PC, list(cpu.r), cpu.CARRY, cpu.ZERO, bytes(cpu.data_memory)) == state
+
+
+def test_terminating_programs_are_not_reported():
+    for name, driver in macro.BENCHMARKS:
+        plain = GumnutSimulator()
+        plain.setup(macro.load(name))
+        detecting = GumnutSimulator()
+        detecting.enable_loop_detection()
+        detecting.setup(macro.load(name))
+        assert driver(detecting) == driver(plain)
+        assert detecting.CPU.snapshot() == plain.CPU.snapshot()
+        assert detecting.exception is None
+
+
+def test_core_run_with_stop_reasons():
+    cpu = GumnutCore()
+    cpu.enable_loop_detection()
+    cpu.upload_instruction_memory([0x00801, 0x00801, 0x3F500])  # add r1, r0, 1 twice, stby
+    assert cpu.run(10, stop_on=(1,)).reason == StopReason.breakpoint
+    assert cpu.run(10).reason == StopReason.stby
+
+    cpu.reset()
+    cpu.upload_instruction_memory([0x3C000])  # jmp 0
+    result = cpu.run(10)
+    assert result.reason == StopReason.loop
+    assert result.exception.expression == "0x000"
+
+    # Uploads drop the saved state
+    cpu.upload_instruction_memory([0x3C000])
+    assert cpu.run(1).reason == StopReason.budget
+
+
+def test_interrupts_and_IO_are_input():
+    simulator = GumnutSimulator()
+    simulator.enable_loop_detection()
+    simulator.setup(WAIT_SOURCE)
+    for i in range(3):
+        assert simulator.run(1000).reason == StopReason.wait
+        simulator.trigger_interrupt()
+    assert simulator.run(1000).reason == StopReason.wait
+    assert simulator.get_register()["r1"] == 3
+
+    simulator.setup(POLL_SOURCE)
+    assert simulator.run(1000).reason == StopReason.loop
+    simulator.setup(POLL_SOURCE)
+    simulator.schedule_IO_controller_register(500, 0, 1)
+    assert simulator.run(1000).reason == StopReason.stby
+
+    # Devices may change the values read at any time
+    simulator.setup(POLL_SOURCE)
+    reads = list()
+
+    def read(offset):
+        reads.append(offset)
+        return 1 if len(reads) > 100 else 0
+
+    simulator.CPU.attach_IO_device(CallbackDevice(on_read=read), 0)
+    assert simulator.run(1000).reason == StopReason.stby
+
+
+def test_batch_detects_loops(tmp_path):
+    (tmp_path / "spin.asm").write_text(SPIN_SOURCE)
+    record = batch.run_job(str(tmp_path / "spin.asm"), simulator=GumnutSimulator(), detect_loops=True)
+    assert record["status"] == "loop"
+    assert record["exception"]["type"] == "InfiniteLoop"
+    record = batch.run_job(str(tmp_path / "spin.asm"), max_steps=5000, simulator=GumnutSimulator())
+    assert record["status"] == "budget"
@@ -0,0 +1,87 @@
+from gumnut_simulator.core import GumnutCore, StopReason
+from gumnut_simulator.profiler import HotSpot
+from gumnut_simulator.simulator import GumnutSimulator
+
+
+SOURCE = """
+        jmp start
+isr:    reti
+start:  add r1, r0, 3
+loop:   jsb store
+        sub r1, r1, 1
+        bnz loop
+        stby
+store:  stm r1, (r1)
+        jsb count
+        ret
+count:  add r2, r2, 1
+        ret
+"""
+
+
+def test_core_profiling():
+    core = GumnutCore()
+    # add r1, r0, 2 / loop: sub r1, r1, 1 / bnz loop / stby
+    core.upload_instruction_memory([0x00802, 0x08901, 0x3E4FE, 0x3F500])
+    assert core.profiler is None
+    core.enable_profiling()
+    assert core.run(100).reason == StopReason.stby
+    assert list(core.profiler.pc_counts[:5]) == [1, 2, 2, 1, 0]
+    assert core.profiler.get_opcode_counts() == {"add immediate": 1, "sub immediate": 2, "bnz": 2, "stby": 1}
+    assert core.profiler.stack_counts == {(): 6}
+
+    core.reset()
+    assert sum(core.profiler.pc_counts) == 0
+    assert core.profiler.get_opcode_counts() == {}
+    core.enable_profiling(False)
+    assert core.profiler is None
+
+
+def test_profile_matches_steps():
+    stepped = GumnutSimulator()
+    stepped.setup(SOURCE)
+    stepped.enable_profiling()
+    while not stepped.CPU.STBY:
+        stepped.step()
+
+    simulator = GumnutSimulator()
+    simulator.setup(SOURCE)
+    simulator.CPU.enable_translation()
+    simulator.enable_profiling()
+    result = simulator.run(1000)
+    assert result.reason == StopReason.stby
+    assert simulator.get_profile() == stepped.get_profile()
+    assert sum(spot["count"] for spot in simulator.get_profile()["lines"]) == result.steps
+
+
+def test_get_profile():
+    simulator = GumnutSimulator()
+    simulator.setup(SOURCE)
+    assert simulator.get_profile() is None
+    assert simulator.get_collapsed_stacks() == ""
+
+    simulator.enable_profiling()
+    simulator.run(1000)
+    profile = simulator.get_profile(limit=2)
+    assert profile["lines"] == [
+        HotSpot(line=4, address=3, count=3, source="loop:   jsb store")._asdict(),
+        HotSpot(line=5, address=4, count=3, source="sub r1, r1, 1")._asdict(),
+    ]
+    assert profile["opcodes"]["jsb"] == 6
+    assert profile["opcodes"]["ret"] == 6
+    assert profile["interrupts"] == 0
+
+    assert simulator.get_collapsed_stacks() == "main 12\nmain;store 9\nmain;store;count 6\n"
+
+
+def test_collapsed_stacks_with_interrupts():
+    simulator = GumnutSimulator()
+    simulator.setup(SOURCE)
+    simulator.enable_profiling()
+    simulator.run(4)
+    simulator.CPU.IREN = True
+    simulator.trigger_interrupt()
+    simulator.run(3)
+
+    assert simulator.get_profile()["interrupts"] == 1
+    assert simulator.get_collapsed_stacks() == "main 3\nmain;store 2\nmain;store;isr 1\n"
@@ -0,0 +1,93 @@
+import pytest
+
+from gumnut_simulator import scheduler
+from gumnut_simulator.core import StopReason
+from gumnut_simulator.simulator import GumnutSimulator
+
+
+SOURCE = """
+        jmp start
+isr:    inp r1, (r0)
+        add r2, r2, r1
+        reti
+start:  add r3, r0, 4
+        enai
+loop:   wait
+        sub r3, r3, 1
+        bnz loop
+        disi
+        stby
+"""
+
+
+def test_scheduler_order_and_periods():
+    simulator = GumnutSimulator()
+    fired = list()
+    events = scheduler.Scheduler()
+    for step, name, period in ((10, "b", None), (5, "a", 20), (10, "c", None)):
+        events.add(step, scheduler.CALLBACK, (lambda s, name=name: fired.append((s.steps, name)),), period)
+    assert len(events) == 3
+    assert events.next_step() == 5
+
+    assert events.fire_due(simulator) == 0
+    simulator.steps = 10
+    assert events.fire_due(simulator) == 3
+    assert fired == [(10, "a"), (10, "b"), (10, "c")]
+    assert events.next_step() == 25
+
+    # Periods which already passed are skipped
+    simulator.steps = 70
+    assert events.fire_due(simulator) == 1
+    assert events.next_step() == 85
+
+    with pytest.raises(ValueError):
+        events.add(1, scheduler.INTERRUPT, period=0)
+    events.clear()
+    assert events.next_step() is None
+
+
+def test_scheduled_events_match_stepping():
+    def scheduled():
+        simulator = GumnutSimulator()
+        simulator.setup(SOURCE)
+        for i, step in enumerate((20, 500, 10**5, 10**5 + 50)):
+            simulator.schedule_IO_controller_register(step - 1, 0, i + 1)
+            simulator.schedule_interrupt(step)
+        return simulator
+
+    stepped = scheduled()
+    while not stepped.CPU.is_halted():
+        stepped.step()
+
+    simulator = scheduled()
+    result = simulator.run(10**6)
+    assert result.reason == StopReason.stby
+    assert result.steps == simulator.steps == stepped.steps
+    assert simulator.get_register() == stepped.get_register()
+    assert simulator.get_register()["r2"] == 1 + 2 + 3 + 4
+    assert len(simulator.scheduler) == 0
+
+
+def test_periodic_interrupts_and_callbacks():
+    simulator = GumnutSimulator()
+    simulator.CPU.enable_translation()
+    simulator.setup(SOURCE)
+    simulator.schedule_IO_controller_register(0, 0, 5)
+    simulator.schedule_interrupt(1000, period=1000)
+    ticks = list()
+    simulator.schedule_callback(1500, lambda s: ticks.append((s.steps, s.CPU.r[3])), period=1000)
+
+    # Waiting for the next interrupt doesn't end the run
+    result = simulator.run(2500)
+    assert (result.reason, result.steps) == (StopReason.budget, 2500)
+    assert ticks == [(1500, 3)]
+    assert simulator.fast_forward(10**6) == 500
+    assert simulator.steps == 3000
+    assert ticks[-1] == (2500, 2)
+
+    assert simulator.run(10**6).reason == StopReason.stby
+    assert simulator.CPU.r[2] == 4 * 5
+    assert [tick for tick, _ in ticks] == [1500, 2500, 3500]
+
+    simulator.setup(SOURCE)
+    assert simulator.scheduler.next_step() is None
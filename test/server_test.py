@@ -0,0 +1,235 @@
+import asyncio
+import json
+
+import pytest
+
+from gumnut_simulator import client, server
+from gumnut_simulator.client import Client, RPCError
+
+
+SOURCE = """
+        add r1, r0, 3
+loop:   sub r1, r1, 1
+        bnz loop
+        stby
+"""
+
+ENDLESS = """
+loop:   add r1, r1, 1
+        jmp loop
+"""
+
+
+async def serve(simulation_server, coroutine):
+    listener = await simulation_server.start_tcp("127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    async with listener:
+        connection = await Client.connect_tcp("127.0.0.1", port)
+        try:
+            return await coroutine(connection)
+        finally:
+            await connection.close()
+
+
+def test_session_methods():
+    async def session(connection):
+        session_id = (await connection.call("open"))["session"]
+        state = await connection.call("setup", session=session_id, source=SOURCE)
+        assert state["loaded"] is True
+        assert state["simulator"]["number_of_instructions"] == 4
+
+        assert await connection.call("toggle_breakpoint", session=session_id, line=4) == [4]
+        state = await connection.call("step", session=session_id)
+        assert state["register"]["r1"] == 3
+        state = await connection.call("run", session=session_id, max_steps=100)
+        assert (state["reason"], state["steps"], state["simulator"]["current_line"]) == ("breakpoint", 6, 4)
+        state = await connection.call("run", session=session_id, max_steps=100)
+        assert (state["reason"], state["steps"]) == ("stby", 1)
+        changes = await connection.call("get_changes", session=session_id)
+        assert changes["register"]["PC"] == 4
+
+        await connection.call("enable_journal", session=session_id, capacity=16)
+        assert (await connection.call("reset", session=session_id))["simulator"]["number_of_instructions"] == 0
+        await connection.call("setup", session=session_id, source=SOURCE)
+        await connection.call("run", session=session_id, max_steps=2)
+        assert (await connection.call("step_back", session=session_id))["register"]["r1"] == 3
+
+        with pytest.raises(RPCError) as error:
+            await connection.call("enable_journal", session=session_id, capacity=10**9)
+        assert error.value.code == server.LIMIT_EXCEEDED
+        with pytest.raises(RPCError) as error:
+            await connection.call("setup", session=session_id, source=" " * (server.DEFAULT_MAX_SOURCE_LENGTH + 1))
+        assert error.value.code == server.LIMIT_EXCEEDED
+        with pytest.raises(RPCError) as error:
+            await connection.call("step", session=session_id, steps=2)
+        assert error.value.code == server.INVALID_PARAMS
+
+        assert await connection.call("close", session=session_id) is True
+        with pytest.raises(RPCError) as error:
+            await connection.call("step", session=session_id)
+        assert error.value.code == server.UNKNOWN_SESSION
+
+    asyncio.run(serve(server.SimulationServer(), session))
+
+
+def test_watchpoints():
+    source = """
+loop:   add r1, r1, 1
+        stm r1, 5
+        jmp loop
+"""
+
+    async def session(connection):
+        session_id = (await connection.call("open", translate=True))["session"]
+        await connection.call("setup", session=session_id, source=source)
+        watched = await connection.call("add_watchpoint", session=session_id, memory="data_memory", address=5, value=42)
+        assert watched == [["data_memory", 5, 2, 42]]
+        state = await connection.call("run", session=session_id, max_steps=10**6)
+        assert (state["reason"], state["steps"], state["register"]["r1"]) == ("watchpoint", 42 * 3 - 1, 42)
+        assert state["simulator"]["watchpoint"] == {
+            "memory": "data_memory",
+            "address": 5,
+            "access": 2,
+            "value": 42,
+            "PC": 1,
+        }
+        assert await connection.call("remove_watchpoint", session=session_id, memory="data_memory", address=5) == []
+
+        with pytest.raises(RPCError) as error:
+            await connection.call("add_watchpoint", session=session_id, memory="data_memory", address=5, access="x")
+        assert error.value.code == server.INVALID_PARAMS
+        with pytest.raises(RPCError) as error:
+            await connection.call("add_watchpoint", session=session_id, memory="data_memory", address=512)
+        assert error.value.code == server.INVALID_PARAMS
+
+    asyncio.run(serve(server.SimulationServer(), session))
+
+
+def test_protocol_errors():
+    simulation_server = server.SimulationServer(max_sessions=1)
+
+    async def requests():
+        assert (await simulation_server.handle_request(b"{"))["error"]["code"] == server.PARSE_ERROR
+        assert (await simulation_server.handle_request(b"[]"))["error"]["code"] == server.INVALID_REQUEST
+        response = await simulation_server.handle_request(json.dumps({"jsonrpc": "2.0", "id": 7, "method": "halt"}))
+        assert response == {
+            "jsonrpc": "2.0",
+            "id": 7,
+            "error": {"code": -32601, "message": "Method not found", "data": "halt"},
+        }
+        assert await simulation_server.handle_request(json.dumps({"jsonrpc": "2.0", "method": "open"})) is None
+        response = await simulation_server.handle_request(json.dumps({"jsonrpc": "2.0", "id": 8, "method": "open"}))
+        assert response["error"]["code"] == server.LIMIT_EXCEEDED
+
+    asyncio.run(requests())
+
+
+def test_simulation_errors_are_returned():
+    # The IO register address 10 + 255 is out of range
+    source = """
+        add r1, r0, 10
+        inp r2, (r1)+255
+        stby
+"""
+
+    async def session(connection):
+        session_id = (await connection.call("open"))["session"]
+        await connection.call("setup", session=session_id, source=source)
+        with pytest.raises(RPCError) as error:
+            await asyncio.wait_for(connection.call("run", session=session_id, max_steps=100), 10)
+        assert error.value.code == server.SIMULATION_ERROR
+        assert error.value.data["type"] == "IndexError"
+
+        await connection.call("setup", session=session_id, source=source)
+        await connection.call("step", session=session_id)
+        with pytest.raises(RPCError) as error:
+            await asyncio.wait_for(connection.call("step", session=session_id), 10)
+        assert error.value.code == server.SIMULATION_ERROR
+
+    asyncio.run(serve(server.SimulationServer(), session))
+
+
+def test_runs_share_the_event_loop():
+    simulation_server = server.SimulationServer(quantum_steps=100)
+
+    async def sessions(connection):
+        endless, interactive = [(await connection.call("open"))["session"] for _ in range(2)]
+        await connection.call("setup", session=endless, source=ENDLESS)
+        await connection.call("setup", session=interactive, source=SOURCE)
+
+        run = asyncio.ensure_future(connection.call("run", session=endless, max_steps=10**9))
+        for _ in range(3):
+            await connection.call("step", session=interactive)
+        assert not run.done()
+        assert await connection.call("stop", session=endless) is True
+        state = await run
+        assert state["reason"] == "budget"
+        assert state["stopped"] is True
+        assert 0 < state["steps"] < 10**9
+        assert state["steps"] % 100 == 0
+
+    asyncio.run(serve(simulation_server, sessions))
+
+
+def test_run_waits_for_interrupts():
+    source = """
+        jmp start
+isr:    inp r1, (r0)
+        add r2, r2, r1
+        reti
+start:  enai
+loop:   wait
+        jmp loop
+"""
+
+    async def session(connection):
+        session_id = (await connection.call("open"))["session"]
+        await connection.call("setup", session=session_id, source=source)
+        state = await connection.call("run", session=session_id, max_steps=1000)
+        assert (state["reason"], state["halted"]) == ("wait", False)
+
+        run = asyncio.ensure_future(
+            connection.call("run", session=session_id, max_steps=1000, wait_for_interrupt=True)
+        )
+        total = 0
+        for value in (3, 4):
+            total += value
+            await connection.call("set_IO_controller_register", session=session_id, address=0, value=value)
+            await connection.call("trigger_interrupt", session=session_id)
+            while (await connection.call("get_state", session=session_id))["register"]["r2"] != total:
+                await asyncio.sleep(0.001)
+        await asyncio.sleep(0.01)
+        assert not run.done()
+        await connection.call("stop", session=session_id)
+        state = await run
+        assert (state["reason"], state["stopped"], state["register"]["r2"]) == ("wait", True, 7)
+        assert state["steps"] < 20
+
+    asyncio.run(serve(server.SimulationServer(), session))
+
+
+def test_evict_idle_sessions():
+    simulation_server = server.SimulationServer(idle_timeout=10)
+
+    async def sessions():
+        first = (await simulation_server.open())["session"]
+        second = (await simulation_server.open())["session"]
+        simulation_server.sessions[first].last_used -= 20
+        assert simulation_server.evict_idle() == [first]
+        assert list(simulation_server.sessions) == [second]
+
+    asyncio.run(sessions())
+
+
+def test_load_test():
+    async def measure(connection):
+        port = connection.writer.get_extra_info("peername")[1]
+        return await client.load_test(
+            lambda: Client.connect_tcp("127.0.0.1", port), sessions=3, rounds=2, run_steps=500
+        )
+
+    result = asyncio.run(serve(server.SimulationServer(), measure))
+    assert result["run"]["count"] == result["step"]["count"] == 6
+    assert result["setup"]["count"] == 3
+    assert 0 < result["step"]["p50"] <= result["step"]["p99"] <= result["step"]["max"]
+    assert client.percentiles([3, 1, 2, 4]) == {"p50": 3, "p90": 4, "p99": 4, "max": 4}
@@ -0,0 +1,120 @@
+import io
+
+import pytest
+
+from gumnut_simulator import session
+from gumnut_simulator.exceptions import InvalidInstruction, InvalidSessionData
+from gumnut_simulator.simulator import GumnutSimulator, SimulatorState
+
+
+SOURCE = """
+        jmp start
+isr:    reti
+start:  add r1, r0, 3
+        out r1, (r0)+7
+loop:   jsb store
+        sub r1, r1, 1
+        bnz loop
+        stby
+store:  stm r1, (r1)
+        ret
+"""
+
+
+def simulator_state(simulator):
+    cpu = simulator.CPU
+    return (
+        simulator.get_register(),
+        simulator.get_flags(),
+        simulator.get_simulator_data(),
+        list(simulator.get_instruction_memory()),
+        list(simulator.get_data_memory()),
+        list(simulator.get_IO_controller_register()),
+        (cpu.IR, cpu._PC, cpu.instruction),
+        simulator.previous_PC,
+        simulator.asm_source,
+        simulator.line_of_address,
+        simulator.address_of_line,
+        simulator.breakpoint_addresses,
+        simulator.lsom_map,
+        simulator.debug_symbols,
+    )
+
+
+def test_save_load():
+    simulator = GumnutSimulator()
+    simulator.setup(SOURCE)
+    simulator.toggle_breakpoint(7)
+    simulator.run(6)
+    simulator.CPU.IREN = True
+
+    fp = io.BytesIO()
+    simulator.save(fp)
+    fp.seek(0)
+    loaded = GumnutSimulator.load(fp)
+    assert simulator_state(loaded) == simulator_state(simulator)
+    assert loaded.get_state() == SimulatorState.idle
+
+    # The loaded simulator continues exactly like the original one
+    for _ in range(20):
+        simulator.step()
+        loaded.step()
+        assert simulator_state(loaded) == simulator_state(simulator)
+    assert loaded.CPU.STBY
+
+
+def test_save_load_exception():
+    simulator = GumnutSimulator()
+    simulator.setup("stby\n")
+    simulator.CPU.write_instruction_memory(0, 0x3F700)
+    simulator.step()
+    assert isinstance(simulator.exception, InvalidInstruction)
+
+    loaded = session.loads(session.dumps(simulator))
+    assert isinstance(loaded.exception, InvalidInstruction)
+    assert loaded.exception.as_dict() == simulator.exception.as_dict()
+    assert loaded.get_state() == SimulatorState.halt
+
+
+def test_load_into_simulator():
+    simulator = GumnutSimulator()
+    simulator.setup(SOURCE)
+    data = session.dumps(simulator)
+
+    other = GumnutSimulator()
+    other.setup("add r1, r0, 1\nadd r2, r0, 2\nstby\n")
+    other.toggle_breakpoint(1)
+    other.run(2)
+    assert session.loads(data, other) is other
+    assert simulator_state(other) == simulator_state(simulator)
+    assert other.get_breakpoints() == []
+
+
+def test_load_assembler_maps():
+    simulator = GumnutSimulator()
+    simulator.setup(SOURCE)
+    simulator.run(6)
+    data = session.dumps(simulator)
+
+    loaded = GumnutSimulator()
+    loaded.use_assembly_cache = False
+    session.loads(data, loaded)
+    assert loaded.lsom_map.keys() == simulator.lsom_map.keys()
+    assert list(loaded.debug_symbols) == list(simulator.debug_symbols)
+    assert loaded.get_control_flow_graph().get_loop_header_lines(loaded.lsom_map) == [5]
+
+    loaded.enable_profiling()
+    loaded.run(1000)
+    assert {"line": 6, "address": 5, "count": 3, "source": "sub r1, r1, 1"} in loaded.get_profile()["lines"]
+
+
+def test_load_invalid_data():
+    data = session.dumps(GumnutSimulator())
+    with pytest.raises(InvalidSessionData):
+        session.loads(data[:10])
+    with pytest.raises(InvalidSessionData):
+        session.loads(b"XXXX" + data[4:])
+    with pytest.raises(InvalidSessionData):
+        session.loads(data[:4] + b"\xff\xff" + data[6:])
+    with pytest.raises(InvalidSessionData):
+        session.loads(data + b"\0")
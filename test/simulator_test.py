@@ -1,5 +1,10 @@
+import json
 import pytest
+from gumnut_simulator.core import StopReason
+from gumnut_simulator.exceptions import DataMemoryAccessViolation
+from gumnut_simulator.iobus import UART
 from gumnut_simulator.simulator import GumnutSimulator, SimulatorState
+from gumnut_simulator.watchpoints import DATA_MEMORY
 
 
 
@@ -17,6 +22,295 @@ def test_simulator_reset(gsimulator):
     assert gsimulator.get_breakpoints() == []
     assert gsimulator.get_current_line() == -1
 
-    assert gsimulator.get_instruction_memory() == [0] * 4096
-    assert gsimulator.get_data_memory() == [0] * 256
-    assert gsimulator.get_flags() == {"CARRY": False, "ZERO": False, "WAIT": False, "STBY": False, "IREN": False }
\ No newline at end of file
+    assert list(gsimulator.get_instruction_memory()) == [0] * 4096
+    assert list(gsimulator.get_data_memory()) == [0] * 256
+    assert gsimulator.get_flags() == {"CARRY": False, "ZERO": False, "WAIT": False, "STBY": False, "IREN": False }
+
+COUNTDOWN_SOURCE = """
+        jmp start
+isr:    reti
+start:  add r1, r0, 3
+loop:   jsb store
+        sub r1, r1, 1
+        bnz loop
+        stby
+store:  stm r1, (r1)
+        ret
+"""
+
+
+def simulator_snapshot(simulator):
+    return (
+        simulator.get_register(),
+        simulator.get_flags(),
+        list(simulator.get_data_memory()),
+        simulator.steps,
+        simulator.previous_PC,
+        simulator.state,
+        simulator.CPU.instruction,
+    )
+
+
+def test_run_matches_step():
+    stepped = GumnutSimulator()
+    stepped.setup(COUNTDOWN_SOURCE)
+    ran = GumnutSimulator()
+    ran.setup(COUNTDOWN_SOURCE)
+
+    for max_steps in (1, 2, 5, 8):
+        for _ in range(max_steps):
+            stepped.step()
+        result = ran.run(max_steps)
+        assert result.reason == StopReason.budget
+        assert result.steps == max_steps
+        assert simulator_snapshot(ran) == simulator_snapshot(stepped)
+
+
+def test_run_stops_on_stby(gsimulator):
+    gsimulator.setup(COUNTDOWN_SOURCE)
+    result = gsimulator.run(1000)
+    assert result.reason == StopReason.stby
+    assert result.steps == 18
+    assert gsimulator.steps == 18
+    assert gsimulator.get_flags()["STBY"]
+    assert list(gsimulator.get_data_memory()[1:4]) == [1, 2, 3]
+
+
+def test_run_stops_on_breakpoint(gsimulator):
+    gsimulator.setup(COUNTDOWN_SOURCE)
+    gsimulator.toggle_breakpoint(6)  # bnz loop
+
+    result = gsimulator.run(1000)
+    assert result.reason == StopReason.breakpoint
+    assert result.steps == 6
+    assert gsimulator.get_current_line() == 6
+    assert gsimulator.get_state() == SimulatorState.breakpoint
+
+    result = gsimulator.run(1000)
+    assert result.reason == StopReason.breakpoint
+    assert result.steps == 5
+
+
+def test_run_raises_like_step(gsimulator):
+    gsimulator.setup("add r1, r0, 200\nldm r2, (r1)+100\n")
+    with pytest.raises(DataMemoryAccessViolation):
+        gsimulator.run(10)
+    assert gsimulator.steps == 1
+    assert gsimulator.previous_PC == 1
+    assert gsimulator.get_state() == SimulatorState.idle
+
+
+def test_line_index(gsimulator):
+    gsimulator.setup(COUNTDOWN_SOURCE)
+    for address in range(gsimulator.CPU.instruction_memory_size):
+        expected = -1
+        for line_number, field in gsimulator.lsom_map.items():
+            if field[3] == address:
+                expected = line_number
+                break
+        assert gsimulator._get_source_line_from_address(address) == expected
+    assert gsimulator.address_of_line[6] == 5
+    assert 0 not in gsimulator.address_of_line
+    assert gsimulator._get_source_line_from_address(-1) == -1
+
+    gsimulator.CPU.PC = 5
+    assert gsimulator.get_current_line() == 6
+    gsimulator.CPU.PC = 4096
+    assert gsimulator.get_current_line() == -1
+
+
+def test_toggle_breakpoint(gsimulator):
+    gsimulator.setup(COUNTDOWN_SOURCE)
+    gsimulator.toggle_breakpoint(6)
+    gsimulator.toggle_breakpoint(0)  # No instruction on this line
+    assert gsimulator.get_breakpoints() == [6, 0]
+    assert gsimulator.breakpoint_addresses == {5}
+
+    gsimulator.toggle_breakpoint(6)
+    assert gsimulator.get_breakpoints() == [0]
+    assert gsimulator.breakpoint_addresses == set()
+
+    gsimulator.toggle_breakpoint(7)  # stby
+    assert gsimulator.run(1000).reason == StopReason.breakpoint
+    assert gsimulator.get_current_line() == 7
+    assert gsimulator.get_state() == SimulatorState.breakpoint
+
+    gsimulator.reset()
+    assert gsimulator.get_breakpoints() == []
+    assert gsimulator.breakpoint_addresses == set()
+
+
+def test_memory_views_and_json(gsimulator):
+    gsimulator.setup(COUNTDOWN_SOURCE)
+    data_memory = gsimulator.get_data_memory()
+    gsimulator.run(1000)
+    assert list(data_memory[1:4]) == [1, 2, 3]
+
+    gsimulator.set_IO_controller_register(3, 0x1AB)
+    assert gsimulator.get_IO_controller_register()[3] == 0xAB
+
+    gsimulator.toggle_breakpoint(6)
+    state = json.loads(gsimulator.to_JSON())
+    assert state["CPU"]["data_memory"][1:4] == [1, 2, 3]
+    assert state["CPU"]["instruction_memory"] == list(gsimulator.get_instruction_memory())
+    assert state["breakpoints"] == [6]
+
+
+def test_json_format(gsimulator):
+    gsimulator.setup("add r1, r0, 1\nstby\n")
+    gsimulator.step()
+    state = json.loads(gsimulator.to_JSON())
+    assert sorted(state) == [
+        "CPU",
+        "asm_source",
+        "breakpoints",
+        "current_line",
+        "debug_symbols",
+        "exception",
+        "lines_of_code",
+        "lsom_map",
+        "number_of_instructions",
+        "previous_PC",
+        "state",
+        "steps",
+    ]
+    assert sorted(state["CPU"]) == [
+        "CARRY",
+        "IO_controller_register",
+        "IO_controller_register_size",
+        "IR",
+        "IREN",
+        "PC",
+        "SP",
+        "STBY",
+        "WAIT",
+        "ZERO",
+        "_C",
+        "_CARRY",
+        "_PC",
+        "_Z",
+        "_ZERO",
+        "current_ret_line",
+        "data_memory",
+        "data_memory_access_addr",
+        "data_memory_size",
+        "decoder",
+        "instruction",
+        "instruction_memory",
+        "instruction_memory_size",
+        "r",
+        "return_address_stack",
+    ]
+    assert sorted(state["CPU"]["decoder"]) == ["INSTR", "instruction", "instruction_masks", "instructions"]
+    assert len(gsimulator.to_JSON()) < 100000
+
+
+def _attach_UART(simulator):
+    uart = UART()
+    simulator.CPU.attach_IO_device(uart, 0x10, 2)
+    uart.feed(b"hi")
+
+
+@pytest.mark.parametrize(
+    "enable",
+    [
+        lambda simulator: simulator.enable_journal(),
+        lambda simulator: simulator.enable_profiling(),
+        lambda simulator: simulator.enable_loop_detection(),
+        lambda simulator: simulator.schedule_interrupt(50, period=100),
+        lambda simulator: simulator.add_watchpoint(DATA_MEMORY, 255),
+        lambda simulator: simulator.CPU.enable_translation(),
+        _attach_UART,
+    ],
+    ids=["journal", "profiling", "loop_detection", "scheduler", "watchpoints", "translation", "UART"],
+)
+def test_json_with_optional_features(gsimulator, enable):
+    # Runs long enough for the loop to be translated
+    source = """
+        add r1, r0, 100
+loop:   stm r1, (r1)
+        out r1, (r1)
+        sub r1, r1, 1
+        bnz loop
+        stby
+"""
+    enable(gsimulator)
+    gsimulator.setup(source)
+    gsimulator.run(1000)
+    state = json.loads(gsimulator.to_JSON())
+    plain = json.loads(GumnutSimulator().to_JSON())
+    assert state.keys() == plain.keys()
+    assert state["CPU"].keys() == plain["CPU"].keys()
+    assert state["steps"] == 1 + 4 * 100 + 1
+
+
+def test_snapshot_restore(gsimulator):
+    gsimulator.setup(COUNTDOWN_SOURCE)
+    gsimulator.run(5)
+    snapshot = gsimulator.snapshot()
+    expected = simulator_snapshot(gsimulator)
+
+    gsimulator.run(1000)
+    assert gsimulator.steps == 18
+    for _ in range(3):
+        gsimulator.restore(snapshot)
+        assert simulator_snapshot(gsimulator) == expected
+        assert gsimulator.run(1000).steps == 13
+
+
+def test_get_changes(gsimulator):
+    gsimulator.setup(COUNTDOWN_SOURCE)
+    changes = gsimulator.get_changes()
+    assert changes["register"] == gsimulator.get_register()
+    assert changes["flags"] == gsimulator.get_flags()
+    assert changes["data_memory"] == [(0, [0] * 256)]
+    assert changes["instruction_memory"][0][1] == list(gsimulator.get_instruction_memory())
+
+    token = changes["token"]
+    changes = gsimulator.get_changes(token)
+    assert changes["register"] == {} and changes["flags"] == {} and changes["simulator"] == {}
+    assert changes["data_memory"] == changes["IO_controller_register"] == changes["instruction_memory"] == []
+
+    token = changes["token"]
+    gsimulator.run(7)  # Stores 3 at address 3, then decrements r1
+    gsimulator.set_IO_controller_register(9, 1)
+    changes = gsimulator.get_changes(token)
+    assert changes["register"] == {"r1": 2, "PC": 3}
+    assert changes["flags"] == {}
+    assert changes["simulator"] == {"current_line": 4, "data_memory_access_addr": 3, "steps": 7}
+    assert changes["data_memory"] == [(3, [3])]
+    assert changes["IO_controller_register"] == [(9, [1])]
+
+    # Older tokens stay valid, unknown ones return everything
+    assert gsimulator.get_changes(token)["data_memory"] == [(3, [3])]
+    assert len(gsimulator.get_changes(-1)["data_memory"][0][1]) == 256
+
+
+def test_get_changes_translated(gsimulator):
+    gsimulator.setup(COUNTDOWN_SOURCE)
+    gsimulator.CPU.enable_translation()
+    token = gsimulator.get_changes()["token"]
+    gsimulator.run(1000)
+    assert gsimulator.get_changes(token)["data_memory"] == [(1, [1, 2, 3])]
+
+
+def test_halted_run_and_fast_forward(gsimulator):
+    gsimulator.setup(COUNTDOWN_SOURCE)
+    result = gsimulator.run(1000)
+    assert result.reason == StopReason.stby
+    steps = gsimulator.steps
+    # Interrupts are disabled, so nothing can end STBY
+    assert gsimulator.run(1000) == (StopReason.stby, 0, None, None)
+    assert gsimulator.steps == steps
+
+    gsimulator.CPU.IREN = True
+    gsimulator.enable_journal()
+    assert gsimulator.fast_forward(10**6) == 10**6
+    assert gsimulator.steps == steps + 10**6
+    assert gsimulator.step_back() == 1
+    assert gsimulator.steps == steps
+
+    gsimulator.trigger_interrupt()
+    assert gsimulator.fast_forward(10**6) == 0
+    gsimulator.step()
+    assert gsimulator.CPU.PC == 1
@@ -0,0 +1,116 @@
+import pytest
+
+from gumnut_simulator import trace
+from gumnut_simulator.core import StopReason
+from gumnut_simulator.exceptions import InvalidTraceFile
+from gumnut_simulator.simulator import GumnutSimulator
+
+
+SOURCE = """
+        jmp start
+isr:    reti
+start:  add r1, r0, 3
+        inp r1, (r1)+4
+loop:   stm r1, (r1)+16
+        out r1, (r0)+2
+        sub r1, r1, 1
+        bnz loop
+        stby
+"""
+
+
+def records(path):
+    with open(path, "rb") as fp:
+        data = fp.read()
+    assert trace.HEADER.unpack_from(data) == (trace.MAGIC, trace.FORMAT_VERSION, trace.RECORD.size)
+    return [
+        dict(zip(trace.RECORD_FIELDS, fields)) for fields in trace.RECORD.iter_unpack(data[trace.HEADER.size :])
+    ]
+
+
+@pytest.fixture
+def simulator():
+    simulator = GumnutSimulator()
+    simulator.setup(SOURCE)
+    simulator.set_IO_controller_register(7, 2)
+    return simulator
+
+
+def test_trace_writer(simulator, tmp_path):
+    path = str(tmp_path / "countdown.trace")
+    simulator.step()
+    simulator.start_trace(path)
+    simulator.CPU.tracer.flush()
+    assert records(path) == []
+
+    assert simulator.run(100).reason == StopReason.stby
+    simulator.stop_trace()
+    assert simulator.CPU.tracer is None
+
+    written = records(path)
+    assert len(written) == simulator.steps - 1
+    assert [record["step"] for record in written] == list(range(1, simulator.steps))
+    assert [record["PC"] for record in written[:4]] == [2, 3, 4, 5]
+    assert written[0]["objectcode"] == simulator.CPU.instruction_memory[2]
+    assert (written[0]["rd"], written[0]["rd_value"]) == (1, 3)
+    assert (written[1]["access"], written[1]["address"], written[1]["value"]) == (trace.ACCESS_INP, 7, 2)
+    assert (written[2]["access"], written[2]["address"], written[2]["value"]) == (trace.ACCESS_STM, 18, 2)
+    assert (written[3]["access"], written[3]["address"], written[3]["value"]) == (trace.ACCESS_OUT, 2, 2)
+    assert written[-1]["flags"] & trace.FLAG_STBY
+    assert written[-2]["flags"] & trace.FLAG_ZERO
+
+
+def test_trace_interrupts_and_idle_steps(simulator, tmp_path):
+    path = str(tmp_path / "interrupt.trace")
+    simulator.run(100)
+    simulator.start_trace(path)
+    simulator.step()
+    simulator.CPU.IREN = True
+    simulator.trigger_interrupt()
+    simulator.step()
+    simulator.step()
+    simulator.stop_trace()
+
+    written = records(path)
+    assert [(record["step"], record["PC"], record["opcode"]) for record in written] == [
+        (13, 9, trace.OP_INTERRUPT),
+        (14, 1, trace.OPCODE["reti", None]),
+    ]
+
+
+def test_trace_reader(simulator, tmp_path):
+    np = pytest.importorskip("numpy")
+    path = str(tmp_path / "countdown.trace")
+    simulator.start_trace(path)
+    simulator.CPU.tracer.buffer = bytearray(trace.RECORD.size * 3)
+    simulator.run(100)
+    simulator.stop_trace()
+
+    with trace.TraceReader(path) as reader:
+        assert len(reader) == simulator.steps
+        assert list(reader.records["step"]) == list(range(simulator.steps))
+        assert reader[1]["rd_value"] == 3
+        assert [dict(zip(trace.RECORD_FIELDS, record.tolist())) for record in reader.records] == records(path)
+
+        stores = reader.filter(opcodes=["stm", "out"])
+        assert list(stores["PC"]) == [4, 5] * 2
+        assert list(reader.filter(opcodes=["sub"])["rd_value"]) == [1, 0]
+        assert np.all(reader.filter(PC_range=(4, 5))["access"] >= trace.ACCESS_STM)
+        assert len(reader.filter(PC_range=(4, 5), opcodes=[trace.OPCODE["out", None]])) == 2
+        del stores
+
+
+def test_trace_reader_invalid_files(tmp_path):
+    pytest.importorskip("numpy")
+    path = tmp_path / "empty.trace"
+    with trace.TraceWriter(str(path)):
+        pass
+    with trace.TraceReader(str(path)) as reader:
+        assert len(reader) == 0
+
+    path.write_bytes(b"GTRC")
+    with pytest.raises(InvalidTraceFile):
+        trace.TraceReader(str(path))
+    path.write_bytes(b"XXXX" + bytes(12))
+    with pytest.raises(InvalidTraceFile):
+        trace.TraceReader(str(path))
@@ -0,0 +1,165 @@
+import pytest
+
+from gumnut_simulator import translator
+from gumnut_simulator.core import GumnutCore, StopReason
+from gumnut_simulator.exceptions import DataMemoryAccessViolation
+from gumnut_simulator.simulator import GumnutSimulator
+
+
+NESTED_LOOP_SOURCE = """
+        jmp start
+isr:    add r5, r5, 1
+        reti
+start:  add r2, r0, 20
+outer:  add r1, r0, 255
+inner:  sub r1, r1, 1
+        stm r1, (r1)
+        bnz inner
+        rol r3, r2, 3
+        addc r4, r4, r3
+        sub r2, r2, 1
+        bnz outer
+        stby
+"""
+
+
+def core_state(core):
+    return (
+        core.r[:],
+        core.CARRY,
+        core.ZERO,
+        core.PC,
+        core.SP,
+        core.return_address_stack[:],
+        core.IREN,
+        core.WAIT,
+        core.STBY,
+        list(core.data_memory),
+        list(core.IO_controller_register),
+        core.data_memory_access_addr,
+        core.instruction,
+    )
+
+
+@pytest.fixture
+def simulators():
+    interpreted = GumnutSimulator()
+    interpreted.setup(NESTED_LOOP_SOURCE)
+    translated = GumnutSimulator()
+    translated.setup(NESTED_LOOP_SOURCE)
+    translated.CPU.enable_translation()
+    return interpreted, translated
+
+
+def test_translated_run_matches_interpreter(simulators):
+    interpreted, translated = simulators
+    for max_steps in (1, 7, 100, 1000, 10 ** 6):
+        expected = interpreted.run(max_steps)
+        result = translated.run(max_steps)
+        assert result == expected
+        assert translated.steps == interpreted.steps
+        assert core_state(translated.CPU) == core_state(interpreted.CPU)
+    assert result.reason == StopReason.stby
+    assert translated.CPU.translator.blocks
+
+
+def test_translated_run_stops_inside_block(simulators):
+    interpreted, translated = simulators
+    interpreted.toggle_breakpoint(8)  # stm r1, (r1)
+    translated.toggle_breakpoint(8)
+    for _ in range(3):
+        expected = interpreted.run(1000)
+        result = translated.run(1000)
+        assert result == expected
+        assert result.reason == StopReason.breakpoint
+        assert core_state(translated.CPU) == core_state(interpreted.CPU)
+
+
+def test_translated_run_takes_interrupts_between_blocks(simulators):
+    interpreted, translated = simulators
+    for simulator in simulators:
+        simulator.CPU.IREN = True
+        simulator.run(50)
+        simulator.trigger_interrupt()
+        simulator.run(60)
+    assert translated.CPU.r[5] == interpreted.CPU.r[5] == 1
+    assert core_state(translated.CPU) == core_state(interpreted.CPU)
+
+
+def test_translated_run_exception():
+    cores = [GumnutCore(), GumnutCore()]
+    cores[1].enable_translation()
+    # add r1, r0, 200 / add r2, r2, 1 / ldm r3, (r1)+100
+    for core in cores:
+        core.upload_instruction_memory([0x00AC8, 0x01201, 0x21964])
+    results = [core.run(10) for core in cores]
+    assert results[0].steps == results[1].steps == 2
+    assert isinstance(results[1].exception, DataMemoryAccessViolation)
+    assert core_state(cores[0]) == core_state(cores[1])
+
+
+def test_write_instruction_memory_invalidates_blocks(monkeypatch):
+    monkeypatch.setattr(translator, "HOT_THRESHOLD", 1)
+    core = GumnutCore()
+    core.enable_translation()
+    # add r1, r1, 1 / add r1, r1, 1 / stby
+    core.upload_instruction_memory([0x00901, 0x00901, 0x3F500])
+    core.run(10)
+    assert core.r[1] == 2
+    assert 0 in core.translator.blocks
+
+    core.write_instruction_memory(1, 0x00905)  # add r1, r1, 5
+    assert 0 not in core.translator.blocks
+    core.PC = 0
+    core.STBY = False
+    core.run(10)
+    assert core.r[1] == 8
+
+
+def test_cold_code_is_interpreted():
+    core = GumnutCore()
+    core.enable_translation()
+    # Straight-line code, the cleared instruction memory executes as add r0, r0, 0
+    core.upload_instruction_memory([0x00901] * 100)  # add r1, r1, 1
+    result = core.run(3000)
+    assert result.steps == 3000
+    assert core.r[1] == 100
+    assert not any(core.translator.blocks.values())
+
+
+def test_blocks_are_limited_to_the_budget(monkeypatch, simulators):
+    monkeypatch.setattr(translator, "HOT_THRESHOLD", 1)
+    interpreted, translated = simulators
+    translated.toggle_breakpoint(11)  # sub r2, r2, 1
+    interpreted.toggle_breakpoint(11)
+    for _ in range(200):
+        expected = interpreted.run(37)
+        assert translated.run(37) == expected
+        assert core_state(translated.CPU) == core_state(interpreted.CPU)
+    blocks = [block for block in translated.CPU.translator.blocks.values() if block]
+    assert blocks
+    assert max(block.length for block in blocks) <= 37
+
+    # Slices of straight-line code are translated once, without overlapping blocks
+    core = GumnutCore()
+    core.enable_translation()
+    for _ in range(10):
+        assert core.run(300).steps == 300
+    starts = sorted(core.translator.blocks)
+    assert [start + core.translator.blocks[start].length for start in starts[:-1]] == starts[1:]
+
+    # Truncated blocks are translated in full once the budget allows
+    core.reset()
+    core.run(4000)
+    assert core.translator.blocks[0].length == translator.MAX_BLOCK_LENGTH
+
+
+def test_block_cache_is_limited(monkeypatch):
+    monkeypatch.setattr(translator, "HOT_THRESHOLD", 1)
+    monkeypatch.setattr(translator, "MAX_CACHED_BLOCKS", 4)
+    core = GumnutCore()
+    core.enable_translation()
+    for _ in range(10):
+        core.run(10)
+    assert len(core.translator.blocks) <= 4
+    assert core.PC == 100
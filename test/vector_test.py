@@ -0,0 +1,149 @@
+import random
+
+import pytest
+
+from gumnut_simulator.core import GumnutCore, StopReason
+from gumnut_simulator.exceptions import DataMemoryAccessViolation, InvalidInstruction
+
+
+np = pytest.importorskip("numpy")
+vector = pytest.importorskip("gumnut_simulator.vector")
+
+
+# Sum of IO registers 0-7 into r2, written to data memory 0 and IO register 255.
+# The loop count depends on the inputs, so the lanes diverge.
+# start: add r1, r0, 0 / add r2, r0, 0
+# loop:  inp r3, (r1)+0 / add r2, r2, r3 / bc wrap / back: add r1, r1, 1 / sub r0, r1, 8 / bnz loop
+#        stm r2, (r0)+0 / out r2, (r0)+255 / stby
+# wrap:  ldm r4, (r0)+1 / add r4, r4, 1 / stm r4, (r0)+1 / jmp back
+SUM_PROGRAM = [
+    0x00800,
+    0x01000,
+    0x29900,
+    0x39260,
+    0x3E806,
+    0x00901,
+    0x08108,
+    0x3E4FA,
+    0x25000,
+    0x2D0FF,
+    0x3F500,
+    0x22001,
+    0x02401,
+    0x26001,
+    0x3C005,
+]
+
+
+def lane_state(core):
+    return (
+        core.r[:],
+        bool(core.CARRY),
+        bool(core.ZERO),
+        core.PC,
+        core.SP,
+        core.return_address_stack[:],
+        bool(core.IREN),
+        bool(core.WAIT),
+        bool(core.STBY),
+        list(core.data_memory),
+        list(core.IO_controller_register),
+        core.data_memory_access_addr,
+    )
+
+
+def scalar_cores(program, data_memory, io):
+    cores = list()
+    for lane in range(len(io)):
+        core = GumnutCore()
+        core.upload_instruction_memory(list(program))
+        core.data_memory[:] = [int(value) for value in data_memory[lane]]
+        core.IO_controller_register[:] = [int(value) for value in io[lane]]
+        cores.append(core)
+    return cores
+
+
+def test_vector_core_matches_scalar_core():
+    rng = np.random.default_rng(1)
+    instances = 64
+    data_memory = rng.integers(0, 256, (instances, 256), dtype=np.uint8)
+    io = rng.integers(0, 256, (instances, 256), dtype=np.uint8)
+
+    engine = vector.GumnutVectorCore(instances, SUM_PROGRAM, data_memory)
+    engine.IO_controller_register[:] = io
+    result = engine.run(1000)
+
+    for lane, core in enumerate(scalar_cores(SUM_PROGRAM, data_memory, io)):
+        expected = core.run(1000)
+        assert result.reason[lane] == expected.reason == StopReason.stby
+        assert result.steps[lane] == expected.steps
+        assert lane_state(engine.get_lane(lane)) == lane_state(core)
+    assert len(set(result.steps.tolist())) > 1
+
+
+def test_vector_core_faults_single_lanes():
+    # ldm r1, (r0)+0 / ldm r2, (r1)+200 / stby
+    program = [0x20800, 0x211C8, 0x3F500]
+    data_memory = np.zeros((3, 256), dtype=np.uint8)
+    data_memory[:, 0] = [0, 56, 60]
+    engine = vector.GumnutVectorCore(3, program, data_memory)
+    result = engine.run(10)
+
+    assert list(result.reason) == [StopReason.stby, StopReason.exception, StopReason.exception]
+    assert list(result.steps) == [3, 1, 1]
+    assert list(engine.error) == [vector.NO_ERROR, vector.INDEX_ERROR, vector.DATA_MEMORY_ACCESS_VIOLATION]
+    assert vector.LANE_EXCEPTIONS[engine.error[2]] is DataMemoryAccessViolation
+
+    # Faulted lanes stay stopped, the idle lane steps once like GumnutCore.run
+    result = engine.run(10)
+    assert list(result.steps) == [1, 0, 0]
+    assert list(result.reason) == [StopReason.stby, StopReason.exception, StopReason.exception]
+
+
+def test_vector_core_invalid_instruction():
+    engine = vector.GumnutVectorCore(2, [0x3F700])
+    result = engine.run(5)
+    assert list(result.reason) == [StopReason.exception] * 2
+    assert vector.LANE_EXCEPTIONS[engine.error[0]] is InvalidInstruction
+
+
+def test_vector_core_breakpoints_and_interrupts():
+    rng = np.random.default_rng(2)
+    io = rng.integers(0, 256, (16, 256), dtype=np.uint8)
+    engine = vector.GumnutVectorCore(16, SUM_PROGRAM)
+    engine.IO_controller_register[:] = io
+    engine.IREN[::2] = True
+    cores = scalar_cores(SUM_PROGRAM, np.zeros((16, 256), dtype=np.uint8), io)
+    for lane, core in enumerate(cores):
+        core.IREN = bool(engine.IREN[lane])
+
+    for max_steps in (3, 10, 50):
+        result = engine.run(max_steps, stop_on={5})
+        engine.IR[:] = True
+        for lane, core in enumerate(cores):
+            expected = core.run(max_steps, stop_on={5})
+            core.IR = True
+            assert (result.reason[lane], result.steps[lane]) == (expected.reason, expected.steps)
+            assert lane_state(engine.get_lane(lane)) == lane_state(core)
+
+
+def test_vector_core_random_programs():
+    rng = random.Random(3)
+    prefixes = (0x00000, 0x38000, 0x30000, 0x20000, 0x3E000, 0x3C000)
+    for _ in range(50):
+        program = list()
+        for _ in range(rng.randrange(1, 32)):
+            prefix = rng.choice(prefixes)
+            if prefix == 0x3C000:
+                program.append(prefix | rng.randrange(32))
+            else:
+                program.append(prefix | rng.randrange(0x2000 if prefix == 0x3E000 else 0x4000))
+        data_memory = np.array([[rng.randrange(256) for _ in range(256)] for _ in range(8)], dtype=np.uint8)
+        engine = vector.GumnutVectorCore(8, program, data_memory)
+        result = engine.run(200)
+        for lane, core in enumerate(scalar_cores(program, data_memory, engine.IO_controller_register)):
+            expected = core.run(200)
+            assert (result.reason[lane], result.steps[lane]) == (expected.reason, expected.steps)
+            if expected.exception is not None:
+                assert isinstance(expected.exception, vector.LANE_EXCEPTIONS[engine.error[lane]])
+            assert lane_state(engine.get_lane(lane)) == lane_state(core)
@@ -0,0 +1,146 @@
+import pytest
+
+from gumnut_simulator import watchpoints
+from gumnut_simulator.core import GumnutCore, StopReason
+from gumnut_simulator.decoder import OPCODE
+from gumnut_simulator.iobus import CallbackDevice
+from gumnut_simulator.simulator import GumnutSimulator, SimulatorState
+from gumnut_simulator.watchpoints import DATA_MEMORY, IO_CONTROLLER_REGISTER, READ, WRITE
+
+
+# Fills data memory 1 to 100 with 100 down to 1, then copies data memory 50 to IO register 7
+SOURCE = """
+        add r1, r0, 100
+fill:   stm r1, (r1)
+        sub r1, r1, 1
+        bnz fill
+        ldm r2, 50
+        out r2, 7
+        stby
+"""
+
+
+def simulators():
+    for translate in (False, True):
+        simulator = GumnutSimulator()
+        if translate:
+            simulator.CPU.enable_translation()
+        simulator.setup(SOURCE)
+        yield simulator
+
+
+def test_watchpoints_storage():
+    watched = watchpoints.Watchpoints(256, 256)
+    watched.add(DATA_MEMORY, 3, READ)
+    watched.add(DATA_MEMORY, 3, WRITE, 0x12)
+    watched.add(IO_CONTROLLER_REGISTER, 0, READ | WRITE)
+    assert watched.get() == [
+        (DATA_MEMORY, 3, READ, None),
+        (DATA_MEMORY, 3, WRITE, 0x12),
+        (IO_CONTROLLER_REGISTER, 0, READ | WRITE, None),
+    ]
+    assert watched.matches(DATA_MEMORY, 3, READ, 0)
+    assert watched.matches(DATA_MEMORY, 3, WRITE, 0x12)
+    assert not watched.matches(DATA_MEMORY, 3, WRITE, 0x13)
+    assert not watched.matches(DATA_MEMORY, 4, READ, 0)
+
+    watched.remove(DATA_MEMORY, 3)
+    assert len(watched) == 1
+    for arguments in ((DATA_MEMORY, 256), ("registers", 0), (DATA_MEMORY, 0, 4), (DATA_MEMORY, 0, READ, 1)):
+        with pytest.raises(ValueError):
+            watched.add(*arguments)
+
+
+def test_write_watchpoints():
+    for simulator in simulators():
+        simulator.add_watchpoint(DATA_MEMORY, 40)
+        result = simulator.run(10000)
+        assert result.reason == StopReason.watchpoint
+        assert result.steps == 1 + 3 * 60 + 1
+        assert simulator.state == SimulatorState.breakpoint
+        assert simulator.get_current_line() == 3
+        assert simulator.CPU.watchpoint_hit == (DATA_MEMORY, 40, WRITE, 40, 1)
+        assert simulator.get_simulator_data()["watchpoint"]["address"] == 40
+
+        # The run continues after the watched step
+        simulator.remove_watchpoint(DATA_MEMORY, 40)
+        simulator.add_watchpoint(DATA_MEMORY, 10, WRITE, 10)
+        simulator.add_watchpoint(DATA_MEMORY, 20, WRITE, 99)
+        assert simulator.run(10000).reason == StopReason.watchpoint
+        assert simulator.get_register()["r1"] == 10
+        assert simulator.run(10000).reason == StopReason.stby
+        assert simulator.CPU.watchpoint_hit is None
+
+
+def test_read_and_IO_watchpoints():
+    for simulator in simulators():
+        simulator.add_watchpoint(DATA_MEMORY, 50, READ)
+        simulator.add_watchpoint(IO_CONTROLLER_REGISTER, 7, READ | WRITE)
+        assert simulator.run(10000).reason == StopReason.watchpoint
+        assert simulator.CPU.watchpoint_hit == (DATA_MEMORY, 50, READ, 50, 4)
+        assert simulator.run(10000).reason == StopReason.watchpoint
+        assert simulator.CPU.watchpoint_hit == (IO_CONTROLLER_REGISTER, 7, WRITE, 50, 5)
+        assert simulator.get_IO_controller_register()[7] == 50
+        assert simulator.run(10000).reason == StopReason.stby
+
+
+def test_watchpoints_while_stepping_and_journaling():
+    simulator = GumnutSimulator()
+    simulator.setup(SOURCE)
+    simulator.add_watchpoint(DATA_MEMORY, 100)
+    simulator.step()
+    assert simulator.state == SimulatorState.idle
+    simulator.step()
+    assert simulator.state == SimulatorState.breakpoint
+    assert simulator.CPU.watchpoint_hit.PC == 1
+
+    # Watchpoints are kept by setup()
+    simulator.setup(SOURCE)
+    assert simulator.get_watchpoints() == [(DATA_MEMORY, 100, WRITE, None)]
+    simulator.remove_watchpoint(DATA_MEMORY, 100)
+    simulator.enable_journal()
+    simulator.add_watchpoint(DATA_MEMORY, 99)
+    assert simulator.run(10000).reason == StopReason.watchpoint
+    assert simulator.steps == 5
+    assert simulator.step_back(5) == 5
+    assert list(simulator.get_data_memory()[99:101]) == [0, 0]
+
+
+def test_watchpoints_with_devices():
+    simulator = GumnutSimulator()
+    device = CallbackDevice()
+    simulator.CPU.attach_IO_device(device, 7)
+    simulator.setup(SOURCE)
+    simulator.add_watchpoint(IO_CONTROLLER_REGISTER, 7, WRITE, 50)
+    assert simulator.run(10000).reason == StopReason.watchpoint
+    assert list(device.values) == [50]
+
+    # Without watchpoints the memory instructions aren't replaced
+    simulator.CPU.clear_watchpoints()
+    assert simulator.get_watchpoints() == []
+    assert simulator.CPU._dispatch[OPCODE["ldm", None]] is GumnutCore._ldm  # pylint: disable=protected-access
+
+
+def test_IO_watchpoints_in_translated_loops():
+    # Writes 100 down to 1 to IO registers 100 to 1, long enough for the loop to be translated
+    source = """
+        add r1, r0, 100
+loop:   out r1, (r1)
+        sub r1, r1, 1
+        bnz loop
+        stby
+"""
+    simulator = GumnutSimulator()
+    simulator.CPU.enable_translation()
+    simulator.setup(source)
+    simulator.add_watchpoint(IO_CONTROLLER_REGISTER, 20)
+    result = simulator.run(10000)
+    assert result.reason == StopReason.watchpoint
+    assert result.steps == 1 + 3 * 80 + 1
+    assert simulator.CPU.watchpoint_hit == (IO_CONTROLLER_REGISTER, 20, WRITE, 20, 1)
+    assert any(simulator.CPU.translator.blocks.values())
+
+    token = simulator.get_changes()["token"]
+    assert simulator.run(10000).reason == StopReason.stby
+    assert list(simulator.get_IO_controller_register()[1:101]) == list(range(1, 101))
+    assert simulator.get_changes(token)["IO_controller_register"] == [(1, list(range(1, 20)))]